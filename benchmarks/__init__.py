@@ -0,0 +1,9 @@
+"""性能基准测试：使用本地替身（假LLM服务、进程内MongoDB、哈希嵌入）测量对话各阶段延迟"""
+import os
+import sys
+
+# 与run.py一致：项目根目录和src目录加入Python路径
+_project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for _path in (_project_root, os.path.join(_project_root, 'src')):
+    if _path not in sys.path:
+        sys.path.insert(0, _path)
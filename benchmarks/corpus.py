@@ -0,0 +1,37 @@
+from typing import List, Optional
+import random
+
+# 合成中文对话语料：主题、事件和感受随机组合
+TOPICS = [
+    '工作', '学习Python', '周末旅行', '家里的猫', '健身计划', '做饭', '看电影', '读书',
+    '换工作', '考试', '搬家', '朋友聚会', '天气', '睡眠', '理财', '画画', '弹吉他', '养花',
+    '跑步', '咖啡', '游戏', '编程项目', '面试', '出差', '生日', '音乐会', '感冒', '减肥'
+]
+EVENTS = [
+    '今天{topic}的时候遇到了一点麻烦',
+    '最近一直在想{topic}的事情',
+    '昨天和同事聊了很久{topic}',
+    '这周末打算好好安排一下{topic}',
+    '{topic}终于有了一些进展',
+    '关于{topic}我有一个新的想法',
+    '{topic}比我想象的要难很多',
+    '一想到{topic}就觉得压力很大',
+    '上个月开始认真对待{topic}',
+    '{topic}让我学到了不少东西'
+]
+FEELINGS = [
+    '感觉很开心', '有点沮丧', '心情还不错', '觉得很累', '非常期待', '有些担心',
+    '特别兴奋', '挺平静的', '有点生气', '很满足', '有些失落', '充满了好奇'
+]
+QUESTIONS = [
+    '你觉得我应该怎么做？', '你还记得我之前说的吗？', '能给我一些建议吗？',
+    '你怎么看这件事？', '我是不是想太多了？', ''
+]
+
+def synthetic_sentence(rng: random.Random, topic: Optional[str] = None) -> str:
+    """生成一句合成的中文用户发言，未指定主题时随机选择"""
+    topic = topic or rng.choice(TOPICS)
+    return f"{rng.choice(EVENTS).format(topic=topic)}，{rng.choice(FEELINGS)}。{rng.choice(QUESTIONS)}"
+
+def synthetic_sentences(rng: random.Random, count: int) -> List[str]:
+    return [synthetic_sentence(rng) for _ in range(count)]
@@ -0,0 +1,68 @@
+from typing import List, Dict, Union, Optional
+import hashlib
+import threading
+import time
+import numpy as np
+from src.memory.core.memory_encoder import MemoryEncoder
+from src.utils.tracing import get_tracer
+
+class HashingModel:
+    """确定性的假嵌入模型：字符二元组哈希到固定维度后归一化
+
+    相同文本得到相同向量，字面相近的文本向量也相近，可以代替SentenceTransformer做检索基准。
+    latency_ms为每次调用的固定延迟，per_text_ms为每条文本的附加延迟；
+    workers大于0时最多同时执行workers次调用（模拟推理线程数有限的模型），其余调用排队等待；
+    vectors中预先指定了向量的文本（如合成数据的查询）直接返回指定向量。
+    """
+    def __init__(self,
+                 dim: int = 384,
+                 latency_ms: float = 0.0,
+                 per_text_ms: float = 0.0,
+                 vectors: Optional[Dict[str, np.ndarray]] = None,
+                 workers: int = 0):
+        self.dim = dim
+        self.latency = latency_ms / 1000
+        self.per_text = per_text_ms / 1000
+        self.vectors = vectors if vectors is not None else {}
+        self._slots = threading.BoundedSemaphore(workers) if workers > 0 else None
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def encode(self, sentences: Union[str, List[str]], **kwargs) -> np.ndarray:
+        if self._slots is None:
+            return self._encode(sentences)
+        with self._slots:
+            return self._encode(sentences)
+
+    def _encode(self, sentences: Union[str, List[str]]) -> np.ndarray:
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        delay = self.latency + self.per_text * len(texts)
+        if delay > 0:
+            time.sleep(delay)
+
+        embeddings = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            if text in self.vectors:
+                embeddings[row] = self.vectors[text]
+                continue
+            grams = [text[i:i + 2] for i in range(max(1, len(text) - 1))]
+            for gram in grams:
+                digest = hashlib.blake2b(gram.encode('utf-8'), digest_size=8).digest()
+                value = int.from_bytes(digest, 'little')
+                embeddings[row, value % self.dim] += 1.0 if value >> 63 else -1.0
+        embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        return embeddings[0] if single else embeddings
+
+class FakeEncoder(MemoryEncoder):
+    """使用HashingModel的记忆编码器，除嵌入模型外与MemoryEncoder行为一致"""
+    def __init__(self,
+                 dim: int = 384,
+                 latency_ms: float = 0.0,
+                 per_text_ms: float = 0.0,
+                 vectors: Optional[Dict[str, np.ndarray]] = None,
+                 workers: int = 0):
+        self.model = HashingModel(dim, latency_ms, per_text_ms, vectors, workers)
+        self.encoding_dim = dim
+        self.tracer = get_tracer()
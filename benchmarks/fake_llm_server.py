@@ -0,0 +1,340 @@
+from typing import Dict, Any, Optional, Tuple
+import argparse
+import json
+import math
+import os
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 回复内容：按token数截取，中文每个字约一个token
+FILLER_TEXT = "好的主人，我明白了。让我想一想该怎么回答您比较好，这个问题其实挺有意思的。"
+
+class LatencyProfile:
+    """LLM延迟分布：首token延迟服从对数正态分布，生成速度和输出长度带正态抖动"""
+    def __init__(self,
+                 ttft_ms: float = 400.0,
+                 ttft_sigma: float = 0.3,
+                 tokens_per_sec: float = 40.0,
+                 tokens_per_sec_jitter: float = 0.1,
+                 output_tokens: int = 120,
+                 output_tokens_jitter: float = 0.3):
+        self.ttft_ms = ttft_ms
+        self.ttft_sigma = ttft_sigma
+        self.tokens_per_sec = tokens_per_sec
+        self.tokens_per_sec_jitter = tokens_per_sec_jitter
+        self.output_tokens = output_tokens
+        self.output_tokens_jitter = output_tokens_jitter
+
+    def sample(self, rng: random.Random, max_tokens: Optional[int] = None) -> Tuple[float, float, int]:
+        """采样一次请求的(首token延迟秒数, 每秒token数, 输出token数)"""
+        ttft = self.ttft_ms / 1000 * math.exp(rng.gauss(0, self.ttft_sigma)) if self.ttft_ms > 0 else 0.0
+        rate = max(1.0, rng.gauss(self.tokens_per_sec, self.tokens_per_sec * self.tokens_per_sec_jitter))
+        tokens = max(1, int(rng.gauss(self.output_tokens, self.output_tokens * self.output_tokens_jitter)))
+        if max_tokens:
+            tokens = min(tokens, max_tokens)
+        return ttft, rate, tokens
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(vars(self))
+
+class FaultProfile:
+    """故障注入：按比例返回错误状态码，或在首token前额外停顿（模拟长尾请求）"""
+    def __init__(self,
+                 error_rate: float = 0.0,
+                 error_status: int = 503,
+                 error_ms: float = 50.0,
+                 retry_after: Optional[float] = None,
+                 stall_rate: float = 0.0,
+                 stall_ms: float = 5000.0):
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.error_ms = error_ms
+        self.retry_after = retry_after
+        self.stall_rate = stall_rate
+        self.stall_ms = stall_ms
+
+    def sample(self, rng: random.Random) -> Tuple[Optional[int], float]:
+        """采样一次请求的(错误状态码，无错误时为None；额外停顿秒数)"""
+        if self.error_rate > 0 and rng.random() < self.error_rate:
+            return self.error_status, self.error_ms / 1000
+        if self.stall_rate > 0 and rng.random() < self.stall_rate:
+            return None, self.stall_ms / 1000
+        return None, 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(vars(self))
+
+class _Handler(BaseHTTPRequestHandler):
+    server: '_Server'
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        if self.path.rstrip('/').endswith('/models'):
+            self._send_json({'object': 'list', 'data': [{'id': self.server.model, 'object': 'model'}]})
+        else:
+            self._send_json({'error': {'message': 'not found'}}, status=404)
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except json.JSONDecodeError:
+            self._send_json({'error': {'message': 'invalid json'}}, status=400)
+            return
+
+        if self.path.rstrip('/').endswith('/chat/completions'):
+            self._chat(body)
+        elif self.path.rstrip('/').endswith('/embeddings'):
+            self._embeddings(body)
+        else:
+            self._send_json({'error': {'message': 'not found'}}, status=404)
+
+    def _chat(self, body: Dict[str, Any]) -> None:
+        fake = self.server.fake
+        ttft, rate, tokens = fake.sample(body.get('max_tokens'))
+        status, stall = fake.sample_fault()
+        fake.record_request(status)
+        if status is not None:
+            time.sleep(stall)
+            headers = {'Retry-After': str(fake.faults.retry_after)} if fake.faults.retry_after is not None else None
+            self._send_json({'error': {'message': 'injected fault', 'code': status}}, status=status, headers=headers)
+            return
+        ttft += stall
+        prompt_tokens = sum(len(str(message.get('content', ''))) for message in body.get('messages', []))
+        content = (FILLER_TEXT * (tokens // len(FILLER_TEXT) + 1))[:tokens]
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        model = body.get('model', self.server.model)
+
+        if not body.get('stream'):
+            time.sleep(ttft + tokens / rate)
+            self._send_json({
+                'id': completion_id,
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': content},
+                    'finish_reason': 'stop'
+                }],
+                'usage': {
+                    'prompt_tokens': prompt_tokens,
+                    'completion_tokens': tokens,
+                    'total_tokens': prompt_tokens + tokens
+                }
+            })
+            return
+
+        # 流式响应：首token延迟后按生成速度逐token发送SSE事件
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        time.sleep(ttft)
+        interval = 1 / rate
+        try:
+            for index, char in enumerate(content):
+                if index:
+                    time.sleep(interval)
+                self._send_event({
+                    'id': completion_id,
+                    'object': 'chat.completion.chunk',
+                    'created': int(time.time()),
+                    'model': model,
+                    'choices': [{'index': 0, 'delta': {'content': char}, 'finish_reason': None}]
+                })
+            self._send_event({
+                'id': completion_id,
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}],
+                'usage': {
+                    'prompt_tokens': prompt_tokens,
+                    'completion_tokens': tokens,
+                    'total_tokens': prompt_tokens + tokens
+                }
+            })
+            self.wfile.write(b'data: [DONE]\n\n')
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        self.close_connection = True
+
+    def _embeddings(self, body: Dict[str, Any]) -> None:
+        inputs = body.get('input', [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        rng = random.Random(0)
+        self._send_json({
+            'object': 'list',
+            'data': [
+                {'object': 'embedding', 'index': index, 'embedding': [rng.uniform(-1, 1) for _ in range(64)]}
+                for index, _ in enumerate(inputs)
+            ]
+        })
+
+    def _send_event(self, payload: Dict[str, Any]) -> None:
+        self.wfile.write(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode('utf-8'))
+        self.wfile.flush()
+
+    def _send_json(self, payload: Dict[str, Any], status: int = 200, headers: Optional[Dict[str, str]] = None) -> None:
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    fake: 'FakeLLMServer'
+    model: str
+
+class FakeLLMServer:
+    """本地OpenAI兼容接口的假LLM服务：/models、/chat/completions（含流式）、/embeddings
+
+    按LatencyProfile模拟首token延迟和生成速度，用于在没有真实LLM服务时测量端到端延迟；
+    可选的FaultProfile注入错误响应和长尾停顿。
+    """
+    def __init__(self,
+                 profile: Optional[LatencyProfile] = None,
+                 host: str = '127.0.0.1',
+                 port: int = 0,
+                 model: str = 'fake-chat',
+                 seed: Optional[int] = None,
+                 faults: Optional[FaultProfile] = None):
+        self.profile = profile or LatencyProfile()
+        self.faults = faults or FaultProfile()
+        self.model = model
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._errors = 0
+        self._server = _Server((host, port), _Handler)
+        self._server.fake = self
+        self._server.model = model
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        """OpenAI兼容接口的基础地址（含/v1）"""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    @property
+    def requests(self) -> int:
+        with self._lock:
+            return self._requests
+
+    @property
+    def errors(self) -> int:
+        """注入的错误响应数"""
+        with self._lock:
+            return self._errors
+
+    def sample(self, max_tokens: Optional[int] = None) -> Tuple[float, float, int]:
+        with self._lock:
+            return self.profile.sample(self._rng, max_tokens)
+
+    def sample_fault(self) -> Tuple[Optional[int], float]:
+        with self._lock:
+            return self.faults.sample(self._rng)
+
+    def record_request(self, error_status: Optional[int] = None) -> None:
+        with self._lock:
+            self._requests += 1
+            if error_status is not None:
+                self._errors += 1
+
+    def start(self) -> 'FakeLLMServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-llm-server', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self) -> 'FakeLLMServer':
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+def use_fake_siliconflow(url: str, model: str = 'fake-chat') -> None:
+    """设置SiliconFlow的环境变量，使之后创建的客户端请求指定的服务"""
+    os.environ['SILICONFLOW_API_KEY'] = os.getenv('SILICONFLOW_API_KEY', 'benchmark')
+    os.environ['SILICONFLOW_API_BASE'] = url
+    os.environ['SILICONFLOW_MODEL_NAME'] = model
+
+def add_profile_arguments(parser: argparse.ArgumentParser) -> None:
+    """添加延迟分布的命令行参数"""
+    parser.add_argument('--ttft-ms', type=float, default=400.0, help='首token延迟中位数（毫秒）')
+    parser.add_argument('--ttft-sigma', type=float, default=0.3, help='首token延迟的对数正态分布形状参数')
+    parser.add_argument('--tokens-per-sec', type=float, default=40.0, help='平均生成速度（token/秒）')
+    parser.add_argument('--tokens-per-sec-jitter', type=float, default=0.1, help='生成速度的相对标准差')
+    parser.add_argument('--output-tokens', type=int, default=120, help='平均输出token数')
+    parser.add_argument('--output-tokens-jitter', type=float, default=0.3, help='输出token数的相对标准差')
+
+def profile_from_args(args: argparse.Namespace) -> LatencyProfile:
+    return LatencyProfile(
+        ttft_ms=args.ttft_ms,
+        ttft_sigma=args.ttft_sigma,
+        tokens_per_sec=args.tokens_per_sec,
+        tokens_per_sec_jitter=args.tokens_per_sec_jitter,
+        output_tokens=args.output_tokens,
+        output_tokens_jitter=args.output_tokens_jitter
+    )
+
+def add_fault_arguments(parser: argparse.ArgumentParser) -> None:
+    """添加故障注入的命令行参数"""
+    parser.add_argument('--error-rate', type=float, default=0.0, help='返回错误状态码的请求比例')
+    parser.add_argument('--error-status', type=int, default=503, help='注入错误的HTTP状态码')
+    parser.add_argument('--retry-after', type=float, default=None, help='错误响应的Retry-After秒数')
+    parser.add_argument('--stall-rate', type=float, default=0.0, help='首token前额外停顿的请求比例')
+    parser.add_argument('--stall-ms', type=float, default=5000.0, help='额外停顿时长（毫秒）')
+
+def faults_from_args(args: argparse.Namespace) -> FaultProfile:
+    return FaultProfile(
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        retry_after=args.retry_after,
+        stall_rate=args.stall_rate,
+        stall_ms=args.stall_ms
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description='本地假LLM服务（OpenAI兼容接口）')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--model', default='fake-chat')
+    parser.add_argument('--seed', type=int, default=None)
+    add_profile_arguments(parser)
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+
+    server = FakeLLMServer(profile_from_args(args), args.host, args.port, args.model, args.seed,
+                           faults=faults_from_args(args))
+    print(f"假LLM服务已启动: {server.url}（模型 {args.model}），Ctrl+C退出")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,442 @@
+from typing import List, Dict, Any, Optional, Iterator
+import argparse
+import contextlib
+import io
+import json
+import platform
+import queue
+import random
+import threading
+import time
+import uuid
+from datetime import datetime
+from pymongo import monitoring
+
+from benchmarks.corpus import TOPICS, synthetic_sentence
+from benchmarks.fake_encoder import FakeEncoder
+from benchmarks.fake_llm_server import FakeLLMServer, add_profile_arguments, profile_from_args
+from benchmarks.memory_mongo import InMemoryMongoClient
+from benchmarks.stage_timer import StageTimer, percentile, summarize
+from benchmarks.turn_latency import STAGES, build_system, cleanup, git_commit, instrument, seed_memories
+from src.memory.core.memory_encoder import MemoryEncoder
+from src.utils.analysis_cache import get_analysis_cache
+
+# 每个模拟用户偏好的主题数
+USER_TOPICS = 3
+# 队列结束标记
+_STOP = object()
+
+class EncoderGauge:
+    """统计嵌入模型的排队深度：正在执行和等待执行的encode调用数
+
+    包装模型实例的encode方法，由采样线程按固定间隔读取当前深度。
+    """
+    def __init__(self, model: Any, interval: float = 0.01):
+        self.interval = interval
+        self.depth = 0
+        self.samples: List[int] = []
+        self.peak = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        encode = model.encode
+
+        def gauged(*args, **kwargs):
+            with self._lock:
+                self.depth += 1
+                self.peak = max(self.peak, self.depth)
+            try:
+                return encode(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.depth -= 1
+
+        model.encode = gauged
+
+    def start(self) -> 'EncoderGauge':
+        self._thread = threading.Thread(target=self._run, name='encoder-gauge', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.samples = []
+            self.peak = self.depth
+
+    def summary(self) -> Dict[str, float]:
+        with self._lock:
+            samples = list(self.samples)
+            peak = self.peak
+        return {
+            'mean': sum(samples) / len(samples) if samples else 0.0,
+            'p95': percentile(samples, 95),
+            'max': peak
+        }
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                self.samples.append(self.depth)
+
+class MongoOpCounter(monitoring.CommandListener):
+    """真实MongoDB的命令计数（与InMemoryMongoClient.op_counts的键格式一致）"""
+    def __init__(self):
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        collection = event.command.get(event.command_name)
+        key = f"{collection}.{event.command_name}" if isinstance(collection, str) else event.command_name
+        with self._lock:
+            self._counts[key] = self._counts.get(key, 0) + 1
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        pass
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        pass
+
+    def op_counts(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counts)
+
+    def reset_op_counts(self) -> None:
+        with self._lock:
+            self._counts.clear()
+
+def load_replay(path: str) -> List[List[str]]:
+    """读取回放对话：每行一个JSON对象（user_id/user和text/content字段）或一行纯文本
+
+    按用户分组，保持各用户发言的原始顺序；纯文本视为同一段对话。
+    """
+    conversations: Dict[str, List[str]] = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                record = line
+            if isinstance(record, dict):
+                user = str(record.get('user_id', record.get('user', '')))
+                text = record.get('text', record.get('content', ''))
+            else:
+                user, text = '', str(record)
+            if text:
+                conversations.setdefault(user, []).append(text)
+    if not conversations:
+        raise ValueError(f"回放文件中没有对话: {path}")
+    return list(conversations.values())
+
+def scripted_conversation(rng: random.Random) -> Iterator[str]:
+    """模拟用户的发言：围绕几个偏好主题反复展开，偶尔聊到其他话题"""
+    topics = rng.sample(TOPICS, USER_TOPICS)
+    while True:
+        topic = rng.choice(topics) if rng.random() < 0.8 else None
+        yield synthetic_sentence(rng, topic)
+
+def replayed_conversation(lines: List[str]) -> Iterator[str]:
+    """循环回放一段对话"""
+    while True:
+        yield from lines
+
+class SimulatedUser:
+    """一个模拟用户：按到达顺序逐条处理自己的发言（同一用户的轮次不并发）"""
+    def __init__(self,
+                 user_id: str,
+                 conversation: Iterator[str],
+                 processor,
+                 timer: StageTimer,
+                 personality_traits: str,
+                 model_name: str):
+        self.user_id = user_id
+        self.conversation = conversation
+        self.processor = processor
+        self.timer = timer
+        self.personality_traits = personality_traits
+        self.model_name = model_name
+        self.queue: queue.Queue = queue.Queue()
+        # (到达时间, 开始处理时间, 完成时间, 是否计入统计, 是否出错)
+        self.results: List[tuple] = []
+        self._thread = threading.Thread(target=self._run, name=f"user-{user_id}", daemon=True)
+
+    def start(self) -> 'SimulatedUser':
+        self._thread.start()
+        return self
+
+    def send(self, arrival: float, record: bool) -> None:
+        self.queue.put((arrival, next(self.conversation), record))
+
+    def finish(self) -> None:
+        """处理完已到达的发言后退出"""
+        self.queue.put(_STOP)
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def abandon(self) -> int:
+        """丢弃尚未开始处理的发言，返回丢弃数（正在处理的一轮不等待）"""
+        dropped = 0
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP and item[2]:
+                dropped += 1
+        self.queue.put(_STOP)
+        return dropped
+
+    def _run(self) -> None:
+        while True:
+            item = self.queue.get()
+            if item is _STOP:
+                return
+            arrival, text, record = item
+            started = time.perf_counter()
+            failed = False
+            try:
+                with self.timer.turn(record=record):
+                    self.processor.process_dialogue(
+                        user_id=self.user_id,
+                        user_input=text,
+                        personality_traits=self.personality_traits,
+                        model_name=self.model_name
+                    )
+            except Exception:
+                failed = True
+            self.results.append((arrival, started, time.perf_counter(), record, failed))
+
+def dispatch(users: List[SimulatedUser],
+             qps: float,
+             duration: float,
+             warmup: float,
+             arrival: str,
+             rng: random.Random) -> float:
+    """开环发送：按目标QPS生成到达时间，随机分配给用户，不等待上一轮完成
+
+    Poisson到达的间隔服从指数分布；uniform为固定间隔。延迟从计划到达时间算起，
+    系统处理不过来时排队时间计入延迟，避免协调遗漏（coordinated omission）。
+    返回计入统计的窗口起点。
+    """
+    start = time.perf_counter()
+    window_start = start + warmup
+    end = window_start + duration
+    scheduled = start
+    while True:
+        scheduled += rng.expovariate(qps) if arrival == 'poisson' else 1.0 / qps
+        if scheduled >= end:
+            break
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        rng.choice(users).send(scheduled, scheduled >= window_start)
+    return window_start
+
+def run_level(args: argparse.Namespace,
+              users_count: int,
+              qps: float,
+              llm_url: str,
+              conversations: Optional[List[List[str]]],
+              rng: random.Random,
+              run_id: str,
+              shared_mongo=None,
+              op_counter: Optional[MongoOpCounter] = None) -> Dict[str, Any]:
+    """以users_count个并发用户、目标QPS运行一档负载"""
+    mongo_client = shared_mongo if shared_mongo is not None else InMemoryMongoClient(latency_ms=args.mongo_latency_ms)
+    counter = op_counter if op_counter is not None else mongo_client
+    user_ids = [f"load-{run_id}-{users_count}-{index}" for index in range(users_count)]
+    quiet = contextlib.redirect_stdout(io.StringIO()) if not args.verbose else contextlib.nullcontext()
+
+    if args.encoder == 'fake':
+        encoder = FakeEncoder(
+            latency_ms=args.encode_latency_ms,
+            per_text_ms=args.encode_per_text_ms,
+            workers=args.encode_workers
+        )
+    else:
+        encoder = MemoryEncoder()
+    # 各档之间不共享情感分析缓存，避免后一档受益于前一档的缓存
+    get_analysis_cache().invalidate()
+
+    try:
+        with quiet:
+            system = build_system(args, mongo_client, llm_url, encoder)
+            seed_memories(system, user_ids, args.seed_memories, rng)
+
+        timer = StageTimer(STAGES)
+        instrument(timer, system)
+        gauge = EncoderGauge(encoder.model).start()
+        prompt_model = args.prompt_model or system['dialogue_config'].model_name
+        users = []
+        for index, user_id in enumerate(user_ids):
+            if conversations:
+                conversation = replayed_conversation(conversations[index % len(conversations)])
+            else:
+                conversation = scripted_conversation(random.Random(rng.random()))
+            users.append(SimulatedUser(
+                user_id, conversation, system['processor'], timer,
+                system['llm'].personality_traits, prompt_model
+            ).start())
+
+        with quiet:
+            # 预热结束时清零计数，只统计窗口内的操作
+            reset = threading.Timer(args.warmup, lambda: (counter.reset_op_counts(), gauge.reset()))
+            reset.start()
+            window_start = dispatch(users, qps, args.duration, args.warmup, args.arrival, rng)
+            window_end = time.perf_counter()
+            backlog = sum(user.queue.qsize() for user in users)
+            for user in users:
+                user.finish()
+            deadline = window_end + args.drain_timeout
+            abandoned = 0
+            for user in users:
+                if not user.join(max(0.0, deadline - time.perf_counter())):
+                    abandoned += user.abandon()
+            drained = time.perf_counter()
+            reset.cancel()
+        gauge.stop()
+        op_counts = counter.op_counts()
+
+        results = [result for user in users for result in list(user.results) if result[3]]
+        completed = [result for result in results if not result[4]]
+        errors = len(results) - len(completed)
+        offered = len(results) + abandoned
+        busy = max(drained, window_end) - window_start
+        total_ops = sum(op_counts.values())
+        return {
+            'users': users_count,
+            'target_qps': qps,
+            'offered_qps': offered / args.duration,
+            'throughput_qps': len(completed) / busy if busy > 0 else 0.0,
+            'turns': len(completed),
+            'errors': errors,
+            'backlog_at_window_end': backlog,
+            'abandoned': abandoned,
+            'drain_seconds': max(0.0, drained - window_end),
+            # 从计划到达算起的延迟（含排队），以及实际处理耗时
+            'latency': summarize([done - arrival for arrival, _, done, _, _ in completed]),
+            'queue_wait': summarize([started - arrival for arrival, started, _, _, _ in completed]),
+            'stages': timer.summary(),
+            'encoder_queue_depth': gauge.summary(),
+            'mongo_ops_total': total_ops,
+            'mongo_ops_per_turn': total_ops / len(completed) if completed else 0.0,
+            'mongo_ops_per_sec': total_ops / busy if busy > 0 else 0.0,
+            'mongo_ops': dict(sorted(op_counts.items())),
+            'analysis_cache': get_analysis_cache().get_stats()
+        }
+    finally:
+        if shared_mongo is not None:
+            cleanup(shared_mongo, user_ids)
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    rng = random.Random(args.seed)
+    levels = [int(value) for value in args.users.split(',') if value.strip()]
+    conversations = load_replay(args.replay) if args.replay else None
+
+    shared_mongo = None
+    op_counter = None
+    if args.mongo_uri:
+        from pymongo import MongoClient
+        op_counter = MongoOpCounter()
+        shared_mongo = MongoClient(args.mongo_uri, event_listeners=[op_counter])
+
+    server = None
+    llm_url = args.llm_url
+    if not llm_url:
+        server = FakeLLMServer(profile_from_args(args), model=args.model, seed=args.seed).start()
+        llm_url = server.url
+
+    run_id = uuid.uuid4().hex[:8]
+    results = []
+    try:
+        for users_count in levels:
+            qps = args.qps_per_user * users_count if args.qps_per_user else args.qps
+            level = run_level(args, users_count, qps, llm_url, conversations, rng, run_id, shared_mongo, op_counter)
+            results.append(level)
+            print(
+                f"users={users_count} target={qps:.1f}qps throughput={level['throughput_qps']:.1f}qps "
+                f"p50={level['latency']['p50_ms']:.0f}ms p99={level['latency']['p99_ms']:.0f}ms "
+                f"encoder_depth_max={level['encoder_queue_depth']['max']} "
+                f"mongo_ops/turn={level['mongo_ops_per_turn']:.1f} errors={level['errors']} abandoned={level['abandoned']}",
+                flush=True
+            )
+    finally:
+        if server is not None:
+            server.stop()
+        if shared_mongo is not None:
+            shared_mongo.close()
+
+    return {
+        'benchmark': 'load_generator',
+        'commit': git_commit(),
+        'timestamp': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'config': {
+            'users': levels,
+            'qps': args.qps,
+            'qps_per_user': args.qps_per_user,
+            'duration': args.duration,
+            'warmup': args.warmup,
+            'arrival': args.arrival,
+            'conversations': args.replay or 'scripted',
+            'seed_memories': args.seed_memories,
+            'encoder': args.encoder,
+            'encode_workers': args.encode_workers if args.encoder == 'fake' else None,
+            'mongo': 'uri' if args.mongo_uri else 'in-memory',
+            'mongo_latency_ms': args.mongo_latency_ms if not args.mongo_uri else None,
+            'llm': llm_url if args.llm_url else 'fake',
+            'llm_profile': server.profile.to_dict() if server else None,
+            'seed': args.seed
+        },
+        'levels': results
+    }
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='多用户并发负载测试：按目标QPS驱动DialogueProcessor')
+    parser.add_argument('--users', default='1,4,16', help='并发用户数，逗号分隔的多档依次运行')
+    parser.add_argument('--qps', type=float, default=4.0, help='每档的目标总QPS')
+    parser.add_argument('--qps-per-user', type=float, default=None, help='按用户数缩放目标QPS（覆盖--qps）')
+    parser.add_argument('--duration', type=float, default=20.0, help='每档计入统计的时长（秒）')
+    parser.add_argument('--warmup', type=float, default=2.0, help='每档的预热时长（秒，不计入统计）')
+    parser.add_argument('--arrival', choices=['poisson', 'uniform'], default='poisson', help='到达间隔分布')
+    parser.add_argument('--drain-timeout', type=float, default=60.0, help='每档结束后等待积压处理完的最长时间（秒）')
+    parser.add_argument('--replay', default=None,
+                        help='回放对话文件（JSONL，含user_id和text字段；或每行一句），默认使用合成对话')
+    parser.add_argument('--seed-memories', type=int, default=50, help='每个用户预先写入的历史记忆数')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子')
+    parser.add_argument('--encoder', choices=['fake', 'real'], default='fake',
+                        help='fake为确定性哈希嵌入，real为SentenceTransformer')
+    parser.add_argument('--encode-latency-ms', type=float, default=5.0, help='假编码器每次调用的延迟')
+    parser.add_argument('--encode-per-text-ms', type=float, default=0.0, help='假编码器每条文本的附加延迟')
+    parser.add_argument('--encode-workers', type=int, default=1,
+                        help='假编码器可同时执行的调用数（0为不限），模拟单个推理模型')
+    parser.add_argument('--mongo-uri', default=None, help='使用真实MongoDB（默认使用进程内替身）')
+    parser.add_argument('--mongo-latency-ms', type=float, default=0.0, help='进程内替身每次操作的模拟延迟')
+    parser.add_argument('--llm-url', default=None, help='使用已有的OpenAI兼容服务（默认启动本地假服务）')
+    parser.add_argument('--model', default='fake-chat', help='请求的模型名称')
+    parser.add_argument('--prompt-model', default=None, help='提示词模板名称（默认取DialogueConfig.model_name）')
+    parser.add_argument('--output', default=None, help='结果JSON的写入路径')
+    parser.add_argument('--verbose', action='store_true', help='显示被测组件的输出')
+    add_profile_arguments(parser)
+    return parser
+
+def main():
+    args = build_parser().parse_args()
+    report = run(args)
+    output = json.dumps(report, ensure_ascii=False, indent=2, default=str)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,754 @@
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Tuple
+import copy
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import bson
+from bson import ObjectId
+from pymongo import InsertOne, UpdateOne, UpdateMany, DeleteOne, DeleteMany, ReplaceOne
+
+# 字段不存在的标记，区别于值为None
+_MISSING = object()
+
+class InMemoryMongoClient:
+    """进程内的MongoDB替身，只用于基准测试
+
+    实现了本项目用到的集合操作和查询、更新运算符（含管道更新），文档在写入和读取时深拷贝，
+    近似数据库的序列化开销；latency_ms模拟每次操作的网络往返。不支持唯一索引约束和事务。
+    track_bytes为True时按BSON编码长度累计查询返回的字节数（编码本身有开销，测延迟时应关闭）。
+    """
+    def __init__(self, latency_ms: float = 0.0, track_bytes: bool = False):
+        self.latency = latency_ms / 1000
+        self.track_bytes = track_bytes
+        self._databases: Dict[str, 'InMemoryDatabase'] = {}
+        self._lock = threading.RLock()
+        self._op_counts: Counter = Counter()
+        self._bytes_read = 0
+
+    def __getitem__(self, name: str) -> 'InMemoryDatabase':
+        with self._lock:
+            if name not in self._databases:
+                self._databases[name] = InMemoryDatabase(self, name)
+            return self._databases[name]
+
+    def get_database(self, name: str) -> 'InMemoryDatabase':
+        return self[name]
+
+    def server_info(self) -> Dict[str, Any]:
+        return {'version': 'in-memory'}
+
+    def close(self) -> None:
+        pass
+
+    def op_counts(self) -> Dict[str, int]:
+        """各集合操作的调用次数：'集合名.操作' -> 次数"""
+        with self._lock:
+            return dict(self._op_counts)
+
+    def reset_op_counts(self) -> None:
+        with self._lock:
+            self._op_counts.clear()
+
+    def bytes_read(self) -> int:
+        """track_bytes开启期间查询返回文档的BSON字节总数"""
+        with self._lock:
+            return self._bytes_read
+
+    def _count_bytes(self, doc: Dict[str, Any]) -> None:
+        if self.track_bytes:
+            size = len(bson.encode(doc))
+            with self._lock:
+                self._bytes_read += size
+
+    def _record(self, collection: str, operation: str) -> None:
+        with self._lock:
+            self._op_counts[f"{collection}.{operation}"] += 1
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+class InMemoryDatabase:
+    """进程内数据库：按名称惰性创建集合"""
+    def __init__(self, client: InMemoryMongoClient, name: str):
+        self.client = client
+        self.name = name
+        self._collections: Dict[str, 'InMemoryCollection'] = {}
+
+    def __getitem__(self, name: str) -> 'InMemoryCollection':
+        with self.client._lock:
+            if name not in self._collections:
+                self._collections[name] = InMemoryCollection(self, name)
+            return self._collections[name]
+
+    def get_collection(self, name: str) -> 'InMemoryCollection':
+        return self[name]
+
+    def list_collection_names(self) -> List[str]:
+        with self.client._lock:
+            return [name for name, collection in self._collections.items() if collection._docs]
+
+    def drop_collection(self, name: str) -> None:
+        with self.client._lock:
+            self._collections.pop(name, None)
+
+class InMemoryCursor:
+    """查询游标：支持sort、limit、skip的链式调用"""
+    def __init__(self,
+                 docs: List[Dict[str, Any]],
+                 projection: Optional[Dict[str, Any]],
+                 client: Optional[InMemoryMongoClient] = None):
+        self._docs = docs
+        self._projection = projection
+        self._client = client
+
+    def sort(self, key_or_list, direction: int = 1) -> 'InMemoryCursor':
+        self._docs = _sort_docs(self._docs, _sort_spec(key_or_list, direction))
+        return self
+
+    def limit(self, count: int) -> 'InMemoryCursor':
+        if count:
+            self._docs = self._docs[:count]
+        return self
+
+    def skip(self, count: int) -> 'InMemoryCursor':
+        self._docs = self._docs[count:]
+        return self
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for doc in self._docs:
+            projected = _project(doc, self._projection)
+            if self._client is not None:
+                self._client._count_bytes(projected)
+            yield projected
+
+class InMemoryCollection:
+    """进程内集合"""
+    def __init__(self, database: InMemoryDatabase, name: str):
+        self.database = database
+        self.name = name
+        self._docs: Dict[Any, Dict[str, Any]] = {}
+
+    @property
+    def _lock(self) -> threading.RLock:
+        return self.database.client._lock
+
+    def _record(self, operation: str) -> None:
+        self.database.client._record(self.name, operation)
+
+    def create_index(self, keys, **kwargs) -> str:
+        self._record('create_index')
+        if isinstance(keys, str):
+            return f"{keys}_1"
+        return '_'.join(f"{key}_{direction}" for key, direction in keys)
+
+    def drop(self) -> None:
+        self._record('drop')
+        self.database.drop_collection(self.name)
+
+    # 查询
+
+    def find(self,
+             filter: Optional[Dict[str, Any]] = None,
+             projection: Optional[Dict[str, Any]] = None,
+             sort=None,
+             limit: int = 0,
+             skip: int = 0,
+             **kwargs) -> InMemoryCursor:
+        self._record('find')
+        with self._lock:
+            docs = [copy.deepcopy(doc) for doc in self._match_all(filter)]
+        cursor = InMemoryCursor(docs, projection, self.database.client)
+        if sort:
+            cursor.sort(sort)
+        if skip:
+            cursor.skip(skip)
+        if limit:
+            cursor.limit(limit)
+        return cursor
+
+    def find_one(self,
+                 filter: Optional[Dict[str, Any]] = None,
+                 projection: Optional[Dict[str, Any]] = None,
+                 sort=None,
+                 **kwargs) -> Optional[Dict[str, Any]]:
+        self._record('find_one')
+        with self._lock:
+            docs = self._match_all(filter)
+            if sort:
+                docs = _sort_docs(docs, _sort_spec(sort))
+            if not docs:
+                return None
+            doc = _project(copy.deepcopy(docs[0]), projection)
+        self.database.client._count_bytes(doc)
+        return doc
+
+    def count_documents(self, filter: Dict[str, Any], **kwargs) -> int:
+        self._record('count_documents')
+        with self._lock:
+            return len(self._match_all(filter))
+
+    def estimated_document_count(self, **kwargs) -> int:
+        self._record('estimated_document_count')
+        with self._lock:
+            return len(self._docs)
+
+    def distinct(self, key: str, filter: Optional[Dict[str, Any]] = None, **kwargs) -> List[Any]:
+        self._record('distinct')
+        values = []
+        with self._lock:
+            for doc in self._match_all(filter):
+                for value in _lookup(doc, key):
+                    for item in (value if isinstance(value, list) else [value]):
+                        if item not in values:
+                            values.append(copy.deepcopy(item))
+        return values
+
+    # 写入
+
+    def insert_one(self, document: Dict[str, Any], **kwargs) -> SimpleNamespace:
+        self._record('insert_one')
+        with self._lock:
+            return SimpleNamespace(inserted_id=self._insert(document))
+
+    def insert_many(self, documents: Iterable[Dict[str, Any]], ordered: bool = True, **kwargs) -> SimpleNamespace:
+        self._record('insert_many')
+        with self._lock:
+            return SimpleNamespace(inserted_ids=[self._insert(document) for document in documents])
+
+    def update_one(self, filter: Dict[str, Any], update, upsert: bool = False, **kwargs) -> SimpleNamespace:
+        self._record('update_one')
+        with self._lock:
+            return self._update(filter, update, upsert, multi=False)
+
+    def update_many(self, filter: Dict[str, Any], update, upsert: bool = False, **kwargs) -> SimpleNamespace:
+        self._record('update_many')
+        with self._lock:
+            return self._update(filter, update, upsert, multi=True)
+
+    def replace_one(self, filter: Dict[str, Any], replacement: Dict[str, Any], upsert: bool = False, **kwargs) -> SimpleNamespace:
+        self._record('replace_one')
+        with self._lock:
+            return self._replace(filter, replacement, upsert)
+
+    def delete_one(self, filter: Dict[str, Any], **kwargs) -> SimpleNamespace:
+        self._record('delete_one')
+        with self._lock:
+            return SimpleNamespace(deleted_count=self._delete(filter, multi=False))
+
+    def delete_many(self, filter: Dict[str, Any], **kwargs) -> SimpleNamespace:
+        self._record('delete_many')
+        with self._lock:
+            return SimpleNamespace(deleted_count=self._delete(filter, multi=True))
+
+    def find_one_and_update(self,
+                            filter: Dict[str, Any],
+                            update,
+                            projection: Optional[Dict[str, Any]] = None,
+                            return_document: bool = False,
+                            **kwargs) -> Optional[Dict[str, Any]]:
+        """更新第一个匹配的文档，返回更新前（return_document为ReturnDocument.AFTER时为更新后）的文档"""
+        self._record('find_one_and_update')
+        with self._lock:
+            docs = self._match_all(filter)
+            if not docs:
+                return None
+            doc_id = docs[0]['_id']
+            before = copy.deepcopy(docs[0])
+            self._update({'_id': doc_id}, update, False, multi=False)
+            if return_document:
+                before = copy.deepcopy(self._match_all({'_id': doc_id})[0])
+            return _project(before, projection)
+
+    def find_one_and_delete(self,
+                            filter: Dict[str, Any],
+                            projection: Optional[Dict[str, Any]] = None,
+                            **kwargs) -> Optional[Dict[str, Any]]:
+        """删除第一个匹配的文档并返回它"""
+        self._record('find_one_and_delete')
+        with self._lock:
+            docs = self._match_all(filter)
+            if not docs:
+                return None
+            doc = copy.deepcopy(docs[0])
+            self._delete({'_id': doc['_id']}, multi=False)
+            return _project(doc, projection)
+
+    def bulk_write(self, requests: List[Any], ordered: bool = True, **kwargs) -> SimpleNamespace:
+        """批量写入：按顺序执行，不保证原子性（与MongoDB一致）"""
+        self._record('bulk_write')
+        result = SimpleNamespace(inserted_count=0, matched_count=0, modified_count=0,
+                                 deleted_count=0, upserted_count=0)
+        with self._lock:
+            for request in requests:
+                if isinstance(request, InsertOne):
+                    self._insert(request._doc)
+                    result.inserted_count += 1
+                elif isinstance(request, (UpdateOne, UpdateMany)):
+                    update_result = self._update(
+                        request._filter, request._doc, request._upsert,
+                        multi=isinstance(request, UpdateMany)
+                    )
+                    result.matched_count += update_result.matched_count
+                    result.modified_count += update_result.modified_count
+                    result.upserted_count += update_result.upserted_id is not None
+                elif isinstance(request, ReplaceOne):
+                    update_result = self._replace(request._filter, request._doc, request._upsert)
+                    result.matched_count += update_result.matched_count
+                    result.modified_count += update_result.modified_count
+                elif isinstance(request, (DeleteOne, DeleteMany)):
+                    result.deleted_count += self._delete(request._filter, multi=isinstance(request, DeleteMany))
+                else:
+                    raise NotImplementedError(f"不支持的批量操作: {type(request).__name__}")
+        return result
+
+    # 内部实现（调用方持有锁）
+
+    def _match_all(self, filter: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        # 按_id精确匹配时直接查找，相当于数据库的主键索引
+        doc_id = (filter or {}).get('_id', _MISSING)
+        if doc_id is not _MISSING and not isinstance(doc_id, (dict, list)):
+            doc = self._docs.get(doc_id)
+            return [doc] if doc is not None and _matches(doc, filter) else []
+        return [doc for doc in self._docs.values() if _matches(doc, filter or {})]
+
+    def _insert(self, document: Dict[str, Any]) -> Any:
+        # 与pymongo一致：未指定_id时写回调用方的文档
+        if '_id' not in document:
+            document['_id'] = ObjectId()
+        if document['_id'] in self._docs:
+            raise ValueError(f"重复的_id: {document['_id']}")
+        self._docs[document['_id']] = copy.deepcopy(document)
+        return document['_id']
+
+    def _update(self, filter: Dict[str, Any], update, upsert: bool, multi: bool) -> SimpleNamespace:
+        matched = self._match_all(filter)
+        if not multi:
+            matched = matched[:1]
+        for doc in matched:
+            updated = _apply_update(doc, update, is_insert=False)
+            doc.clear()
+            doc.update(updated)
+
+        upserted_id = None
+        if not matched and upsert:
+            doc = _apply_update(_equality_fields(filter), update, is_insert=True)
+            upserted_id = self._insert(doc)
+        return SimpleNamespace(matched_count=len(matched), modified_count=len(matched), upserted_id=upserted_id)
+
+    def _replace(self, filter: Dict[str, Any], replacement: Dict[str, Any], upsert: bool) -> SimpleNamespace:
+        matched = self._match_all(filter)[:1]
+        for doc in matched:
+            doc_id = doc['_id']
+            doc.clear()
+            doc.update(copy.deepcopy(replacement))
+            doc['_id'] = doc_id
+
+        upserted_id = None
+        if not matched and upsert:
+            upserted_id = self._insert({**_equality_fields(filter), **copy.deepcopy(replacement)})
+        return SimpleNamespace(matched_count=len(matched), modified_count=len(matched), upserted_id=upserted_id)
+
+    def _delete(self, filter: Dict[str, Any], multi: bool) -> int:
+        matched = self._match_all(filter)
+        if not multi:
+            matched = matched[:1]
+        for doc in matched:
+            del self._docs[doc['_id']]
+        return len(matched)
+
+# 查询匹配
+
+def _lookup(doc: Any, path: str) -> List[Any]:
+    """按点分路径取值，路径经过数组时展开；字段不存在时返回空列表"""
+    values = [doc]
+    for part in path.split('.'):
+        next_values = []
+        for value in values:
+            if isinstance(value, dict):
+                if part in value:
+                    next_values.append(value[part])
+            elif isinstance(value, list):
+                if part.isdigit() and int(part) < len(value):
+                    next_values.append(value[int(part)])
+                else:
+                    next_values.extend(item[part] for item in value if isinstance(item, dict) and part in item)
+        values = next_values
+    return values
+
+def _compare(left: Any, right: Any, operator: str) -> bool:
+    try:
+        if operator == '$gt':
+            return left > right
+        if operator == '$gte':
+            return left >= right
+        if operator == '$lt':
+            return left < right
+        if operator == '$lte':
+            return left <= right
+    except TypeError:
+        return False
+    raise NotImplementedError(operator)
+
+def _candidates(values: List[Any]) -> List[Any]:
+    """数组字段同时按整个数组和数组元素匹配"""
+    candidates = []
+    for value in values:
+        candidates.append(value)
+        if isinstance(value, list):
+            candidates.extend(value)
+    return candidates
+
+def _matches_condition(values: List[Any], condition: Any) -> bool:
+    if isinstance(condition, dict) and condition and all(key.startswith('$') for key in condition):
+        for operator, operand in condition.items():
+            candidates = _candidates(values)
+            if operator == '$eq':
+                matched = operand in candidates or (operand is None and not values)
+            elif operator == '$ne':
+                matched = not (operand in candidates or (operand is None and not values))
+            elif operator == '$in':
+                matched = any(candidate in operand for candidate in candidates) or (None in operand and not values)
+            elif operator == '$nin':
+                matched = not any(candidate in operand for candidate in candidates)
+            elif operator in ('$gt', '$gte', '$lt', '$lte'):
+                matched = any(_compare(candidate, operand, operator) for candidate in candidates)
+            elif operator == '$exists':
+                matched = bool(values) == bool(operand)
+            elif operator == '$not':
+                matched = not _matches_condition(values, operand)
+            elif operator == '$size':
+                matched = any(isinstance(value, list) and len(value) == operand for value in values)
+            elif operator == '$elemMatch':
+                matched = any(
+                    isinstance(value, list) and any(
+                        _matches(item, operand) if isinstance(item, dict) else _matches_condition([item], operand)
+                        for item in value
+                    )
+                    for value in values
+                )
+            else:
+                raise NotImplementedError(f"不支持的查询运算符: {operator}")
+            if not matched:
+                return False
+        return True
+
+    if condition is None:
+        return not values or None in _candidates(values)
+    return condition in _candidates(values)
+
+def _matches(doc: Dict[str, Any], filter: Dict[str, Any]) -> bool:
+    for key, condition in filter.items():
+        if key == '$and':
+            if not all(_matches(doc, sub) for sub in condition):
+                return False
+        elif key == '$or':
+            if not any(_matches(doc, sub) for sub in condition):
+                return False
+        elif key == '$nor':
+            if any(_matches(doc, sub) for sub in condition):
+                return False
+        elif key == '$expr':
+            if not _evaluate(condition, doc, {}):
+                return False
+        elif not _matches_condition(_lookup(doc, key), condition):
+            return False
+    return True
+
+def _equality_fields(filter: Dict[str, Any]) -> Dict[str, Any]:
+    """upsert时从查询条件中取出等值字段作为新文档的初始内容"""
+    doc: Dict[str, Any] = {}
+    for key, condition in filter.items():
+        if key.startswith('$'):
+            continue
+        if isinstance(condition, dict) and any(k.startswith('$') for k in condition):
+            if '$eq' in condition:
+                _set_path(doc, key, copy.deepcopy(condition['$eq']))
+            continue
+        _set_path(doc, key, copy.deepcopy(condition))
+    return doc
+
+# 投影和排序
+
+def _project(doc: Dict[str, Any], projection: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    if not projection:
+        return doc
+    include_id = projection.get('_id', 1)
+    fields = {key: value for key, value in projection.items() if key != '_id'}
+
+    if fields and any(fields.values()):
+        projected: Dict[str, Any] = {}
+        for key in fields:
+            value = _get_path(doc, key)
+            if value is not _MISSING:
+                _set_path(projected, key, value)
+    else:
+        projected = doc
+        for key in fields:
+            _unset_path(projected, key)
+
+    if include_id and '_id' in doc:
+        projected['_id'] = doc['_id']
+    elif not include_id:
+        projected.pop('_id', None)
+    return projected
+
+def _sort_spec(key_or_list, direction: int = 1) -> List[Tuple[str, int]]:
+    if isinstance(key_or_list, str):
+        return [(key_or_list, direction)]
+    return list(key_or_list)
+
+def _sort_docs(docs: List[Dict[str, Any]], spec: List[Tuple[str, int]]) -> List[Dict[str, Any]]:
+    """多键排序：从最后一个键开始依次稳定排序；缺失字段排在最前（升序时）"""
+    docs = list(docs)
+    for key, direction in reversed(spec):
+        def sort_key(doc, key=key):
+            value = _get_path(doc, key)
+            if value is _MISSING or value is None:
+                return (0, 0)
+            return (1, value)
+        docs.sort(key=sort_key, reverse=direction < 0)
+    return docs
+
+# 路径读写
+
+def _get_path(doc: Dict[str, Any], path: str) -> Any:
+    value: Any = doc
+    for part in path.split('.'):
+        if isinstance(value, dict) and part in value:
+            value = value[part]
+        elif isinstance(value, list) and part.isdigit() and int(part) < len(value):
+            value = value[int(part)]
+        else:
+            return _MISSING
+    return value
+
+def _set_path(doc: Dict[str, Any], path: str, value: Any) -> None:
+    parts = path.split('.')
+    target = doc
+    for part in parts[:-1]:
+        if isinstance(target, list):
+            target = target[int(part)]
+            continue
+        if not isinstance(target.get(part), (dict, list)):
+            target[part] = {}
+        target = target[part]
+    if isinstance(target, list):
+        target[int(parts[-1])] = value
+    else:
+        target[parts[-1]] = value
+
+def _unset_path(doc: Dict[str, Any], path: str) -> None:
+    parts = path.split('.')
+    target = _get_path(doc, '.'.join(parts[:-1])) if len(parts) > 1 else doc
+    if isinstance(target, dict):
+        target.pop(parts[-1], None)
+
+# 更新
+
+def _apply_update(doc: Dict[str, Any], update, is_insert: bool) -> Dict[str, Any]:
+    """返回更新后的新文档，不修改原文档"""
+    doc = copy.deepcopy(doc)
+    if isinstance(update, list):
+        for stage in update:
+            doc = _apply_pipeline_stage(doc, stage)
+        return doc
+
+    now = datetime.now()
+    for operator, fields in update.items():
+        for path, value in fields.items():
+            value = copy.deepcopy(value)
+            current = _get_path(doc, path)
+            if operator == '$set':
+                _set_path(doc, path, value)
+            elif operator == '$setOnInsert':
+                if is_insert:
+                    _set_path(doc, path, value)
+            elif operator == '$unset':
+                _unset_path(doc, path)
+            elif operator == '$inc':
+                _set_path(doc, path, (0 if current is _MISSING else current) + value)
+            elif operator == '$mul':
+                _set_path(doc, path, (0 if current is _MISSING else current) * value)
+            elif operator == '$min':
+                if current is _MISSING or value < current:
+                    _set_path(doc, path, value)
+            elif operator == '$max':
+                if current is _MISSING or value > current:
+                    _set_path(doc, path, value)
+            elif operator == '$currentDate':
+                _set_path(doc, path, now)
+            elif operator in ('$push', '$addToSet'):
+                items = value['$each'] if isinstance(value, dict) and '$each' in value else [value]
+                array = [] if current is _MISSING else current
+                for item in items:
+                    if operator == '$push' or item not in array:
+                        array.append(item)
+                if isinstance(value, dict) and '$slice' in value:
+                    limit = value['$slice']
+                    array = array[limit:] if limit < 0 else array[:limit]
+                _set_path(doc, path, array)
+            elif operator == '$pull':
+                if current is not _MISSING:
+                    if isinstance(value, dict):
+                        kept = [
+                            item for item in current
+                            if not (_matches(item, value) if isinstance(item, dict) else _matches_condition([item], value))
+                        ]
+                    else:
+                        kept = [item for item in current if item != value]
+                    _set_path(doc, path, kept)
+            else:
+                raise NotImplementedError(f"不支持的更新运算符: {operator}")
+    return doc
+
+def _apply_pipeline_stage(doc: Dict[str, Any], stage: Dict[str, Any]) -> Dict[str, Any]:
+    (name, spec), = stage.items()
+    if name in ('$set', '$addFields'):
+        # 同一阶段内的表达式都基于阶段开始时的文档计算
+        values = {path: _evaluate(expr, doc, {}) for path, expr in spec.items()}
+        for path, value in values.items():
+            if value is _MISSING:
+                _unset_path(doc, path)
+            else:
+                _set_path(doc, path, value)
+        return doc
+    if name == '$unset':
+        for path in ([spec] if isinstance(spec, str) else spec):
+            _unset_path(doc, path)
+        return doc
+    if name in ('$replaceRoot', '$replaceWith'):
+        new_root = _evaluate(spec['newRoot'] if name == '$replaceRoot' else spec, doc, {})
+        return {**new_root, '_id': doc['_id']} if '_id' in doc and '_id' not in new_root else new_root
+    raise NotImplementedError(f"不支持的管道更新阶段: {name}")
+
+# 聚合表达式
+
+def _evaluate(expr: Any, doc: Dict[str, Any], variables: Dict[str, Any]) -> Any:
+    if isinstance(expr, str):
+        if expr.startswith('$$'):
+            name, _, path = expr[2:].partition('.')
+            if name == 'NOW':
+                return datetime.now()
+            if name == 'REMOVE':
+                return _MISSING
+            value = variables.get(name, _MISSING) if name != 'ROOT' else doc
+            return _get_path(value, path) if path and isinstance(value, (dict, list)) else value
+        if expr.startswith('$'):
+            return _get_path(doc, expr[1:])
+        return expr
+    if isinstance(expr, list):
+        return [_none(_evaluate(item, doc, variables)) for item in expr]
+    if not isinstance(expr, dict):
+        return expr
+    if len(expr) == 1:
+        (key, operand), = expr.items()
+        if key.startswith('$'):
+            return _evaluate_operator(key, operand, doc, variables)
+    return {key: _evaluate(value, doc, variables) for key, value in expr.items()}
+
+def _none(value: Any) -> Any:
+    return None if value is _MISSING else value
+
+def _evaluate_operator(operator: str, operand: Any, doc: Dict[str, Any], variables: Dict[str, Any]) -> Any:
+    if operator == '$literal':
+        return copy.deepcopy(operand)
+
+    def args() -> List[Any]:
+        operands = operand if isinstance(operand, list) else [operand]
+        return [_none(_evaluate(item, doc, variables)) for item in operands]
+
+    if operator == '$ifNull':
+        values = args()
+        return next((value for value in values[:-1] if value is not None), values[-1])
+    if operator == '$add':
+        values = args()
+        if any(value is None for value in values):
+            return None
+        dates = [value for value in values if isinstance(value, datetime)]
+        total = sum(value for value in values if not isinstance(value, datetime))
+        return dates[0] + timedelta(milliseconds=total) if dates else total
+    if operator == '$subtract':
+        left, right = args()
+        if left is None or right is None:
+            return None
+        if isinstance(left, datetime) and isinstance(right, datetime):
+            return (left - right).total_seconds() * 1000
+        if isinstance(left, datetime):
+            return left - timedelta(milliseconds=right)
+        return left - right
+    if operator == '$multiply':
+        result = 1
+        for value in args():
+            if value is None:
+                return None
+            result *= value
+        return result
+    if operator == '$divide':
+        left, right = args()
+        return None if left is None or right is None else left / right
+    if operator in ('$min', '$max'):
+        values = [value for value in args() if value is not None]
+        if len(values) == 1 and isinstance(values[0], list):
+            values = [value for value in values[0] if value is not None]
+        if not values:
+            return None
+        return min(values) if operator == '$min' else max(values)
+    if operator in ('$eq', '$ne', '$gt', '$gte', '$lt', '$lte'):
+        left, right = args()
+        if operator == '$eq':
+            return left == right
+        if operator == '$ne':
+            return left != right
+        return _compare(left, right, operator)
+    if operator == '$in':
+        value, array = args()
+        return value in (array or [])
+    if operator == '$and':
+        return all(args())
+    if operator == '$or':
+        return any(args())
+    if operator == '$not':
+        return not args()[0]
+    if operator == '$cond':
+        if isinstance(operand, dict):
+            branches = [operand['if'], operand['then'], operand['else']]
+        else:
+            branches = operand
+        condition = _evaluate(branches[0], doc, variables)
+        return _none(_evaluate(branches[1] if condition else branches[2], doc, variables))
+    if operator == '$size':
+        value = args()[0]
+        if not isinstance(value, list):
+            raise ValueError("$size的参数必须是数组")
+        return len(value)
+    if operator in ('$setUnion', '$concatArrays'):
+        result = []
+        for array in args():
+            if array is None:
+                return None
+            for item in array:
+                if operator == '$concatArrays' or item not in result:
+                    result.append(item)
+        return result
+    if operator in ('$filter', '$map'):
+        array = _none(_evaluate(operand['input'], doc, variables))
+        if array is None:
+            return None
+        name = operand.get('as', 'this')
+        body = operand['cond'] if operator == '$filter' else operand['in']
+        result = []
+        for item in array:
+            value = _evaluate(body, doc, {**variables, name: item})
+            if operator == '$filter':
+                if value:
+                    result.append(item)
+            else:
+                result.append(_none(value))
+        return result
+    if operator == '$arrayElemAt':
+        array, index = args()
+        if array is None or not -len(array) <= index < len(array):
+            return _MISSING
+        return array[index]
+    raise NotImplementedError(f"不支持的表达式运算符: {operator}")
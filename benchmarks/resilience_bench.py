@@ -0,0 +1,246 @@
+from typing import List, Dict, Any
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import time
+import sys
+import uuid
+from datetime import datetime
+import requests
+
+from benchmarks.corpus import synthetic_sentence
+from benchmarks.fake_llm_server import (
+    FakeLLMServer, add_fault_arguments, add_profile_arguments, faults_from_args, profile_from_args
+)
+from benchmarks.memory_mongo import InMemoryMongoClient
+from benchmarks.stage_timer import summarize
+from benchmarks.turn_latency import build_system, git_commit, seed_memories
+from src.llm.resilience import CircuitBreaker, CircuitOpenError, ResilientCaller
+
+# 各模式下ResilientCaller读取的环境变量；off即改动前的单次请求
+MODES = {
+    'off': {'LLM_MAX_ATTEMPTS': '1', 'LLM_HEDGE': 'false', 'LLM_CIRCUIT_FAILURES': '0'},
+    'retry': {'LLM_HEDGE': 'false'},
+    'hedge': {'LLM_HEDGE': 'true'}
+}
+
+def mode_environment(mode: str, args: argparse.Namespace) -> Dict[str, str]:
+    env = {
+        'SILICONFLOW_TIMEOUT': str(args.llm_timeout),
+        'LLM_MAX_ATTEMPTS': str(args.max_attempts),
+        'LLM_RETRY_BASE_DELAY_MS': str(args.retry_base_delay_ms),
+        'LLM_HEDGE_QUANTILE': str(args.hedge_quantile),
+        'LLM_HEDGE_MIN_DELAY_MS': str(args.hedge_min_delay_ms),
+        'LLM_CIRCUIT_FAILURES': str(args.circuit_failures)
+    }
+    env.update(MODES[mode])
+    return env
+
+@contextlib.contextmanager
+def patched_environ(values: Dict[str, str]):
+    saved = {name: os.environ.get(name) for name in values}
+    os.environ.update(values)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+def run_mode(mode: str, args: argparse.Namespace) -> Dict[str, Any]:
+    """在相同的故障注入和随机种子下运行一组对话轮次，失败的轮次也计入延迟"""
+    rng = random.Random(args.seed)
+    mongo_client = InMemoryMongoClient(latency_ms=args.mongo_latency_ms)
+    server = FakeLLMServer(profile_from_args(args), model=args.model, seed=args.seed,
+                           faults=faults_from_args(args)).start()
+    user_ids = [f"bench-{uuid.uuid4().hex[:8]}-{index}" for index in range(args.users)]
+    quiet = contextlib.redirect_stdout(io.StringIO()) if not args.verbose else contextlib.nullcontext()
+
+    try:
+        with quiet, patched_environ(mode_environment(mode, args)):
+            system = build_system(args, mongo_client, server.url)
+            seed_memories(system, user_ids, args.seed_memories, rng)
+
+        processor = system['processor']
+        personality_traits = system['llm'].personality_traits
+        prompt_model = args.prompt_model or system['dialogue_config'].model_name
+        latencies: List[float] = []
+        succeeded: List[float] = []
+        errors: Dict[str, int] = {}
+
+        with quiet:
+            for index in range(args.warmup + args.turns):
+                start = time.perf_counter()
+                failed = False
+                try:
+                    processor.process_dialogue(
+                        user_id=user_ids[index % len(user_ids)],
+                        user_input=synthetic_sentence(rng),
+                        personality_traits=personality_traits,
+                        model_name=prompt_model
+                    )
+                except Exception as e:
+                    failed = True
+                    if index >= args.warmup:
+                        reason = str(e).split(':')[0]
+                        errors[reason] = errors.get(reason, 0) + 1
+                elapsed = time.perf_counter() - start
+                if index >= args.warmup:
+                    latencies.append(elapsed)
+                    if not failed:
+                        succeeded.append(elapsed)
+
+        return {
+            'turns': summarize(latencies),
+            'succeeded': summarize(succeeded),
+            'failed_turns': len(latencies) - len(succeeded),
+            'errors': errors,
+            'llm_requests': server.requests,
+            'injected_errors': server.errors,
+            'resilience': system['llm'].resilience.get_stats()
+        }
+    finally:
+        server.stop()
+
+def check_circuit_breaker() -> List[str]:
+    """熔断器状态转换的自检，返回失败项（为空表示通过）
+
+    覆盖半开状态下试探调用以不可重试错误结束的情况：试探名额必须释放，熔断器不能一直拒绝请求；
+    以及关闭状态下不可重试错误不清零连续失败计数。
+    """
+    unavailable = requests.exceptions.HTTPError('503', response=_response(503))
+
+    def fail_with(error: BaseException):
+        def attempt(permit):
+            raise error
+        return attempt
+
+    failures = []
+    cases = [
+        ('不可重试错误', ValueError('bad json'), CircuitBreaker.CLOSED),
+        ('参数错误', requests.exceptions.HTTPError('400', response=_response(400)), CircuitBreaker.CLOSED),
+        ('可重试错误', unavailable, CircuitBreaker.OPEN)
+    ]
+    for name, trial_error, expected_state in cases:
+        caller = ResilientCaller(max_attempts=1, breaker=CircuitBreaker(2, 0.05), name='check')
+        for _ in range(2):
+            with contextlib.suppress(Exception):
+                caller.call(fail_with(unavailable))
+        if caller.breaker.state != CircuitBreaker.OPEN:
+            failures.append(f"{name}: 连续失败后未熔断（{caller.breaker.state}）")
+            continue
+        time.sleep(0.06)
+        with contextlib.suppress(Exception):
+            caller.call(fail_with(trial_error))
+        if caller.breaker.state != expected_state or caller.breaker._trial_running:
+            failures.append(f"{name}: 试探调用后状态为{caller.breaker.state}，期望{expected_state}")
+        if expected_state == CircuitBreaker.CLOSED:
+            try:
+                caller.call(lambda permit: 'ok')
+            except CircuitOpenError:
+                failures.append(f"{name}: 试探调用结束后仍拒绝请求")
+
+    # 关闭状态下穿插的不可重试错误不清零连续失败计数，503和400交替出现时仍会熔断
+    invalid = requests.exceptions.HTTPError('400', response=_response(400))
+    caller = ResilientCaller(max_attempts=1, breaker=CircuitBreaker(3, 0.05), name='check')
+    for error in (unavailable, invalid, unavailable, invalid, unavailable):
+        with contextlib.suppress(Exception):
+            caller.call(fail_with(error))
+    if caller.breaker.state != CircuitBreaker.OPEN:
+        failures.append(f"交替错误: 可重试错误累计达到阈值后未熔断（{caller.breaker.state}）")
+
+    # 被中断的试探调用释放名额，下一次调用可以继续试探
+    caller = ResilientCaller(max_attempts=1, breaker=CircuitBreaker(1, 0.05), name='check')
+    with contextlib.suppress(Exception):
+        caller.call(fail_with(unavailable))
+    time.sleep(0.06)
+    with contextlib.suppress(KeyboardInterrupt):
+        caller.call(fail_with(KeyboardInterrupt()))
+    try:
+        caller.call(lambda permit: 'ok')
+    except CircuitOpenError:
+        failures.append("中断: 试探调用被中断后仍拒绝请求")
+    return failures
+
+def _response(status: int) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status
+    return response
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    modes = [mode.strip() for mode in args.modes.split(',') if mode.strip()]
+    results = {}
+    for mode in modes:
+        results[mode] = run_mode(mode, args)
+    return {
+        'benchmark': 'resilience',
+        'commit': git_commit(),
+        'timestamp': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'config': {
+            'turns': args.turns,
+            'warmup': args.warmup,
+            'users': args.users,
+            'llm_timeout': args.llm_timeout,
+            'max_attempts': args.max_attempts,
+            'hedge_quantile': args.hedge_quantile,
+            'llm_profile': profile_from_args(args).to_dict(),
+            'faults': faults_from_args(args).to_dict(),
+            'seed': args.seed
+        },
+        'modes': results
+    }
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='LLM请求容错（重试、对冲、熔断）对轮次尾延迟的影响')
+    parser.add_argument('--modes', default='off,retry,hedge', help='依次运行的模式：off、retry、hedge，逗号分隔')
+    parser.add_argument('--turns', type=int, default=200, help='每种模式计入统计的轮数')
+    parser.add_argument('--warmup', type=int, default=30, help='预热轮数（不计入统计，同时积累对冲所需的耗时样本）')
+    parser.add_argument('--users', type=int, default=4, help='轮流对话的用户数')
+    parser.add_argument('--seed-memories', type=int, default=50, help='每个用户预先写入的历史记忆数')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子')
+    parser.add_argument('--llm-timeout', type=int, default=10, help='单次LLM请求超时（秒）')
+    parser.add_argument('--max-attempts', type=int, default=3, help='retry/hedge模式的最大尝试次数')
+    parser.add_argument('--retry-base-delay-ms', type=float, default=100.0, help='重试退避的基础间隔')
+    parser.add_argument('--hedge-quantile', type=float, default=0.95, help='对冲延迟取成功请求耗时的分位数')
+    parser.add_argument('--hedge-min-delay-ms', type=float, default=200.0, help='对冲延迟下限')
+    parser.add_argument('--circuit-failures', type=int, default=5, help='连续失败多少次后熔断（0为不熔断）')
+    parser.add_argument('--encoder', choices=['fake', 'real'], default='fake',
+                        help='fake为确定性哈希嵌入，real为SentenceTransformer')
+    parser.add_argument('--encode-latency-ms', type=float, default=0.0, help='假编码器每次调用的延迟')
+    parser.add_argument('--encode-per-text-ms', type=float, default=0.0, help='假编码器每条文本的附加延迟')
+    parser.add_argument('--mongo-latency-ms', type=float, default=0.0, help='进程内替身每次操作的模拟延迟')
+    parser.add_argument('--model', default='fake-chat', help='请求的模型名称')
+    parser.add_argument('--prompt-model', default=None, help='提示词模板名称（默认取DialogueConfig.model_name）')
+    parser.add_argument('--check', action='store_true', help='只运行熔断器状态转换的自检')
+    parser.add_argument('--output', default=None, help='结果JSON的写入路径')
+    parser.add_argument('--verbose', action='store_true', help='显示被测组件的输出')
+    add_profile_arguments(parser)
+    add_fault_arguments(parser)
+    parser.set_defaults(ttft_ms=100.0, output_tokens=40, tokens_per_sec=200.0,
+                        error_rate=0.05, stall_rate=0.03, stall_ms=3000.0)
+    return parser
+
+def main():
+    args = build_parser().parse_args()
+    if args.check:
+        failures = check_circuit_breaker()
+        for failure in failures:
+            print(f"失败 - {failure}")
+        print("熔断器自检通过" if not failures else f"熔断器自检失败：{len(failures)}项")
+        sys.exit(1 if failures else 0)
+    report = run(args)
+    output = json.dumps(report, ensure_ascii=False, indent=2, default=str)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    print(output)
+
+if __name__ == "__main__":
+    main()
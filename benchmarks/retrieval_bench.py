@@ -0,0 +1,372 @@
+from typing import List, Dict, Any, Optional, Callable, Tuple
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import resource
+import shutil
+import tempfile
+import time
+import uuid
+from datetime import datetime
+import numpy as np
+
+from benchmarks.fake_encoder import FakeEncoder
+from benchmarks.memory_mongo import InMemoryMongoClient
+from benchmarks.stage_timer import summarize
+from benchmarks.synthetic_memories import SyntheticMemoryGenerator
+from benchmarks.turn_latency import git_commit
+
+# 计算真值时按块转换为float64，限制临时内存
+EXACT_BLOCK_ROWS = 65536
+
+def rss_mb() -> float:
+    """当前进程的常驻内存（MB）"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError):
+        return peak_rss_mb()
+
+def peak_rss_mb() -> float:
+    """进程启动以来的峰值常驻内存（MB，Linux下ru_maxrss单位为KB）"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+class BytesMeter:
+    """统计MongoDB返回给客户端的字节数
+
+    进程内替身按BSON编码长度计数；真实MongoDB读取serverStatus的network.bytesOut，
+    其中包含同一服务器上其他客户端的流量，应在空闲的测试实例上运行。
+    """
+    def __init__(self, mongo_client):
+        self.mongo_client = mongo_client
+
+    def read(self) -> int:
+        if isinstance(self.mongo_client, InMemoryMongoClient):
+            return self.mongo_client.bytes_read()
+        return int(self.mongo_client['admin'].command('serverStatus')['network']['bytesOut'])
+
+    @contextlib.contextmanager
+    def tracking(self):
+        """期间开启替身的字节统计，结束时result['bytes']为读取的字节数"""
+        result = {'bytes': 0}
+        in_memory = isinstance(self.mongo_client, InMemoryMongoClient)
+        if in_memory:
+            self.mongo_client.track_bytes = True
+        start = self.read()
+        try:
+            yield result
+        finally:
+            result['bytes'] = self.read() - start
+            if in_memory:
+                self.mongo_client.track_bytes = False
+
+class GroundTruth:
+    """用float64逐条计算各策略打分函数的精确前k条"""
+    def __init__(self,
+                 ids: List[Any],
+                 vectors: np.ndarray,
+                 timestamps: np.ndarray,
+                 strengths: np.ndarray):
+        self.ids = ids
+        self.vectors = vectors
+        self.timestamps = timestamps
+        self.strengths = strengths
+
+    def cosine(self, query: np.ndarray) -> np.ndarray:
+        query = np.asarray(query, dtype=np.float64)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        scores = np.empty(len(self.vectors), dtype=np.float64)
+        for start in range(0, len(self.vectors), EXACT_BLOCK_ROWS):
+            block = self.vectors[start:start + EXACT_BLOCK_ROWS].astype(np.float64)
+            block /= np.maximum(np.linalg.norm(block, axis=1, keepdims=True), 1e-12)
+            scores[start:start + len(block)] = block @ query
+        return scores
+
+    def scores(self, kind: str, query: np.ndarray, now: datetime, params: Dict[str, float]) -> np.ndarray:
+        similarity = self.cosine(query)
+        age_seconds = np.maximum(0.0, now.timestamp() - self.timestamps)
+        if kind == 'retriever':
+            # MemoryRetriever：相似度 × 强度 × exp(-衰减率 × 整天数)
+            days = np.floor(age_seconds / 86400)
+            return similarity * self.strengths * np.exp(-0.1 * days)
+        if kind == 'recency':
+            # 对话记忆源的向量索引：相似度与时效性先验加权
+            prior = np.exp(-params['recency_decay_rate'] * age_seconds / 86400)
+            weight = params['similarity_weight']
+            return weight * similarity + (1 - weight) * prior
+        return similarity
+
+    def top_k(self, kind: str, query: np.ndarray, k: int, params: Dict[str, float]) -> List[Any]:
+        scores = self.scores(kind, query, datetime.now(), params)
+        order = np.argsort(-scores, kind='stable')[:k]
+        return [self.ids[index] for index in order]
+
+def recall_at_k(retrieved: List[Any], expected: List[Any]) -> float:
+    if not expected:
+        return 1.0
+    return len(set(retrieved) & set(expected)) / len(expected)
+
+def load_memories(mongo_client,
+                  generator: SyntheticMemoryGenerator,
+                  user_id: str,
+                  count: int,
+                  batch_size: int) -> GroundTruth:
+    """写入合成记忆（memories和conversation_memories两个集合各一份），返回真值数据"""
+    db = mongo_client['chatbot_db']
+    ids: List[Any] = []
+    vectors = np.empty((count, generator.dim), dtype=np.float32)
+    timestamps = np.empty(count, dtype=np.float64)
+    strengths = np.empty(count, dtype=np.float64)
+    row = 0
+    for batch in generator.memories(user_id, count, batch_size):
+        db['memories'].insert_many(batch)
+        db['conversation_memories'].insert_many(batch)
+        for doc in batch:
+            ids.append(doc['_id'])
+            vectors[row] = doc['embedding']
+            timestamps[row] = doc['timestamp'].timestamp()
+            strengths[row] = doc['strength']
+            row += 1
+    return GroundTruth(ids, vectors, timestamps, strengths)
+
+def measure_strategy(search: Callable[[str, np.ndarray], List[Any]],
+                     queries: List[Tuple[str, np.ndarray]],
+                     truth: GroundTruth,
+                     kind: str,
+                     k: int,
+                     params: Dict[str, float],
+                     meter: BytesMeter,
+                     bytes_queries: int,
+                     before_each: Optional[Callable[[], None]] = None) -> Dict[str, Any]:
+    """计时执行全部查询并计算recall@k，之后用少量查询单独统计读取字节数（统计本身有开销）"""
+    rss_before = rss_mb()
+    latencies: List[float] = []
+    recalls: List[float] = []
+    for text, embedding in queries:
+        if before_each:
+            before_each()
+        start = time.perf_counter()
+        retrieved = search(text, embedding)
+        latencies.append(time.perf_counter() - start)
+        recalls.append(recall_at_k(retrieved, truth.top_k(kind, embedding, k, params)))
+
+    sample = queries[:max(1, bytes_queries)]
+    with meter.tracking() as tracked:
+        for text, embedding in sample:
+            if before_each:
+                before_each()
+            search(text, embedding)
+
+    return {
+        'latency': summarize(latencies),
+        'recall_at_k': float(np.mean(recalls)) if recalls else 0.0,
+        'recall_min': float(np.min(recalls)) if recalls else 0.0,
+        'bytes_read_per_query': tracked['bytes'] / len(sample),
+        'rss_mb': rss_mb(),
+        'rss_delta_mb': rss_mb() - rss_before,
+        'peak_rss_mb': peak_rss_mb()
+    }
+
+def build_components(mongo_client, encoder: FakeEncoder) -> Dict[str, Any]:
+    """组装被测组件（与main.py一致的构造方式），编码器使用预置查询向量的假编码器"""
+    # 检索和整合不调用LLM，只需满足SiliconFlow初始化时的密钥检查
+    os.environ.setdefault('SILICONFLOW_API_KEY', 'benchmark')
+
+    from src.memory.core.memory_manager import MemoryManager
+    from src.memory.core.multi_source_manager import MultiSourceMemoryManager
+    from src.memory.sources.conversation_source import ConversationMemorySource
+    from config.memory_config import MemoryConfig
+
+    memory_manager = MemoryManager(MemoryConfig(), mongo_client, encoder)
+    conversation_source = ConversationMemorySource(mongo_client, encoder)
+    multi_source = MultiSourceMemoryManager(encoder)
+    multi_source.register_source(conversation_source)
+    return {
+        'memory_manager': memory_manager,
+        'conversation_source': conversation_source,
+        'multi_source': multi_source
+    }
+
+def run_consolidation(components: Dict[str, Any],
+                      mongo_client,
+                      meter: BytesMeter,
+                      user_id: str) -> Dict[str, Any]:
+    """整合记忆（会合并和删除记忆，在所有检索策略之后运行）"""
+    db = mongo_client['chatbot_db']
+    results = {}
+    for name, collection, consolidate in (
+        ('memory_manager', 'memories', components['memory_manager'].consolidate_memories),
+        ('multi_source', 'conversation_memories', components['multi_source'].consolidate_memories)
+    ):
+        before = db[collection].count_documents({'user_id': user_id})
+        rss_before = rss_mb()
+        with meter.tracking() as tracked:
+            start = time.perf_counter()
+            consolidate(user_id)
+            elapsed = time.perf_counter() - start
+        results[name] = {
+            'seconds': elapsed,
+            'memories_before': before,
+            'memories_after': db[collection].count_documents({'user_id': user_id}),
+            'bytes_read': tracked['bytes'],
+            'rss_delta_mb': rss_mb() - rss_before,
+            'peak_rss_mb': peak_rss_mb()
+        }
+    return results
+
+def run_scale(args: argparse.Namespace, count: int, seed: int) -> Dict[str, Any]:
+    from src.memory.core.knowledge_shard import build_knowledge_shard, KnowledgeShard
+    from config.memory_config import MEMORY_PARAMS
+
+    if args.mongo_uri:
+        from pymongo import MongoClient
+        mongo_client = MongoClient(args.mongo_uri)
+    else:
+        mongo_client = InMemoryMongoClient()
+    meter = BytesMeter(mongo_client)
+    generator = SyntheticMemoryGenerator(dim=args.dim, seed=seed, noise=args.noise)
+    queries = generator.queries(args.queries)
+    encoder = FakeEncoder(dim=args.dim, vectors={text: embedding for text, embedding in queries})
+    user_id = f"bench-{uuid.uuid4().hex[:8]}"
+    params = {
+        'similarity_weight': MEMORY_PARAMS['retrieval']['similarity_weight'],
+        'recency_decay_rate': MEMORY_PARAMS['retrieval']['recency_decay_rate']
+    }
+    shard_dir = tempfile.mkdtemp(prefix='retrieval-bench-')
+    rss_start = rss_mb()
+
+    try:
+        start = time.perf_counter()
+        truth = load_memories(mongo_client, generator, user_id, count, args.batch_size)
+        load_seconds = time.perf_counter() - start
+        components = build_components(mongo_client, encoder)
+        collection = mongo_client['chatbot_db']['conversation_memories']
+        conversation_source = components['conversation_source']
+        multi_source = components['multi_source']
+        retriever = components['memory_manager'].retriever
+
+        def retriever_search(text: str, embedding: np.ndarray) -> List[Any]:
+            memories = retriever.retrieve_memories(
+                query=text, query_embedding=embedding, user_id=user_id, top_k=args.k
+            )
+            return [memory['_id'] for memory in memories]
+
+        def multi_source_search(text: str, embedding: np.ndarray) -> List[Any]:
+            memories = multi_source.get_memories(query=text, user_id=user_id, limit=args.k)
+            return [memory.metadata['id'] for memory in memories]
+
+        strategies: Dict[str, Any] = {}
+        strategies['retriever_bruteforce'] = measure_strategy(
+            retriever_search, queries, truth, 'retriever', args.k, params, meter, args.bytes_queries
+        )
+        strategies['multi_source_cold'] = measure_strategy(
+            multi_source_search, queries, truth, 'recency', args.k, params, meter, args.bytes_queries,
+            before_each=lambda: conversation_source.index.invalidate(user_id)
+        )
+        # 热缓存：先加载一次用户向量，不计入统计
+        multi_source_search(*queries[0])
+        strategies['multi_source_warm'] = measure_strategy(
+            multi_source_search, queries, truth, 'recency', args.k, params, meter, args.bytes_queries
+        )
+        conversation_source.index.invalidate()
+        gc.collect()
+
+        for dtype in ('float16', 'int8'):
+            path = os.path.join(shard_dir, f"conversation_{dtype}.shard")
+            with meter.tracking() as tracked:
+                start = time.perf_counter()
+                build_knowledge_shard(collection, path, user_id=user_id, dtype=dtype, batch_size=args.batch_size)
+                build_seconds = time.perf_counter() - start
+            shard = KnowledgeShard(path)
+
+            def shard_search(text: str, embedding: np.ndarray, shard=shard) -> List[Any]:
+                ids = [memory_id for memory_id, _, _ in shard.search(embedding, args.k)]
+                # 与知识库检索一致：按分片结果取回文档（不含嵌入）
+                list(collection.find({'_id': {'$in': ids}}, {'embedding': 0}))
+                return ids
+
+            result = measure_strategy(
+                shard_search, queries, truth, 'cosine', args.k, params, meter, args.bytes_queries
+            )
+            result['build_seconds'] = build_seconds
+            result['build_bytes_read'] = tracked['bytes']
+            result['shard_bytes'] = os.path.getsize(path)
+            strategies[f"shard_{dtype}"] = result
+
+        report = {
+            'memories': count,
+            'load_seconds': load_seconds,
+            'rss_after_load_mb': rss_mb(),
+            'rss_load_delta_mb': rss_mb() - rss_start,
+            'strategies': strategies
+        }
+        if not args.skip_consolidation:
+            report['consolidation'] = run_consolidation(components, mongo_client, meter, user_id)
+        return report
+    finally:
+        shutil.rmtree(shard_dir, ignore_errors=True)
+        if args.mongo_uri:
+            db = mongo_client['chatbot_db']
+            for name in ('memories', 'conversation_memories'):
+                db[name].delete_many({'user_id': user_id})
+            mongo_client.close()
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    scales = [int(scale) for scale in args.scales.split(',') if scale.strip()]
+    # 被测组件会打印日志，测量期间屏蔽输出
+    quiet = contextlib.redirect_stdout(io.StringIO()) if not args.verbose else contextlib.nullcontext()
+    results = []
+    for index, count in enumerate(scales):
+        with quiet:
+            results.append(run_scale(args, count, args.seed + index))
+        gc.collect()
+
+    return {
+        'benchmark': 'retrieval',
+        'commit': git_commit(),
+        'timestamp': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'config': {
+            'scales': scales,
+            'queries': args.queries,
+            'k': args.k,
+            'dim': args.dim,
+            'noise': args.noise,
+            'mongo': 'uri' if args.mongo_uri else 'in-memory',
+            'seed': args.seed
+        },
+        'scales': results
+    }
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='记忆检索微基准：不同规模下各检索策略的延迟、内存、读取量和召回率')
+    parser.add_argument('--scales', default='1000,10000',
+                        help='逗号分隔的单用户记忆数；100000以上建议配合--mongo-uri并预留足够内存')
+    parser.add_argument('--queries', type=int, default=20, help='每个规模的查询数')
+    parser.add_argument('--k', type=int, default=5, help='每次检索返回的记忆数（recall@k）')
+    parser.add_argument('--dim', type=int, default=384, help='嵌入维度（与all-MiniLM-L6-v2一致）')
+    parser.add_argument('--noise', type=float, default=1.0, help='记忆嵌入相对主题中心的噪声强度')
+    parser.add_argument('--batch-size', type=int, default=5000, help='写入和构建分片的批大小')
+    parser.add_argument('--bytes-queries', type=int, default=3, help='单独统计读取字节数的查询数')
+    parser.add_argument('--mongo-uri', default=None, help='使用真实MongoDB（默认使用进程内替身）')
+    parser.add_argument('--skip-consolidation', action='store_true', help='跳过记忆整合的测量')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子')
+    parser.add_argument('--output', default=None, help='结果JSON的写入路径')
+    parser.add_argument('--verbose', action='store_true', help='显示被测组件的输出')
+    return parser
+
+def main():
+    args = build_parser().parse_args()
+    report = run(args)
+    output = json.dumps(report, ensure_ascii=False, indent=2, default=str)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+from typing import List, Dict, Any, Optional, Iterable
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+def percentile(values: List[float], q: float) -> float:
+    """线性插值的百分位数，q取0-100"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    """一组耗时（秒）的统计，结果以毫秒表示"""
+    return {
+        'count': len(values),
+        'mean_ms': sum(values) / len(values) * 1000 if values else 0.0,
+        'p50_ms': percentile(values, 50) * 1000,
+        'p95_ms': percentile(values, 95) * 1000,
+        'p99_ms': percentile(values, 99) * 1000,
+        'max_ms': max(values) * 1000 if values else 0.0
+    }
+
+class StageTimer:
+    """按阶段统计每轮对话的耗时
+
+    阶段可以嵌套，每个阶段只计自身耗时（扣除嵌套在内的其他阶段），
+    因此各阶段耗时之和不超过整轮耗时，剩余部分记为other。
+    """
+    def __init__(self, stages: Iterable[str]):
+        self.stages = list(stages)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._turns: List[Dict[str, float]] = []
+
+    @contextmanager
+    def stage(self, name: str):
+        stack = self._stack()
+        frame = [name, time.perf_counter(), 0.0]
+        stack.append(frame)
+        try:
+            yield
+        finally:
+            stack.pop()
+            elapsed = time.perf_counter() - frame[1]
+            turn = getattr(self._local, 'turn', None)
+            if turn is not None:
+                turn[name] = turn.get(name, 0.0) + elapsed - frame[2]
+            if stack:
+                stack[-1][2] += elapsed
+
+    def wrap(self, obj: Any, method_name: str, stage: str) -> None:
+        """把对象的方法替换为计时版本（只影响该实例）"""
+        method = getattr(obj, method_name)
+
+        @functools.wraps(method)
+        def timed(*args, **kwargs):
+            with self.stage(stage):
+                return method(*args, **kwargs)
+
+        setattr(obj, method_name, timed)
+
+    @contextmanager
+    def turn(self, record: bool = True):
+        """统计一轮对话，record为False时（如预热）不计入结果"""
+        self._local.turn = {}
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            total = time.perf_counter() - start
+            turn, self._local.turn = self._local.turn, None
+            if record:
+                turn['total'] = total
+                turn['other'] = max(0.0, total - sum(turn.get(stage, 0.0) for stage in self.stages))
+                with self._lock:
+                    self._turns.append(turn)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """各阶段（以及total、other）每轮耗时的百分位统计"""
+        with self._lock:
+            turns = list(self._turns)
+        return {
+            stage: summarize([turn.get(stage, 0.0) for turn in turns])
+            for stage in self.stages + ['other', 'total']
+        }
+
+    def _stack(self) -> List[List[Any]]:
+        stack: Optional[List[List[Any]]] = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
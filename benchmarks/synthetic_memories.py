@@ -0,0 +1,93 @@
+from typing import List, Dict, Any, Optional, Iterator, Tuple
+import random
+from datetime import datetime, timedelta
+import numpy as np
+
+from benchmarks.corpus import TOPICS, synthetic_sentence
+
+# 记忆类型分布，与MemoryEncoder的类型一致
+MEMORY_TYPE_WEIGHTS = {
+    'semantic': 0.6,
+    'episodic': 0.3,
+    'explicit': 0.07,
+    'procedural': 0.03
+}
+
+class SyntheticMemoryGenerator:
+    """合成的中文对话记忆：文本、嵌入、时间和强度
+
+    每个主题有一个随机的中心向量，记忆嵌入为所属主题中心加高斯噪声后归一化，
+    同主题记忆的期望余弦相似度约为1 / (1 + noise²)；查询按同样方式生成，
+    因此检索结果的真值只取决于生成的向量，与嵌入模型无关。
+    记忆时间按指数分布偏向近期（均值mean_age_days天，最多max_age_days天），强度服从Beta分布。
+    """
+    def __init__(self,
+                 dim: int = 384,
+                 seed: int = 42,
+                 noise: float = 1.0,
+                 mean_age_days: float = 30.0,
+                 max_age_days: float = 365.0):
+        self.dim = dim
+        self.noise = noise
+        self.mean_age_days = mean_age_days
+        self.max_age_days = max_age_days
+        self.rng = np.random.default_rng(seed)
+        self.text_rng = random.Random(seed)
+        centroids = self.rng.standard_normal((len(TOPICS), dim))
+        self.centroids = centroids / np.linalg.norm(centroids, axis=1, keepdims=True)
+
+    def embeddings(self, topics: np.ndarray) -> np.ndarray:
+        """按主题下标生成归一化嵌入（float32）"""
+        noise = self.rng.standard_normal((len(topics), self.dim)) * (self.noise / np.sqrt(self.dim))
+        vectors = self.centroids[topics] + noise
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors.astype(np.float32)
+
+    def memories(self,
+                 user_id: str,
+                 count: int,
+                 batch_size: int = 5000,
+                 now: Optional[datetime] = None) -> Iterator[List[Dict[str, Any]]]:
+        """分批生成记忆文档，字段与对话记忆源写入的文档一致"""
+        now = now or datetime.now()
+        types = list(MEMORY_TYPE_WEIGHTS)
+        weights = np.array(list(MEMORY_TYPE_WEIGHTS.values()))
+        for start in range(0, count, batch_size):
+            size = min(batch_size, count - start)
+            topics = self.rng.integers(0, len(TOPICS), size)
+            embeddings = self.embeddings(topics)
+            ages = np.minimum(self.rng.exponential(self.mean_age_days, size), self.max_age_days)
+            strengths = self.rng.beta(2.0, 3.0, size)
+            relevance = self.rng.beta(2.0, 2.0, size)
+            memory_types = self.rng.choice(len(types), size, p=weights / weights.sum())
+
+            batch = []
+            for row in range(size):
+                topic = TOPICS[topics[row]]
+                batch.append({
+                    'user_id': user_id,
+                    'content': synthetic_sentence(self.text_rng, topic),
+                    'embedding': embeddings[row].tolist(),
+                    'strength': float(strengths[row]),
+                    'memory_type': types[memory_types[row]],
+                    'key_points': [],
+                    'metadata': {'type': 'user_input', 'topic': topic, 'synthetic': True},
+                    'relevance_score': float(relevance[row]),
+                    'importance_score': float(strengths[row]),
+                    'timestamp': now - timedelta(days=float(ages[row]))
+                })
+            yield batch
+
+    def queries(self, count: int) -> List[Tuple[str, np.ndarray]]:
+        """生成(查询文本, 查询嵌入)，文本互不相同"""
+        topics = self.rng.integers(0, len(TOPICS), count)
+        embeddings = self.embeddings(topics)
+        queries: List[Tuple[str, np.ndarray]] = []
+        seen = set()
+        for row in range(count):
+            text = synthetic_sentence(self.text_rng, TOPICS[topics[row]])
+            while text in seen:
+                text = synthetic_sentence(self.text_rng, TOPICS[topics[row]])
+            seen.add(text)
+            queries.append((text, embeddings[row]))
+        return queries
@@ -0,0 +1,227 @@
+from typing import List, Dict, Any, Optional
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime
+
+from benchmarks.corpus import synthetic_sentence
+from benchmarks.fake_encoder import FakeEncoder
+from benchmarks.fake_llm_server import FakeLLMServer, add_profile_arguments, profile_from_args, use_fake_siliconflow
+from benchmarks.memory_mongo import InMemoryMongoClient
+from benchmarks.stage_timer import StageTimer
+from src.memory.core.memory_encoder import MemoryEncoder
+
+# 每轮对话的阶段：查询和记忆编码、记忆检索、情感分析和状态更新、提示词构建、LLM调用、记忆写入
+STAGES = ['encode', 'retrieve', 'emotion', 'prompt', 'llm', 'persist']
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            stderr=subprocess.DEVNULL,
+            text=True
+        ).strip()
+    except Exception:
+        return None
+
+def build_system(args: argparse.Namespace,
+                 mongo_client,
+                 llm_url: str,
+                 encoder: Optional[MemoryEncoder] = None) -> Dict[str, Any]:
+    """按run.py/main.py的方式组装对话系统，LLM指向本地假服务；encoder为空时按args创建"""
+    # SiliconFlow在初始化时读取环境变量
+    use_fake_siliconflow(llm_url, args.model)
+
+    from src.llm.siliconflow import SiliconFlow
+    from src.memory.core.multi_source_manager import MultiSourceMemoryManager
+    from src.memory.sources.conversation_source import ConversationMemorySource
+    from src.memory.sources.knowledge_source import KnowledgeMemorySource
+    from src.emotion import EmotionManager, EmotionAnalyzer
+    from src.dialogue.core.dialogue_processor import DialogueProcessor
+    from src.config.emotion_config import EmotionConfig
+    from src.config.dialogue_config import DialogueConfig
+
+    if encoder is None:
+        if args.encoder == 'fake':
+            encoder = FakeEncoder(latency_ms=args.encode_latency_ms, per_text_ms=args.encode_per_text_ms)
+        else:
+            encoder = MemoryEncoder()
+
+    memory_manager = MultiSourceMemoryManager(encoder)
+    conversation_source = ConversationMemorySource(mongo_client, encoder)
+    memory_manager.register_source(conversation_source)
+    memory_manager.register_source(KnowledgeMemorySource(mongo_client, encoder))
+
+    llm = SiliconFlow()
+    emotion_manager = EmotionManager(EmotionConfig(), mongo_client)
+    emotion_analyzer = EmotionAnalyzer(llm=llm)
+    processor = DialogueProcessor(
+        memory_manager=memory_manager,
+        emotion_manager=emotion_manager,
+        emotion_analyzer=emotion_analyzer,
+        llm=llm
+    )
+    return {
+        'dialogue_config': DialogueConfig(),
+        'encoder': encoder,
+        'memory_manager': memory_manager,
+        'conversation_source': conversation_source,
+        'emotion_manager': emotion_manager,
+        'emotion_analyzer': emotion_analyzer,
+        'llm': llm,
+        'processor': processor
+    }
+
+def instrument(timer: StageTimer, system: Dict[str, Any]) -> None:
+    """在各组件实例上挂载阶段计时"""
+    processor = system['processor']
+    timer.wrap(system['encoder'].model, 'encode', 'encode')
+    timer.wrap(system['memory_manager'], 'get_memories', 'retrieve')
+    timer.wrap(system['emotion_analyzer'], 'analyze_emotion', 'emotion')
+    timer.wrap(system['emotion_manager'], 'update_emotion_state', 'emotion')
+    timer.wrap(system['emotion_manager'], 'get_emotion', 'emotion')
+    timer.wrap(processor.prompt_manager, 'get_prompt', 'prompt')
+    timer.wrap(processor, '_build_memory_context', 'prompt')
+    timer.wrap(system['llm'], 'chat', 'llm')
+    timer.wrap(processor, '_store_dialogue_memory', 'persist')
+
+def seed_memories(system: Dict[str, Any], user_ids: List[str], count: int, rng: random.Random) -> None:
+    """为每个用户预先写入历史对话记忆"""
+    source = system['conversation_source']
+    for user_id in user_ids:
+        for _ in range(count):
+            source.add_memory(
+                content=synthetic_sentence(rng),
+                user_id=user_id,
+                metadata={'type': 'user_input', 'seeded': True}
+            )
+
+def cleanup(mongo_client, user_ids: List[str]) -> None:
+    """删除真实MongoDB中本次基准测试写入的数据"""
+    db = mongo_client['chatbot_db']
+    for name in ('conversation_memories', 'knowledge_base', 'emotion_states', 'user_behavior_stats', 'user_behaviors'):
+        db[name].delete_many({'user_id': {'$in': user_ids}})
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    rng = random.Random(args.seed)
+
+    if args.mongo_uri:
+        from pymongo import MongoClient
+        mongo_client = MongoClient(args.mongo_uri)
+    else:
+        mongo_client = InMemoryMongoClient(latency_ms=args.mongo_latency_ms)
+
+    server = None
+    llm_url = args.llm_url
+    if not llm_url:
+        server = FakeLLMServer(profile_from_args(args), model=args.model, seed=args.seed).start()
+        llm_url = server.url
+
+    run_id = uuid.uuid4().hex[:8]
+    user_ids = [f"bench-{run_id}-{index}" for index in range(args.users)]
+    # SiliconFlow会打印每次请求，测量期间屏蔽输出
+    quiet = contextlib.redirect_stdout(io.StringIO()) if not args.verbose else contextlib.nullcontext()
+
+    try:
+        with quiet:
+            system = build_system(args, mongo_client, llm_url)
+            seed_memories(system, user_ids, args.seed_memories, rng)
+
+        timer = StageTimer(STAGES)
+        instrument(timer, system)
+        processor = system['processor']
+        personality_traits = system['llm'].personality_traits
+        prompt_model = args.prompt_model or system['dialogue_config'].model_name
+        if isinstance(mongo_client, InMemoryMongoClient):
+            mongo_client.reset_op_counts()
+
+        started = None
+        with quiet:
+            for index in range(args.warmup + args.turns):
+                if index == args.warmup:
+                    started = time.perf_counter()
+                    if isinstance(mongo_client, InMemoryMongoClient):
+                        mongo_client.reset_op_counts()
+                with timer.turn(record=index >= args.warmup):
+                    processor.process_dialogue(
+                        user_id=user_ids[index % len(user_ids)],
+                        user_input=synthetic_sentence(rng),
+                        personality_traits=personality_traits,
+                        model_name=prompt_model
+                    )
+        elapsed = time.perf_counter() - started if started is not None else 0.0
+
+        report = {
+            'benchmark': 'turn_latency',
+            'commit': git_commit(),
+            'timestamp': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'config': {
+                'turns': args.turns,
+                'warmup': args.warmup,
+                'users': args.users,
+                'seed_memories': args.seed_memories,
+                'encoder': args.encoder,
+                'mongo': 'uri' if args.mongo_uri else 'in-memory',
+                'mongo_latency_ms': args.mongo_latency_ms if not args.mongo_uri else None,
+                'llm': llm_url if args.llm_url else 'fake',
+                'llm_profile': server.profile.to_dict() if server else None,
+                'seed': args.seed
+            },
+            'turns_per_sec': args.turns / elapsed if elapsed > 0 else 0.0,
+            'stages': timer.summary(),
+            'emotion_tiers': system['emotion_analyzer'].get_tier_stats()
+        }
+        if isinstance(mongo_client, InMemoryMongoClient) and args.turns:
+            report['mongo_ops_per_turn'] = {
+                operation: count / args.turns
+                for operation, count in sorted(mongo_client.op_counts().items())
+            }
+        return report
+    finally:
+        if server is not None:
+            server.stop()
+        if args.mongo_uri:
+            cleanup(mongo_client, user_ids)
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='端到端对话轮次延迟基准测试')
+    parser.add_argument('--turns', type=int, default=200, help='计入统计的轮数')
+    parser.add_argument('--warmup', type=int, default=10, help='预热轮数（不计入统计）')
+    parser.add_argument('--users', type=int, default=4, help='轮流对话的用户数')
+    parser.add_argument('--seed-memories', type=int, default=200, help='每个用户预先写入的历史记忆数')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子')
+    parser.add_argument('--encoder', choices=['fake', 'real'], default='fake',
+                        help='fake为确定性哈希嵌入，real为SentenceTransformer')
+    parser.add_argument('--encode-latency-ms', type=float, default=0.0, help='假编码器每次调用的延迟')
+    parser.add_argument('--encode-per-text-ms', type=float, default=0.0, help='假编码器每条文本的附加延迟')
+    parser.add_argument('--mongo-uri', default=None, help='使用真实MongoDB（默认使用进程内替身）')
+    parser.add_argument('--mongo-latency-ms', type=float, default=0.0, help='进程内替身每次操作的模拟延迟')
+    parser.add_argument('--llm-url', default=None, help='使用已有的OpenAI兼容服务（默认启动本地假服务）')
+    parser.add_argument('--model', default='fake-chat', help='请求的模型名称')
+    parser.add_argument('--prompt-model', default=None, help='提示词模板名称（默认与main.py一致，取DialogueConfig.model_name）')
+    parser.add_argument('--output', default=None, help='结果JSON的写入路径')
+    parser.add_argument('--verbose', action='store_true', help='显示被测组件的输出')
+    add_profile_arguments(parser)
+    return parser
+
+def main():
+    args = build_parser().parse_args()
+    report = run(args)
+    output = json.dumps(report, ensure_ascii=False, indent=2, default=str)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    print(output)
+
+if __name__ == "__main__":
+    main()
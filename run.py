@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 import os
 import sys
+import argparse
 import subprocess
 from pathlib import Path
 from dotenv import load_dotenv
@@ -10,6 +11,40 @@ project_root = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, project_root)
 sys.path.insert(0, os.path.join(project_root, "src"))
 
+def parse_args():
+    """解析启动参数"""
+    parser = argparse.ArgumentParser(description='启动聊天机器人')
+    parser.add_argument('--profile-turns', type=int, default=None,
+                        help='对接下来N轮对话做性能剖析（CPU采样，结果写入logs/）')
+    parser.add_argument('--profile-slow-ms', type=float, default=None,
+                        help='对耗时超过该阈值（毫秒）的轮次做性能剖析')
+    parser.add_argument('--profile-memory', action='store_true',
+                        help='剖析时同时记录tracemalloc分配快照')
+    parser.add_argument('--profile-interval-ms', type=float, default=None,
+                        help='CPU采样间隔（毫秒，默认5）')
+    parser.add_argument('--profile-dir', default=None,
+                        help='剖析结果目录（默认logs）')
+    parser.add_argument('--server', action='store_true',
+                        help='以服务方式启动（HTTP和WebSocket接口），代替命令行对话')
+    parser.add_argument('--host', default=None,
+                        help='服务监听地址（默认SERVER_HOST或0.0.0.0）')
+    parser.add_argument('--port', type=int, default=None,
+                        help='服务监听端口（默认SERVER_PORT或8080）')
+    return parser.parse_args()
+
+def apply_profile_args(args):
+    """将剖析参数写入环境变量（优先于.env中的配置）"""
+    options = {
+        'PROFILE_TURNS': args.profile_turns,
+        'PROFILE_SLOW_TURN_MS': args.profile_slow_ms,
+        'PROFILE_INTERVAL_MS': args.profile_interval_ms,
+        'PROFILE_DIR': args.profile_dir,
+        'PROFILE_MEMORY': 'true' if args.profile_memory else None
+    }
+    for name, value in options.items():
+        if value is not None:
+            os.environ[name] = str(value)
+
 def load_environment():
     """加载环境变量"""
     # 加载.env文件
@@ -100,6 +135,9 @@ def initialize_llm(llm_type):
 
 def main():
     """主函数"""
+    args = parse_args()
+    apply_profile_args(args)
+    
     print("正在启动聊天机器人...")
     
     # 创建目录
@@ -120,6 +158,16 @@ def main():
     # 启动机器人
     print(f"\n正在启动聊天机器人（使用{llm_type}模型）...")
     try:
+        if args.server:
+            from src.config.server_config import ServerConfig
+            from src.server import run_server
+            config = ServerConfig.from_env()
+            if args.host:
+                config.host = args.host
+            if args.port:
+                config.port = args.port
+            run_server(llm, config)
+            return
         from src.main import main as start_bot
         start_bot(llm)
     except ImportError as e:
@@ -1,19 +1,23 @@
 from .dialogue_config import DialogueConfig, LLM_MODELS, DEFAULT_MODEL, MODEL_SELECTION_RULES
-from .memory_config import MemoryConfig, MEMORY_ANALYSIS_PROMPT, MEMORY_RETRIEVAL_PROMPT, IMPORTANCE_KEYWORDS, MEMORY_PARAMS
+from .memory_config import MemoryConfig, MEMORY_ANALYSIS_PROMPT, MEMORY_RETRIEVAL_PROMPT, IMPORTANCE_KEYWORDS, KEY_POINT_KEYWORDS, LOW_IMPORTANCE_PROTOTYPES, MEMORY_PARAMS
 from .emotion_config import EmotionConfig, EMOTION_STATES, EMOTION_TRANSITION_RULES, EMOTION_UPDATE_PARAMS
 from .prompt_config import PromptConfig
+from .server_config import ServerConfig
 
 __all__ = [
     'DialogueConfig',
     'MemoryConfig',
     'EmotionConfig',
     'PromptConfig',
+    'ServerConfig',
     'LLM_MODELS',
     'DEFAULT_MODEL',
     'MODEL_SELECTION_RULES',
     'MEMORY_ANALYSIS_PROMPT',
     'MEMORY_RETRIEVAL_PROMPT',
     'IMPORTANCE_KEYWORDS',
+    'KEY_POINT_KEYWORDS',
+    'LOW_IMPORTANCE_PROTOTYPES',
     'MEMORY_PARAMS',
     'EMOTION_STATES',
     'EMOTION_TRANSITION_RULES',
@@ -67,6 +67,10 @@ class DialogueConfig:
     
     # 对话配置
     max_history: int = 10
+    # 原文保留的对话历史token预算，超出的早期轮次并入滚动摘要
+    max_history_tokens: int = 2000
+    # 滚动摘要的token预算
+    max_summary_tokens: int = 300
     stop_sequences: List[str] = None
     
     def __post_init__(self):
@@ -82,6 +86,8 @@ class DialogueConfig:
             max_tokens=config.get('max_tokens', cls.max_tokens),
             system_prompt=config.get('system_prompt', cls.system_prompt),
             max_history=config.get('max_history', cls.max_history),
+            max_history_tokens=config.get('max_history_tokens', cls.max_history_tokens),
+            max_summary_tokens=config.get('max_summary_tokens', cls.max_summary_tokens),
             stop_sequences=config.get('stop_sequences', cls.stop_sequences)
         )
     
@@ -93,5 +99,7 @@ class DialogueConfig:
             'max_tokens': self.max_tokens,
             'system_prompt': self.system_prompt,
             'max_history': self.max_history,
+            'max_history_tokens': self.max_history_tokens,
+            'max_summary_tokens': self.max_summary_tokens,
             'stop_sequences': self.stop_sequences
         } 
\ No newline at end of file
@@ -55,6 +55,12 @@ EMOTION_UPDATE_PARAMS = {
         'confidence_threshold': 0.6  # 置信度阈值
     },
     
+    # 情感推理参数
+    'reasoning': {
+        'history_window': 5,  # 参与推理的最近消息数
+        'max_conversations': 1000  # 保留滑动窗口统计的最大对话数
+    },
+    
     # 情感转换参数
     'transition': {
         'min_duration': 60,  # 最小持续时间（秒）
@@ -211,6 +217,18 @@ class EmotionConfig:
     # 情感持续时间（秒）
     emotion_duration: int = 300
     
+    # 用户行为统计的时间桶大小（秒）
+    behavior_bucket_seconds: int = 3600
+    
+    # 用户行为统计窗口（秒）
+    behavior_window_seconds: int = 86400
+    
+    # 是否同时记录原始用户行为日志
+    log_raw_behaviors: bool = False
+    
+    # 进程内最多缓存情感状态的用户数，超出时释放最久未访问的用户
+    max_cached_states: int = 10000
+    
     def __post_init__(self):
         if self.emotion_states is None:
             self.emotion_states = EMOTION_STATES
@@ -231,7 +249,11 @@ class EmotionConfig:
             expressions=config.get('expressions', cls.expressions),
             decay_rate=config.get('decay_rate', cls.decay_rate),
             trigger_threshold=config.get('trigger_threshold', cls.trigger_threshold),
-            emotion_duration=config.get('emotion_duration', cls.emotion_duration)
+            emotion_duration=config.get('emotion_duration', cls.emotion_duration),
+            behavior_bucket_seconds=config.get('behavior_bucket_seconds', cls.behavior_bucket_seconds),
+            behavior_window_seconds=config.get('behavior_window_seconds', cls.behavior_window_seconds),
+            log_raw_behaviors=config.get('log_raw_behaviors', cls.log_raw_behaviors),
+            max_cached_states=config.get('max_cached_states', cls.max_cached_states)
         )
     
     def to_dict(self) -> Dict[str, Any]:
@@ -243,5 +265,9 @@ class EmotionConfig:
             'expressions': self.expressions,
             'decay_rate': self.decay_rate,
             'trigger_threshold': self.trigger_threshold,
-            'emotion_duration': self.emotion_duration
+            'emotion_duration': self.emotion_duration,
+            'behavior_bucket_seconds': self.behavior_bucket_seconds,
+            'behavior_window_seconds': self.behavior_window_seconds,
+            'log_raw_behaviors': self.log_raw_behaviors,
+            'max_cached_states': self.max_cached_states
         } 
\ No newline at end of file
@@ -9,6 +9,8 @@ MEMORY_PARAMS = {
         'similarity_threshold': 0.7,  # 相似度阈值
         'max_tokens': 1000,  # 最大token数
         'temperature': 0.7,  # 温度参数
+        'similarity_weight': 0.8,  # 向量相似度在检索分数中的权重，其余为相关性/时效性
+        'recency_decay_rate': 0.1,  # 对话记忆时效性的每日衰减率
     },
     
     # 记忆分析参数
@@ -16,6 +18,7 @@ MEMORY_PARAMS = {
         'max_tokens': 2000,  # 最大token数
         'temperature': 0.7,  # 温度参数
         'importance_threshold': 0.6,  # 重要性阈值
+        'confidence_threshold': 0.6,  # 本地分类置信度阈值（低于该值时调用LLM）
     },
     
     # 记忆存储参数
@@ -25,6 +28,13 @@ MEMORY_PARAMS = {
         'compression_threshold': 0.8,  # 压缩阈值
     },
     
+    # 近重复检测参数
+    'dedup': {
+        'max_distance': 3,  # SimHash汉明距离不超过该值视为近重复
+        'shingle_size': 3,  # 字符shingle长度
+        'strength_bump': 0.05,  # 合并重复记忆时的强度提升
+    },
+    
     # 记忆更新参数
     'update': {
         'relevance_threshold': 0.6,  # 相关性阈值
@@ -63,6 +73,16 @@ IMPORTANCE_KEYWORDS = [
     '升职', '加薪', '获奖', '成功', '失败'
 ]
 
+# 低重要性原型（寒暄、应答等无需长期记忆的内容）
+LOW_IMPORTANCE_PROTOTYPES = [
+    '嗯', '哦', '好的', '收到', '知道了', '哈哈', '哈哈哈', '在吗',
+    '你好', '早上好', '晚安', '谢谢', '没事', '随便', '还行', '是吗',
+    '[表情]', '[图片]', '[动画表情]', 'ok', '666'
+]
+
+# 关键信息点关键词（包含这些词的句子会被提取为关键点）
+KEY_POINT_KEYWORDS = ['重要', '关键', '必须', '一定']
+
 # 记忆分析提示词
 MEMORY_ANALYSIS_PROMPT = """请分析以下对话内容，提取关键信息：
 
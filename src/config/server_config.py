@@ -0,0 +1,45 @@
+from typing import Dict, Any
+from dataclasses import dataclass
+import os
+
+@dataclass
+class ServerConfig:
+    """聊天服务配置（HTTP和WebSocket）"""
+    
+    # 监听地址
+    host: str = '0.0.0.0'
+    port: int = 8080
+    
+    # 执行阻塞步骤（数据库、情感分析、LLM流式请求）的线程数，
+    # 每个正在生成回复的对话占用一个线程
+    workers: int = 64
+    # 嵌入模型推理的线程数，限制同时进行的模型调用
+    encoder_workers: int = 2
+    
+    # 会话空闲多久后释放（秒）
+    session_idle_timeout: float = 1800.0
+    # 单条消息的最大长度（字符）
+    max_message_chars: int = 4000
+    
+    @classmethod
+    def from_env(cls) -> 'ServerConfig':
+        """从环境变量创建配置"""
+        return cls(
+            host=os.getenv('SERVER_HOST', cls.host),
+            port=int(os.getenv('SERVER_PORT', str(cls.port))),
+            workers=int(os.getenv('SERVER_WORKERS', str(cls.workers))),
+            encoder_workers=int(os.getenv('ENCODER_WORKERS', str(cls.encoder_workers))),
+            session_idle_timeout=float(os.getenv('SESSION_IDLE_TIMEOUT', str(cls.session_idle_timeout))),
+            max_message_chars=int(os.getenv('MAX_MESSAGE_CHARS', str(cls.max_message_chars)))
+        )
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为字典"""
+        return {
+            'host': self.host,
+            'port': self.port,
+            'workers': self.workers,
+            'encoder_workers': self.encoder_workers,
+            'session_idle_timeout': self.session_idle_timeout,
+            'max_message_chars': self.max_message_chars
+        }
@@ -1,4 +1,6 @@
 from .core.dialogue_system import DialogueSystem
 from .core.dialogue_processor import DialogueProcessor
+from .core.turn_analyzer import TurnAnalyzer
+from .core.session_history import SessionHistory, SessionHistoryStore
  
-__all__ = ['DialogueSystem', 'DialogueProcessor'] 
\ No newline at end of file
+__all__ = ['DialogueSystem', 'DialogueProcessor', 'TurnAnalyzer', 'SessionHistory', 'SessionHistoryStore'] 
\ No newline at end of file
@@ -1,9 +1,18 @@
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple
+from dataclasses import asdict
 from datetime import datetime
 from src.memory.core.multi_source_manager import MultiSourceMemoryManager
 from src.emotion import EmotionManager, EmotionAnalyzer
+from src.emotion.models.emotion_analysis import EmotionAnalysis
 from src.llm.base import BaseLLM
+from src.llm.rate_limiter import llm_priority, PRIORITY_INTERACTIVE, PRIORITY_ANALYSIS
 from src.dialogue.core.prompt_manager import PromptManager
+from src.dialogue.core.turn_analyzer import TurnAnalyzer
+from src.dialogue.core.session_history import SessionHistoryStore
+from src.dialogue.models.dialogue_turn import PreparedTurn
+from src.dialogue.models.prompt_template import PromptTemplate
+from src.utils.tracing import get_tracer
+from src.utils.profiler import get_turn_profiler
 
 class DialogueProcessor:
     """对话处理器：整合记忆系统和情感系统处理对话"""
@@ -11,12 +20,20 @@ class DialogueProcessor:
                  memory_manager: MultiSourceMemoryManager,
                  emotion_manager: EmotionManager,
                  emotion_analyzer: EmotionAnalyzer,
-                 llm: BaseLLM):
+                 llm: BaseLLM,
+                 turn_analyzer: Optional[TurnAnalyzer] = None,
+                 history_store: Optional[SessionHistoryStore] = None):
         self.memory_manager = memory_manager
         self.emotion_manager = emotion_manager
         self.emotion_analyzer = emotion_analyzer
         self.llm = llm
         self.prompt_manager = PromptManager()
+        # 可选：一次LLM调用同时完成情感和记忆重要性分析
+        self.turn_analyzer = turn_analyzer
+        # 按用户保存的多轮对话历史，随每轮请求发送给LLM
+        self.history_store = history_store or SessionHistoryStore()
+        self.tracer = get_tracer()
+        self.profiler = get_turn_profiler()
         
     def process_dialogue(self,
                         user_id: str,
@@ -24,68 +41,112 @@ class DialogueProcessor:
                         personality_traits: Dict[str, float],
                         model_name: str = "siliconflow") -> str:
         """处理对话并生成回复"""
-        # 1. 分析用户输入的情感
-        emotion_analysis = self.emotion_analyzer.analyze_emotion(user_input)
+        # 每轮对话为一棵调用树的根
+        with self.profiler.turn(), self.tracer.span('turn', user_id=user_id):
+            return self._process_dialogue(user_id, user_input, personality_traits, model_name)
+            
+    def _process_dialogue(self,
+                          user_id: str,
+                          user_input: str,
+                          personality_traits: Dict[str, float],
+                          model_name: str) -> str:
+        turn = self.prepare_turn(user_id, user_input, personality_traits, model_name)
         
-        # 2. 更新情感状态
-        self.emotion_manager.update_emotion_state(
-            user_id=user_id,
-            emotion_state=emotion_analysis.emotion_state,
-            intensity=emotion_analysis.intensity,
-            metadata={
-                'trigger': user_input,
-                'analysis_method': 'llm',
-                'confidence': emotion_analysis.confidence
-            }
-        )
+        # 8. 生成回复
+        response = self._generate(turn.messages, turn.temperature, turn.max_tokens, user_id)
         
-        # 3. 获取当前情感状态
-        current_emotion = self.emotion_manager.get_emotion_state(user_id)
+        # 9. 存储对话记忆
+        self.complete_turn(turn, response)
+        return response
         
-        # 4. 从记忆系统检索相关记忆
-        memories = self.memory_manager.get_memories(
-            query=user_input,
-            user_id=user_id,
-            limit=5
-        )
+    def prepare_turn(self,
+                     user_id: str,
+                     user_input: str,
+                     personality_traits: Dict[str, float],
+                     model_name: str = "siliconflow") -> PreparedTurn:
+        """生成回复之前的步骤：情感分析和更新、记忆检索、构建消息列表
         
-        # 5. 构建记忆上下文
-        memory_context = self._build_memory_context(memories)
+        与complete_turn配合使用，调用方可以自行调用LLM（如流式生成）。
+        """
+        # 1. 分析用户输入的情感（本地分析置信度不足时才调用LLM）
+        memory_analysis = None
+        with self.tracer.span('emotion.analyze'), llm_priority(PRIORITY_ANALYSIS, user_id):
+            if self.turn_analyzer is not None:
+                emotion_analysis, memory_analysis = self.turn_analyzer.analyze(user_input)
+            else:
+                emotion_analysis = self.emotion_analyzer.analyze_emotion(user_input)
         
-        # 6. 构建情感上下文
-        emotion_context = self._build_emotion_context(current_emotion)
+        # 2. 更新情感状态
+        with self.tracer.span('emotion.update'):
+            self.emotion_manager.update_emotion_state(
+                user_id=user_id,
+                emotion_state=emotion_analysis.emotion_state,
+                intensity=emotion_analysis.intensity,
+                metadata={
+                    'trigger': user_input,
+                    'analysis_method': emotion_analysis.method,
+                    'confidence': emotion_analysis.confidence
+                }
+            )
+            
+            # 3. 获取当前情感状态
+            current_emotion = self.emotion_manager.get_emotion(user_id)
         
-        # 7. 构建系统提示
-        system_prompt = self._build_system_prompt(
-            personality_traits=personality_traits,
-            emotion_context=emotion_context,
-            memory_context=memory_context
-        )
+        # 4. 从记忆系统检索相关记忆
+        with self.tracer.span('memory.retrieve') as span:
+            memories = self.memory_manager.get_memories(
+                query=user_input,
+                user_id=user_id,
+                limit=5
+            )
+            span.set(results=len(memories))
         
-        # 8. 生成回复
-        response = self.process_input(
+        # 5. 构建记忆上下文（系统提示由提示词模板生成，见_build_messages）
+        memory_context = self._build_memory_context(memories)
+        
+        messages, prompt_template = self._build_messages(
             user_input=user_input,
             model_name=model_name,
             personality_traits=personality_traits,
             emotion_state=emotion_analysis.emotion_state,
             emotion_intensity=emotion_analysis.intensity,
-            memory_context=memory_context
+            memory_context=memory_context,
+            history=self.history_store.get(user_id).messages()
         )
-        
-        # 9. 存储对话记忆
-        self._store_dialogue_memory(
+        return PreparedTurn(
             user_id=user_id,
             user_input=user_input,
-            response=response,
-            emotion_state=current_emotion,
-            metadata={
-                'emotion_analysis': emotion_analysis.dict(),
-                'memory_context': memory_context,
-                'personality_traits': personality_traits
-            }
+            personality_traits=personality_traits,
+            messages=messages,
+            temperature=prompt_template.temperature,
+            max_tokens=prompt_template.max_tokens,
+            emotion_analysis=emotion_analysis,
+            current_emotion=current_emotion,
+            memory_context=memory_context,
+            memory_analysis=memory_analysis
         )
         
-        return response
+    def complete_turn(self, turn: PreparedTurn, response: str) -> None:
+        """生成回复之后的步骤：追加对话历史，存储本轮对话记忆"""
+        self.history_store.get(turn.user_id).add_turn(turn.user_input, response)
+        
+        dialogue_metadata = {
+            'emotion_analysis': asdict(turn.emotion_analysis),
+            'memory_context': turn.memory_context,
+            'personality_traits': turn.personality_traits
+        }
+        if turn.memory_analysis is not None:
+            # 合并分析得到的重要性参与记忆强度计算
+            dialogue_metadata['memory_analysis'] = asdict(turn.memory_analysis)
+            dialogue_metadata['importance'] = turn.memory_analysis.importance_score
+            
+        self._store_dialogue_memory(
+            user_id=turn.user_id,
+            user_input=turn.user_input,
+            response=response,
+            emotion_state=turn.current_emotion.emotion_state,
+            metadata=dialogue_metadata
+        )
         
     def process_input(self,
                      user_input: str,
@@ -93,36 +154,66 @@ class DialogueProcessor:
                      personality_traits: Dict[str, float],
                      emotion_state: str,
                      emotion_intensity: float,
-                     memory_context: str) -> str:
-        """处理用户输入并生成回复"""
-        # 获取提示词模板
-        prompt_template = self.prompt_manager.get_prompt(
-            model_name=model_name,
+                     memory_context: str,
+                     history: Optional[List[Dict[str, str]]] = None) -> str:
+        """处理用户输入并生成回复，history为之前的对话消息（见SessionHistory.messages）"""
+        messages, prompt_template = self._build_messages(
             user_input=user_input,
+            model_name=model_name,
             personality_traits=personality_traits,
             emotion_state=emotion_state,
             emotion_intensity=emotion_intensity,
-            memory_context=memory_context
+            memory_context=memory_context,
+            history=history
         )
+        return self._generate(messages, prompt_template.temperature, prompt_template.max_tokens)
         
-        # 构建消息列表
-        messages = [
-            {
-                "role": "system",
-                "content": prompt_template.system_prompt or ""
-            },
-            {
-                "role": "user",
-                "content": prompt_template.prompt
-            }
-        ]
+    def _build_messages(self,
+                        user_input: str,
+                        model_name: str,
+                        personality_traits: Dict[str, float],
+                        emotion_state: str,
+                        emotion_intensity: float,
+                        memory_context: str,
+                        history: Optional[List[Dict[str, str]]] = None) -> Tuple[List[Dict[str, str]], PromptTemplate]:
+        """按提示词模板构建发送给LLM的消息列表：系统提示、对话历史、本轮输入"""
+        with self.tracer.span('prompt.build'):
+            # 获取提示词模板
+            prompt_template = self.prompt_manager.get_prompt(
+                model_name=model_name,
+                user_input=user_input,
+                personality_traits=personality_traits,
+                emotion_state=emotion_state,
+                emotion_intensity=emotion_intensity,
+                memory_context=memory_context
+            )
+            
+            # 构建消息列表
+            messages = [
+                {
+                    "role": "system",
+                    "content": prompt_template.system_prompt or ""
+                },
+                *(history or []),
+                {
+                    "role": "user",
+                    "content": prompt_template.prompt
+                }
+            ]
+        return messages, prompt_template
         
-        # 调用LLM生成回复
-        response = self.llm.chat(
-            messages=messages,
-            temperature=prompt_template.temperature,
-            max_tokens=prompt_template.max_tokens
-        )
+    def _generate(self,
+                  messages: List[Dict[str, str]],
+                  temperature: float,
+                  max_tokens: int,
+                  user_id: Optional[str] = None) -> str:
+        """调用LLM生成回复（限流时按交互优先级排队）"""
+        with llm_priority(PRIORITY_INTERACTIVE, user_id):
+            response = self.llm.chat(
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens
+            )
         
         # 从响应中提取内容
         if response and 'choices' in response and len(response['choices']) > 0:
@@ -143,13 +234,13 @@ class DialogueProcessor:
                 
         return "\n".join(context_parts)
         
-    def _build_emotion_context(self, emotion_state: Dict[str, Any]) -> str:
+    def _build_emotion_context(self, emotion: EmotionAnalysis) -> str:
         """构建情感上下文"""
         context_parts = ["当前情感状态："]
-        context_parts.append(f"- 主要情感：{emotion_state['primary_emotion']}")
-        context_parts.append(f"- 情感强度：{emotion_state['intensity']:.2f}")
-        if emotion_state['secondary_emotions']:
-            context_parts.append(f"- 次要情感：{', '.join(emotion_state['secondary_emotions'])}")
+        context_parts.append(f"- 主要情感：{emotion.emotion_state}")
+        context_parts.append(f"- 情感强度：{emotion.intensity:.2f}")
+        if emotion.keywords:
+            context_parts.append(f"- 情感关键词：{', '.join(emotion.keywords)}")
             
         return "\n".join(context_parts)
         
@@ -189,29 +280,30 @@ class DialogueProcessor:
                              user_id: str,
                              user_input: str,
                              response: str,
-                             emotion_state: Dict[str, Any],
+                             emotion_state: str,
                              metadata: Dict[str, Any]) -> None:
         """存储对话记忆"""
-        # 存储用户输入
-        self.memory_manager.add_memory(
-            content=user_input,
-            user_id=user_id,
-            source_name="conversation",
-            metadata={
-                **metadata,
-                'type': 'user_input',
-                'emotion_state': emotion_state
-            }
-        )
+        with self.tracer.span('memory.store', memories=2):
+            # 存储用户输入
+            self.memory_manager.add_memory(
+                content=user_input,
+                user_id=user_id,
+                source_name="conversation",
+                metadata={
+                    **metadata,
+                    'type': 'user_input',
+                    'emotion_state': emotion_state
+                }
+            )
         
-        # 存储AI回复
-        self.memory_manager.add_memory(
-            content=response,
-            user_id=user_id,
-            source_name="conversation",
-            metadata={
-                **metadata,
-                'type': 'ai_response',
-                'emotion_state': emotion_state
-            }
-        ) 
\ No newline at end of file
+            # 存储AI回复
+            self.memory_manager.add_memory(
+                content=response,
+                user_id=user_id,
+                source_name="conversation",
+                metadata={
+                    **metadata,
+                    'type': 'ai_response',
+                    'emotion_state': emotion_state
+                }
+            ) 
\ No newline at end of file
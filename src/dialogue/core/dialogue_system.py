@@ -33,8 +33,9 @@ class DialogueSystem:
                          personality_traits: Dict[str, float],
                          emotion_state: str,
                          emotion_intensity: float,
-                         memory_context: str) -> str:
-        """生成回复"""
+                         memory_context: str,
+                         history: Optional[List[Dict[str, str]]] = None) -> str:
+        """生成回复，history为之前的对话消息"""
         # 使用对话处理器处理用户输入
         response = self.dialogue_processor.process_input(
             user_input=user_input,
@@ -42,7 +43,8 @@ class DialogueSystem:
             personality_traits=personality_traits,
             emotion_state=emotion_state,
             emotion_intensity=emotion_intensity,
-            memory_context=memory_context
+            memory_context=memory_context,
+            history=history
         )
         
         return response
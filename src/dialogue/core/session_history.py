@@ -0,0 +1,164 @@
+from typing import List, Dict, Optional
+import re
+import threading
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from src.config.dialogue_config import DialogueConfig
+from src.utils.keyword_automaton import get_keyword_automaton
+from src.utils.tokens import count_tokens
+
+# 摘要中每轮用户发言和回复保留的最大字符数
+SUMMARY_USER_CHARS = 60
+SUMMARY_REPLY_CHARS = 40
+# 默认最多保留历史的用户数，超出时释放最久未对话的用户
+MAX_SESSIONS = 10000
+
+_SENTENCE_END = re.compile(r'[。！？!?\n]+')
+
+@dataclass
+class HistoryTurn:
+    """一轮对话：用户发言、回复及其token数"""
+    user_input: str
+    response: str
+    tokens: int
+
+class SessionHistory:
+    """单个用户的对话历史
+
+    最近的轮次按原文保留在队列中，总token数不超过max_tokens、轮数不超过max_turns；
+    超出的早期轮次压缩为一行摘要并入滚动摘要，摘要同样按token预算丢弃最早的行。
+    每条消息只在加入时计算一次token数，之后增减都只更新累计值。
+    """
+    def __init__(self,
+                 max_turns: int = 10,
+                 max_tokens: int = 2000,
+                 max_summary_tokens: int = 300):
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self.max_summary_tokens = max_summary_tokens
+        self.turns: deque = deque()
+        self.tokens = 0
+        # 滚动摘要：(摘要行, token数)
+        self.summary_lines: deque = deque()
+        self.summary_tokens = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: DialogueConfig) -> 'SessionHistory':
+        return cls(
+            max_turns=config.max_history,
+            max_tokens=config.max_history_tokens,
+            max_summary_tokens=config.max_summary_tokens
+        )
+
+    def add_turn(self, user_input: str, response: str) -> None:
+        """追加一轮对话，超出预算时把最早的轮次移入摘要"""
+        turn = HistoryTurn(user_input, response, count_tokens(user_input) + count_tokens(response))
+        with self._lock:
+            self.turns.append(turn)
+            self.tokens += turn.tokens
+            while self.turns and (len(self.turns) > self.max_turns or self.tokens > self.max_tokens):
+                evicted = self.turns.popleft()
+                self.tokens -= evicted.tokens
+                self._summarize(evicted)
+
+    def messages(self) -> List[Dict[str, str]]:
+        """历史消息列表：有摘要时以一条system消息开头，之后为按时间排列的user/assistant消息"""
+        with self._lock:
+            messages = []
+            if self.summary_lines:
+                messages.append({
+                    "role": "system",
+                    "content": "早前对话摘要：\n" + "\n".join(line for line, _ in self.summary_lines)
+                })
+            for turn in self.turns:
+                messages.append({"role": "user", "content": turn.user_input})
+                messages.append({"role": "assistant", "content": turn.response})
+            return messages
+
+    @property
+    def total_tokens(self) -> int:
+        """历史原文和摘要的总token数"""
+        return self.tokens + self.summary_tokens
+
+    def clear(self) -> None:
+        with self._lock:
+            self.turns.clear()
+            self.tokens = 0
+            self.summary_lines.clear()
+            self.summary_tokens = 0
+
+    def _summarize(self, turn: HistoryTurn) -> None:
+        """把一轮对话压缩为一行摘要：用户发言取含关键信息的句子，回复取首句"""
+        if self.max_summary_tokens <= 0:
+            return
+        line = f"- 用户：{_key_sentence(turn.user_input, SUMMARY_USER_CHARS)}"
+        reply = _first_sentence(turn.response, SUMMARY_REPLY_CHARS)
+        if reply:
+            line += f"；回复：{reply}"
+        tokens = count_tokens(line)
+        self.summary_lines.append((line, tokens))
+        self.summary_tokens += tokens
+        while self.summary_lines and self.summary_tokens > self.max_summary_tokens:
+            _, dropped = self.summary_lines.popleft()
+            self.summary_tokens -= dropped
+
+def _sentences(text: str) -> List[str]:
+    return [sentence.strip() for sentence in _SENTENCE_END.split(text) if sentence.strip()]
+
+def _truncate(text: str, limit: int) -> str:
+    return text if len(text) <= limit else text[:limit - 1] + '…'
+
+def _first_sentence(text: str, limit: int) -> str:
+    sentences = _sentences(text)
+    return _truncate(sentences[0], limit) if sentences else ''
+
+def _key_sentence(text: str, limit: int) -> str:
+    """优先选择包含关键信息关键词的句子，没有时取首句"""
+    sentences = _sentences(text)
+    if not sentences:
+        return ''
+    automaton = get_keyword_automaton()
+    for sentence in sentences:
+        if automaton.has_any(sentence, 'key_point'):
+            return _truncate(sentence, limit)
+    return _truncate(sentences[0], limit)
+
+class SessionHistoryStore:
+    """按用户保存对话历史，用户数超过max_sessions时释放最久未对话的用户"""
+    def __init__(self,
+                 config: Optional[DialogueConfig] = None,
+                 max_sessions: int = MAX_SESSIONS):
+        self.config = config or DialogueConfig()
+        self.max_sessions = max_sessions
+        self._histories: 'OrderedDict[str, SessionHistory]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str) -> SessionHistory:
+        """获取用户的对话历史，不存在时创建"""
+        with self._lock:
+            history = self._histories.get(user_id)
+            if history is None:
+                history = self._histories[user_id] = SessionHistory.from_config(self.config)
+                while len(self._histories) > self.max_sessions:
+                    self._histories.popitem(last=False)
+            else:
+                self._histories.move_to_end(user_id)
+            return history
+
+    def clear(self, user_id: Optional[str] = None) -> None:
+        """清空指定用户（为空时清空全部用户）的对话历史"""
+        with self._lock:
+            if user_id is None:
+                self._histories.clear()
+            else:
+                self._histories.pop(user_id, None)
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            histories = list(self._histories.values())
+        return {
+            'sessions': len(histories),
+            'turns': sum(len(history.turns) for history in histories),
+            'tokens': sum(history.total_tokens for history in histories)
+        }
@@ -0,0 +1,144 @@
+from typing import Dict, Any, List, Optional, Tuple
+from config.emotion_config import EMOTION_STATES
+from config.memory_config import MEMORY_PARAMS
+from src.emotion.core.emotion_analyzer import EmotionAnalyzer
+from src.emotion.models.emotion_analysis import EmotionAnalysis
+from src.memory.core.memory_analyzer import MemoryAnalyzer
+from src.memory.models.memory_analysis import MemoryAnalysis
+from src.llm.base import BaseLLM
+from src.utils.analysis_cache import AnalysisCache, get_analysis_cache
+from src.utils.json_utils import extract_json
+
+class TurnAnalyzer:
+    """合并分析器：一次LLM调用同时完成情感分析和记忆重要性分析"""
+    # 提示词版本：修改提示词时需要更新，使旧的缓存结果失效
+    PROMPT_VERSION = 'v1'
+
+    SYSTEM_PROMPT = "你是对话分析专家，只输出一个紧凑的JSON对象，不要输出任何其他内容。"
+
+    def __init__(self,
+                 emotion_analyzer: EmotionAnalyzer,
+                 memory_analyzer: MemoryAnalyzer,
+                 llm: Optional[BaseLLM] = None,
+                 cache: Optional[AnalysisCache] = None,
+                 temperature: float = 0.3,
+                 max_tokens: int = 256):
+        self.emotion_analyzer = emotion_analyzer
+        self.memory_analyzer = memory_analyzer
+        self.llm = llm or emotion_analyzer.llm
+        self.cache = cache or get_analysis_cache()
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+
+    def analyze(self,
+                conversation: str,
+                user_behavior: Optional[Dict[str, Any]] = None) -> Tuple[EmotionAnalysis, MemoryAnalysis]:
+        """同时分析情感和记忆重要性，任一部分失败时单独回退到关键词分析"""
+        user_behavior = user_behavior or {}
+
+        cache_key = self.cache.make_key(
+            'turn_analyzer',
+            self.PROMPT_VERSION,
+            conversation,
+            self.emotion_analyzer._behavior_bucket(user_behavior)
+        )
+        result = self.cache.get_or_compute(
+            cache_key,
+            lambda: self._llm_analysis(conversation, user_behavior)
+        ) or {}
+
+        emotion_analysis = self._parse_emotion(result)
+        if emotion_analysis is None:
+            emotion_analysis = self.emotion_analyzer._simple_analysis(conversation, user_behavior)
+
+        memory_analysis = self._parse_memory(result)
+        if memory_analysis is None:
+            memory_analysis = self.memory_analyzer._simple_analysis(conversation)
+
+        return emotion_analysis, memory_analysis
+
+    def _llm_analysis(self,
+                      conversation: str,
+                      user_behavior: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """调用LLM获取合并分析结果，失败时返回None"""
+        messages = [
+            {
+                "role": "system",
+                "content": self.SYSTEM_PROMPT
+            },
+            {
+                "role": "user",
+                "content": self._create_prompt(conversation, user_behavior)
+            }
+        ]
+
+        response = self.llm.chat(
+            messages=messages,
+            temperature=self.temperature,
+            max_tokens=self.max_tokens
+        )
+
+        if not response or 'choices' not in response or not response['choices']:
+            return None
+
+        return extract_json(response['choices'][0]['message']['content'])
+
+    def _create_prompt(self,
+                       conversation: str,
+                       user_behavior: Dict[str, Any]) -> str:
+        """创建合并分析提示词"""
+        return f"""分析对话的情感状态，并判断是否应存入长期记忆。
+
+对话内容：
+{conversation}
+
+用户行为：频率{user_behavior.get('conversation_frequency', 0)}次/天，平均间隔{user_behavior.get('avg_interval', 0)}秒，时段{user_behavior.get('time_of_day', 'unknown')}
+
+情感状态可选：{'/'.join(EMOTION_STATES.keys())}
+只返回如下JSON，理由不超过20字，关键点不超过3条：
+{{"emotion_state":"","intensity":0.5,"eq_score":0.5,"emotion_keywords":[],"emotion_reason":"","should_store_in_ltm":false,"importance_score":0.0,"key_points":[],"memory_reason":""}}"""
+
+    def _parse_emotion(self, result: Dict[str, Any]) -> Optional[EmotionAnalysis]:
+        """解析情感部分，字段缺失或非法时返回None"""
+        emotion_state = result.get('emotion_state')
+        if emotion_state not in EMOTION_STATES:
+            return None
+
+        return EmotionAnalysis(
+            emotion_state=emotion_state,
+            intensity=self._as_score(result.get('intensity'), 0.5),
+            reason=str(result.get('emotion_reason', '')),
+            keywords=self._as_list(result.get('emotion_keywords')),
+            eq_score=self._as_score(result.get('eq_score'), 0.5),
+            method='llm'
+        )
+
+    def _parse_memory(self, result: Dict[str, Any]) -> Optional[MemoryAnalysis]:
+        """解析记忆部分，字段缺失时返回None"""
+        if 'importance_score' not in result:
+            return None
+
+        importance_score = self._as_score(result.get('importance_score'), 0.0)
+        should_store = result.get('should_store_in_ltm')
+        if not isinstance(should_store, bool):
+            should_store = importance_score >= MEMORY_PARAMS['analysis']['importance_threshold']
+
+        return MemoryAnalysis(
+            should_store_in_ltm=should_store,
+            reason=str(result.get('memory_reason', '')),
+            importance_score=importance_score,
+            key_points=self._as_list(result.get('key_points'))
+        )
+
+    def _as_score(self, value: Any, default: float) -> float:
+        """转换为0-1之间的分数"""
+        try:
+            return max(0.0, min(1.0, float(value)))
+        except (TypeError, ValueError):
+            return default
+
+    def _as_list(self, value: Any) -> List[str]:
+        """转换为字符串列表"""
+        if not isinstance(value, list):
+            return []
+        return [str(item) for item in value]
@@ -2,6 +2,7 @@ from pymongo import MongoClient
 from src.memory.core.multi_source_manager import MultiSourceMemoryManager
 from src.memory.sources.conversation_source import ConversationMemorySource
 from src.memory.sources.knowledge_source import KnowledgeMemorySource
+from src.memory.core.memory_encoder import MemoryEncoder
 from src.emotion.core.emotion_manager import EmotionManager
 from src.emotion.core.emotion_analyzer import EmotionAnalyzer
 from src.llm.siliconflow import LLMManager
@@ -11,10 +12,11 @@ def main():
     # 初始化MongoDB客户端
     mongo_client = MongoClient('mongodb://localhost:27017/')
     
-    # 初始化记忆系统
-    memory_manager = MultiSourceMemoryManager()
-    conversation_source = ConversationMemorySource(mongo_client)
-    knowledge_source = KnowledgeMemorySource(mongo_client)
+    # 初始化记忆系统（各记忆源共用一个编码器）
+    encoder = MemoryEncoder()
+    memory_manager = MultiSourceMemoryManager(encoder)
+    conversation_source = ConversationMemorySource(mongo_client, encoder)
+    knowledge_source = KnowledgeMemorySource(mongo_client, encoder)
     memory_manager.register_source(conversation_source)
     memory_manager.register_source(knowledge_source)
     
@@ -0,0 +1,18 @@
+from dataclasses import dataclass
+from typing import List, Dict, Optional
+from src.emotion.models.emotion_analysis import EmotionAnalysis
+from src.memory.models.memory_analysis import MemoryAnalysis
+
+@dataclass
+class PreparedTurn:
+    """已完成分析和检索、等待生成回复的一轮对话"""
+    user_id: str                                # 用户ID
+    user_input: str                             # 用户输入
+    personality_traits: Dict[str, float]        # 性格特征
+    messages: List[Dict[str, str]]              # 发送给LLM的消息列表
+    temperature: float                          # 温度参数
+    max_tokens: int                             # 最大token数
+    emotion_analysis: EmotionAnalysis           # 本轮输入的情感分析
+    current_emotion: EmotionAnalysis            # 更新后的情感状态
+    memory_context: str                         # 记忆上下文
+    memory_analysis: Optional[MemoryAnalysis] = None  # 合并分析得到的记忆重要性（可选）
@@ -1,4 +1,5 @@
 from .core.emotion_manager import EmotionManager
 from .core.emotion_analyzer import EmotionAnalyzer
+from .core.emotion_ticker import EmotionTicker
  
-__all__ = ['EmotionManager', 'EmotionAnalyzer'] 
\ No newline at end of file
+__all__ = ['EmotionManager', 'EmotionAnalyzer', 'EmotionTicker'] 
\ No newline at end of file
@@ -1,23 +1,130 @@
-from typing import Dict, Any, List, Optional, Tuple
+from typing import Dict, Any, List, Optional, Tuple, TYPE_CHECKING
 import json
+import time
+import threading
+from dataclasses import replace
 from datetime import datetime, timedelta
+import numpy as np
 from ..models.emotion_analysis import EmotionAnalysis
 from config.emotion_config import EMOTION_STATES, EMOTION_UPDATE_PARAMS
 from src.llm.siliconflow import SiliconFlow
 from src.llm.base import BaseLLM
+from src.utils.analysis_cache import AnalysisCache, get_analysis_cache
+from src.utils.keyword_automaton import get_keyword_automaton
+from src.utils.label_log import log_analysis_label
+
+if TYPE_CHECKING:
+    from src.memory.core.embedding_classifier import EmotionEmbeddingClassifier
 
 class EmotionAnalyzer:
     """情感分析器：分析对话内容和用户行为"""
-    def __init__(self, llm: Optional[BaseLLM] = None):
+    # 提示词版本：修改提示词时需要更新，使旧的缓存结果失效
+    PROMPT_VERSION = 'v1'
+    
+    def __init__(self,
+                 llm: Optional[BaseLLM] = None,
+                 cache: Optional[AnalysisCache] = None,
+                 local_classifier: Optional['EmotionEmbeddingClassifier'] = None):
         self.llm = llm or SiliconFlow()
         self.emotion_states = EMOTION_STATES
         self.update_params = EMOTION_UPDATE_PARAMS
+        self.cache = cache or get_analysis_cache()
+        # 可选：基于嵌入向量的本地分类器，未配置时使用关键词分析
+        self.local_classifier = local_classifier
+        
+        # 本地分析置信度达到该阈值时不再调用LLM
+        self.confidence_threshold = self.update_params['analysis']['confidence_threshold']
+        
+        # 分级分析统计
+        self._tier_lock = threading.Lock()
+        self._tier_stats = {
+            'local_turns': 0,
+            'llm_turns': 0,
+            'local_latency': 0.0,
+            'llm_latency': 0.0
+        }
+        
+    def analyze_emotion(self,
+                        text: str,
+                        user_behavior: Optional[Dict[str, Any]] = None,
+                        embedding: Optional[np.ndarray] = None) -> EmotionAnalysis:
+        """分级情感分析：先走本地快速分析，置信度不足时才调用LLM"""
+        user_behavior = user_behavior or {}
+        
+        start = time.perf_counter()
+        local_analysis = self._local_analysis(text, user_behavior, embedding)
+        local_latency = time.perf_counter() - start
+        
+        if local_analysis.confidence >= self.confidence_threshold:
+            self._record_tier('local', local_latency)
+            return local_analysis
+            
+        start = time.perf_counter()
+        analysis = self.analyze_conversation(text, user_behavior)
+        self._record_tier('llm', local_latency + time.perf_counter() - start)
+        return analysis
+        
+    def _local_analysis(self,
+                        text: str,
+                        user_behavior: Dict[str, Any],
+                        embedding: Optional[np.ndarray] = None) -> EmotionAnalysis:
+        """本地情感分析：优先使用向量分类器，否则使用关键词分析"""
+        if self.local_classifier is None:
+            return self._simple_analysis(text, user_behavior)
+            
+        analysis = self.local_classifier.classify(text, embedding)
+        return replace(analysis, eq_score=self._calculate_eq_score(user_behavior))
+        
+    def _record_tier(self, tier: str, latency: float) -> None:
+        """记录分级分析的命中情况和耗时"""
+        with self._tier_lock:
+            self._tier_stats[f'{tier}_turns'] += 1
+            self._tier_stats[f'{tier}_latency'] += latency
+            
+    def get_tier_stats(self) -> Dict[str, Any]:
+        """获取分级分析统计：本地命中率和节省的耗时"""
+        with self._tier_lock:
+            stats = dict(self._tier_stats)
+            
+        total_turns = stats['local_turns'] + stats['llm_turns']
+        avg_local = stats['local_latency'] / stats['local_turns'] if stats['local_turns'] else 0.0
+        avg_llm = stats['llm_latency'] / stats['llm_turns'] if stats['llm_turns'] else 0.0
+        
+        return {
+            **stats,
+            'total_turns': total_turns,
+            'local_rate': stats['local_turns'] / total_turns if total_turns else 0.0,
+            'avg_local_latency': avg_local,
+            'avg_llm_latency': avg_llm,
+            # 以LLM路径的平均耗时估算本地路径节省的时间
+            'saved_latency': max(0.0, stats['local_turns'] * (avg_llm - avg_local))
+        }
         
     def analyze_conversation(self, 
                            conversation: str,
                            user_behavior: Dict[str, Any]) -> EmotionAnalysis:
         """分析对话内容和用户行为"""
-        # 使用LLM分析对话内容的情感倾向
+        # 相同输入和相近行为模式的分析结果直接复用
+        cache_key = self.cache.make_key(
+            'emotion_analyzer',
+            self.PROMPT_VERSION,
+            conversation,
+            self._behavior_bucket(user_behavior)
+        )
+        analysis = self.cache.get_or_compute(
+            cache_key,
+            lambda: self._llm_analysis(conversation, user_behavior)
+        )
+        
+        if analysis is None:
+            # 如果LLM分析失败，使用基于关键词的简单分析
+            return self._simple_analysis(conversation, user_behavior)
+        return analysis
+        
+    def _llm_analysis(self,
+                      conversation: str,
+                      user_behavior: Dict[str, Any]) -> Optional[EmotionAnalysis]:
+        """使用LLM分析对话内容的情感倾向，失败时返回None"""
         prompt = self._create_emotion_analysis_prompt(conversation, user_behavior)
         
         # 构建消息列表
@@ -40,21 +147,45 @@ class EmotionAnalyzer:
         )
         
         if not response or 'choices' not in response or not response['choices']:
-            # 如果LLM分析失败，使用基于关键词的简单分析
-            return self._simple_analysis(conversation, user_behavior)
+            return None
             
         try:
             # 解析LLM返回的JSON结果
             result = json.loads(response['choices'][0]['message']['content'])
+            log_analysis_label(
+                'emotion',
+                conversation,
+                result.get('emotion_state', 'neutral'),
+                intensity=result.get('intensity', 0.5)
+            )
             return EmotionAnalysis(
                 emotion_state=result.get('emotion_state', 'neutral'),
                 intensity=result.get('intensity', 0.5),
                 reason=result.get('reason', ''),
                 keywords=result.get('keywords', []),
-                eq_score=result.get('eq_score', 0.5)
+                eq_score=result.get('eq_score', 0.5),
+                confidence=result.get('confidence', 1.0),
+                method='llm'
             )
         except json.JSONDecodeError:
-            return self._simple_analysis(conversation, user_behavior)
+            return None
+            
+    def _behavior_bucket(self, user_behavior: Dict[str, Any]) -> str:
+        """将用户行为粗分桶，分桶边界与情绪商数计算保持一致"""
+        def bucket(value: float, low: float, high: float) -> str:
+            if value < low:
+                return 'low'
+            if value <= high:
+                return 'mid'
+            return 'high'
+            
+        return '|'.join([
+            bucket(user_behavior.get('conversation_frequency', 0), 1, 5),
+            bucket(user_behavior.get('avg_duration', 0), 5, 30),
+            bucket(user_behavior.get('avg_interval', 0), 1, 10),
+            str(user_behavior.get('time_of_day', 'unknown')),
+            str(user_behavior.get('conversation_cycle', 'unknown'))
+        ])
             
     def _create_emotion_analysis_prompt(self, 
                                       conversation: str,
@@ -91,10 +222,11 @@ class EmotionAnalyzer:
                         conversation: str,
                         user_behavior: Dict[str, Any]) -> EmotionAnalysis:
         """基于关键词的简单分析"""
-        # 检查情感关键词
+        # 一次扫描统计所有情感的关键词命中数
+        keyword_counts = get_keyword_automaton().count(conversation)
         emotion_scores = {}
         for state, config in self.emotion_states.items():
-            score = sum(1 for keyword in config['keywords'] if keyword in conversation)
+            score = keyword_counts.get(f'emotion.{state}', 0)
             emotion_scores[state] = score / len(config['keywords'])
             
         # 选择得分最高的情感状态
@@ -111,9 +243,26 @@ class EmotionAnalyzer:
             intensity=intensity,
             reason="基于关键词分析",
             keywords=[k for k, v in emotion_scores.items() if v > 0],
-            eq_score=eq_score
+            eq_score=eq_score,
+            confidence=self._keyword_confidence(emotion_scores, max_emotion[0]),
+            method='keyword'
         )
         
+    def _keyword_confidence(self, emotion_scores: Dict[str, float], top_state: str) -> float:
+        """计算关键词分析的置信度"""
+        total = sum(emotion_scores.values())
+        if total <= 0:
+            return 0.0
+            
+        # 最高分情感的占比：多种情感同时命中时置信度降低
+        share = emotion_scores[top_state] / total
+        
+        # 命中的关键词越多，证据越充分
+        hits = round(emotion_scores[top_state] * len(self.emotion_states[top_state]['keywords']))
+        evidence = min(1.0, 0.5 + 0.25 * hits)
+        
+        return share * evidence
+        
     def _calculate_eq_score(self, user_behavior: Dict[str, Any]) -> float:
         """计算情绪商数"""
         # 基础分数
@@ -1,30 +1,69 @@
 from typing import Dict, Any, List, Optional
+import threading
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from pymongo import MongoClient
 from ..models.emotion_analysis import EmotionAnalysis
 from .emotion_analyzer import EmotionAnalyzer
 from config.emotion_config import EmotionConfig
 
+def decay_intensity(intensity, elapsed: float, decay_params: Dict[str, Any], duration: float):
+    """按经过的时间计算衰减后的情感强度，标量和NumPy数组均适用
+
+    每经过duration秒，高出最小强度的部分按base_rate衰减一次；低于最小强度的不再衰减。
+    """
+    floor = decay_params['min_intensity']
+    retention = (1 - decay_params['base_rate']) ** (elapsed / duration)
+    excess = intensity - floor
+    return intensity - excess * (1 - retention) * (excess > 0)
+
+def to_bson_datetime(value: datetime) -> datetime:
+    """截断到毫秒：BSON日期只保存到毫秒，写入前统一精度，缓存中的值才与从数据库读回的值相等"""
+    return value.replace(microsecond=value.microsecond // 1000 * 1000)
+
 class EmotionManager:
     """情感管理器：管理情感状态和用户行为"""
-    def __init__(self, config: EmotionConfig):
+    # 情感状态文档中需要读取的字段
+    STATE_PROJECTION = {
+        '_id': 0,
+        'emotion_state': 1,
+        'intensity': 1,
+        'reason': 1,
+        'keywords': 1,
+        'eq_score': 1,
+        'timestamp': 1,
+        'decayed_at': 1
+    }
+    
+    def __init__(self, config: EmotionConfig, mongo_client: Optional[MongoClient] = None):
         self.config = config
-        self.mongo_client = MongoClient()
+        # 未指定时连接默认的本地MongoDB
+        self.mongo_client = mongo_client or MongoClient()
         self.db = self.mongo_client['chatbot_db']
         self.emotion_collection = self.db['emotion_states']
         self.behavior_collection = self.db['user_behaviors']
+        # 按时间分桶预聚合的用户行为统计，每个用户一个文档
+        self.behavior_stats_collection = self.db['user_behavior_stats']
+        self.behavior_stats_collection.create_index('user_id', unique=True)
         self.analyzer = EmotionAnalyzer()
         self.emotion_states = config.emotion_states
         self.update_params = config.update_params
         self.expressions = config.expressions
         
+        # 进程内情感状态缓存，写操作同步写穿到MongoDB
+        # user_id -> 情感状态文档；None表示数据库中没有该用户的记录
+        # 按最近访问排序，超过config.max_cached_states时释放最久未访问的用户
+        self._state_cache: 'OrderedDict[str, Optional[Dict[str, Any]]]' = OrderedDict()
+        self._state_lock = threading.Lock()
+        
     def update_emotion(self, 
                       user_id: str,
                       conversation: str,
                       timestamp: datetime) -> EmotionAnalysis:
         """更新情感状态"""
-        # 获取用户行为数据
-        user_behavior = self._get_user_behavior(user_id, timestamp)
+        # 获取用户行为数据（只读取一次预聚合统计）
+        behavior_stats = self._load_behavior_stats(user_id)
+        user_behavior = self._get_user_behavior(user_id, timestamp, behavior_stats)
         
         # 分析对话内容和用户行为
         analysis = self.analyzer.analyze_conversation(conversation, user_behavior)
@@ -39,20 +78,47 @@ class EmotionManager:
         self._update_emotion_state(user_id, new_emotion, timestamp)
         
         # 更新用户行为
-        self._update_user_behavior(user_id, timestamp)
+        self._update_user_behavior(user_id, timestamp, behavior_stats)
         
         return new_emotion
         
-    def _get_user_behavior(self, user_id: str, timestamp: datetime) -> Dict[str, Any]:
+    def _load_behavior_stats(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """读取用户的预聚合行为统计"""
+        return self.behavior_stats_collection.find_one(
+            {'user_id': user_id},
+            {'_id': 0, 'buckets': 1, 'last_timestamp': 1}
+        )
+        
+    def _bucket_key(self, timestamp: datetime) -> str:
+        """计算时间戳所属的时间桶"""
+        return str(int(timestamp.timestamp()) // self.config.behavior_bucket_seconds)
+        
+    def _window_start_bucket(self, timestamp: datetime) -> int:
+        """计算统计窗口内最早的时间桶"""
+        start_time = timestamp - timedelta(seconds=self.config.behavior_window_seconds)
+        return int(start_time.timestamp()) // self.config.behavior_bucket_seconds
+        
+    def _get_user_behavior(self,
+                           user_id: str,
+                           timestamp: datetime,
+                           behavior_stats: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """获取用户行为数据"""
-        # 获取最近24小时的行为数据
-        start_time = timestamp - timedelta(days=1)
-        behaviors = list(self.behavior_collection.find({
-            'user_id': user_id,
-            'timestamp': {'$gte': start_time}
-        }))
-        
-        if not behaviors:
+        if behavior_stats is None:
+            behavior_stats = self._load_behavior_stats(user_id)
+            
+        # 汇总统计窗口（默认最近24小时）内的时间桶
+        frequency = 0
+        total_duration = 0.0
+        total_intervals = 0.0
+        if behavior_stats:
+            start_bucket = self._window_start_bucket(timestamp)
+            for bucket_key, bucket in behavior_stats.get('buckets', {}).items():
+                if int(bucket_key) >= start_bucket:
+                    frequency += bucket.get('count', 0)
+                    total_duration += bucket.get('duration', 0)
+                    total_intervals += bucket.get('interval', 0)
+                    
+        if frequency == 0:
             return {
                 'conversation_frequency': 0,
                 'avg_duration': 0,
@@ -61,22 +127,74 @@ class EmotionManager:
                 'conversation_cycle': 'unknown'
             }
             
-        # 计算行为指标
-        total_duration = sum(b['duration'] for b in behaviors)
-        total_intervals = sum(b['interval'] for b in behaviors)
-        frequency = len(behaviors)
-        
+        avg_interval = total_intervals / frequency
         return {
             'conversation_frequency': frequency,
-            'avg_duration': total_duration / frequency if frequency > 0 else 0,
-            'avg_interval': total_intervals / frequency if frequency > 0 else 0,
+            'avg_duration': total_duration / frequency,
+            'avg_interval': avg_interval,
             'time_of_day': self._get_time_of_day(timestamp),
-            'conversation_cycle': self._get_conversation_cycle(behaviors)
+            'conversation_cycle': self._get_conversation_cycle(avg_interval)
         }
         
     def _get_current_emotion(self, user_id: str) -> EmotionAnalysis:
         """获取当前情感状态"""
-        emotion_doc = self.emotion_collection.find_one({'user_id': user_id})
+        return self.get_emotion(user_id)
+        
+    def _load_emotion_doc(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """读取情感状态文档：优先使用缓存，未命中时查询一次数据库"""
+        with self._state_lock:
+            if user_id in self._state_cache:
+                self._state_cache.move_to_end(user_id)
+                return self._state_cache[user_id]
+                
+        emotion_doc = self.emotion_collection.find_one(
+            {'user_id': user_id},
+            self.STATE_PROJECTION
+        )
+        
+        with self._state_lock:
+            # 查询期间可能已有写入，以缓存中的最新状态为准
+            if user_id in self._state_cache:
+                return self._state_cache[user_id]
+            self._put_cached_doc(user_id, emotion_doc)
+            return emotion_doc
+            
+    def _cache_emotion_doc(self, user_id: str, emotion_doc: Dict[str, Any]) -> None:
+        """更新缓存中的情感状态文档"""
+        with self._state_lock:
+            self._put_cached_doc(user_id, emotion_doc)
+            
+    def _put_cached_doc(self, user_id: str, emotion_doc: Optional[Dict[str, Any]]) -> None:
+        """写入缓存并淘汰超出容量的最久未访问用户（调用方持有锁）"""
+        self._state_cache[user_id] = emotion_doc
+        self._state_cache.move_to_end(user_id)
+        while len(self._state_cache) > self.config.max_cached_states:
+            self._state_cache.popitem(last=False)
+            
+    def invalidate_emotion_cache(self, user_id: Optional[str] = None) -> None:
+        """清除指定用户或全部用户的情感状态缓存"""
+        with self._state_lock:
+            if user_id is None:
+                self._state_cache.clear()
+            else:
+                self._state_cache.pop(user_id, None)
+                
+    def apply_cached_updates(self, updates: Dict[str, Any]) -> None:
+        """同步批量更新（如定时衰减）写入的字段到缓存
+
+        updates: user_id -> (原始timestamp, 更新字段)；缓存中的状态已被新的用户更新覆盖时跳过。
+        """
+        with self._state_lock:
+            for user_id, (timestamp, fields) in updates.items():
+                emotion_doc = self._state_cache.get(user_id)
+                if emotion_doc and emotion_doc.get('timestamp') == timestamp:
+                    self._state_cache[user_id] = {**emotion_doc, **fields}
+                    
+    def get_emotion(self,
+                    user_id: str = "default",
+                    now: Optional[datetime] = None) -> EmotionAnalysis:
+        """获取完整的当前情感状态，情感强度按上次衰减（或更新）时间惰性衰减"""
+        emotion_doc = self._load_emotion_doc(user_id)
         if not emotion_doc:
             return EmotionAnalysis(
                 emotion_state='neutral',
@@ -86,9 +204,20 @@ class EmotionManager:
                 eq_score=0.5
             )
             
+        intensity = emotion_doc['intensity']
+        decayed_at = emotion_doc.get('decayed_at') or emotion_doc.get('timestamp')
+        if decayed_at is not None:
+            elapsed = max(0.0, ((now or datetime.now()) - decayed_at).total_seconds())
+            intensity = decay_intensity(
+                intensity,
+                elapsed,
+                self.update_params['decay'],
+                self.config.emotion_duration
+            )
+            
         return EmotionAnalysis(
             emotion_state=emotion_doc['emotion_state'],
-            intensity=emotion_doc['intensity'],
+            intensity=intensity,
             reason=emotion_doc['reason'],
             keywords=emotion_doc['keywords'],
             eq_score=emotion_doc['eq_score']
@@ -98,8 +227,8 @@ class EmotionManager:
                              current: EmotionAnalysis,
                              new: EmotionAnalysis) -> EmotionAnalysis:
         """计算新的情感状态"""
-        # 应用情感衰减
-        decayed_intensity = current.intensity * (1 - self.update_params.decay_rate)
+        # 当前强度在读取时已按经过的时间衰减
+        decayed_intensity = current.intensity
         
         # 计算新的情感强度
         new_intensity = (decayed_intensity + new.intensity) / 2
@@ -132,45 +261,92 @@ class EmotionManager:
                             user_id: str,
                             emotion: EmotionAnalysis,
                             timestamp: datetime) -> None:
-        """更新情感状态"""
+        """更新情感状态（写穿：先写数据库，再更新缓存）"""
+        timestamp = to_bson_datetime(timestamp)
+        emotion_doc = {
+            'emotion_state': emotion.emotion_state,
+            'intensity': emotion.intensity,
+            'reason': emotion.reason,
+            'keywords': emotion.keywords,
+            'eq_score': emotion.eq_score,
+            'timestamp': timestamp,
+            'decayed_at': timestamp
+        }
         self.emotion_collection.update_one(
             {'user_id': user_id},
-            {
-                '$set': {
-                    'emotion_state': emotion.emotion_state,
-                    'intensity': emotion.intensity,
-                    'reason': emotion.reason,
-                    'keywords': emotion.keywords,
-                    'eq_score': emotion.eq_score,
-                    'timestamp': timestamp
-                }
-            },
+            {'$set': emotion_doc},
             upsert=True
         )
+        self._cache_emotion_doc(user_id, emotion_doc)
         
-    def _update_user_behavior(self, user_id: str, timestamp: datetime) -> None:
-        """更新用户行为"""
-        # 获取上一次行为记录
-        last_behavior = self.behavior_collection.find_one(
-            {'user_id': user_id},
-            sort=[('timestamp', -1)]
+    def update_emotion_state(self,
+                             user_id: str,
+                             emotion_state: str,
+                             intensity: float,
+                             metadata: Optional[Dict[str, Any]] = None) -> EmotionAnalysis:
+        """直接设置情感状态，未指定的字段沿用当前状态"""
+        metadata = metadata or {}
+        current = self.get_emotion(user_id)
+        emotion = EmotionAnalysis(
+            emotion_state=emotion_state,
+            intensity=max(0.0, min(1.0, intensity)),
+            reason=metadata.get('reason', current.reason),
+            keywords=metadata.get('keywords', current.keywords),
+            eq_score=metadata.get('eq_score', current.eq_score)
         )
+        self._update_emotion_state(user_id, emotion, datetime.now())
+        return emotion
         
-        if last_behavior:
+    def _update_user_behavior(self,
+                              user_id: str,
+                              timestamp: datetime,
+                              behavior_stats: Optional[Dict[str, Any]] = None) -> None:
+        """更新用户行为：原子地累加当前时间桶的统计"""
+        if behavior_stats is None:
+            behavior_stats = self._load_behavior_stats(user_id)
+            
+        last_timestamp = behavior_stats.get('last_timestamp') if behavior_stats else None
+        if last_timestamp:
             # 计算时间间隔
-            interval = (timestamp - last_behavior['timestamp']).total_seconds()
+            interval = max(0.0, (timestamp - last_timestamp).total_seconds())
         else:
             interval = 0
             
-        # 创建新的行为记录
-        behavior_record = {
-            'user_id': user_id,
-            'timestamp': timestamp,
-            'interval': interval,
-            'duration': 0  # 将在对话结束时更新
+        bucket_key = self._bucket_key(timestamp)
+        update = {
+            '$inc': {
+                f'buckets.{bucket_key}.count': 1,
+                f'buckets.{bucket_key}.interval': interval,
+                f'buckets.{bucket_key}.duration': 0  # 将在对话结束时更新
+            },
+            '$max': {'last_timestamp': timestamp}
         }
         
-        self.behavior_collection.insert_one(behavior_record)
+        # 顺带清理已滑出统计窗口的时间桶
+        if behavior_stats:
+            start_bucket = self._window_start_bucket(timestamp)
+            stale_buckets = {
+                f'buckets.{key}': ''
+                for key in behavior_stats.get('buckets', {})
+                if int(key) < start_bucket
+            }
+            if stale_buckets:
+                update['$unset'] = stale_buckets
+                
+        self.behavior_stats_collection.update_one(
+            {'user_id': user_id},
+            update,
+            upsert=True
+        )
+        
+        # 原始行为日志（可选）
+        if self.config.log_raw_behaviors:
+            self.behavior_collection.insert_one({
+                'user_id': user_id,
+                'timestamp': timestamp,
+                'interval': interval,
+                'duration': 0
+            })
         
     def _get_time_of_day(self, timestamp: datetime) -> str:
         """获取时间段"""
@@ -184,15 +360,8 @@ class EmotionManager:
         else:
             return 'late_night'
             
-    def _get_conversation_cycle(self, behaviors: List[Dict[str, Any]]) -> str:
-        """获取对话周期"""
-        if not behaviors:
-            return 'unknown'
-            
-        # 计算平均间隔
-        intervals = [b['interval'] for b in behaviors]
-        avg_interval = sum(intervals) / len(intervals)
-        
+    def _get_conversation_cycle(self, avg_interval: float) -> str:
+        """根据平均间隔获取对话周期"""
         if avg_interval < 3600:  # 1小时内
             return 'frequent'
         elif avg_interval < 86400:  # 24小时内
@@ -208,14 +377,8 @@ class EmotionManager:
         
     def get_emotion_state(self, user_id: str = "default") -> str:
         """获取当前情感状态"""
-        emotion_doc = self.emotion_collection.find_one({'user_id': user_id})
-        if not emotion_doc:
-            return 'neutral'
-        return emotion_doc['emotion_state']
+        return self.get_emotion(user_id).emotion_state
         
     def get_emotion_intensity(self, user_id: str = "default") -> float:
         """获取当前情感强度"""
-        emotion_doc = self.emotion_collection.find_one({'user_id': user_id})
-        if not emotion_doc:
-            return 0.5
-        return emotion_doc['intensity'] 
\ No newline at end of file
+        return self.get_emotion(user_id).intensity 
\ No newline at end of file
@@ -1,22 +1,130 @@
 from typing import Dict, Any, List, Optional, Tuple
+import json
+import threading
+from collections import OrderedDict, deque
 from datetime import datetime, timedelta
+import numpy as np
 from ..models.emotion_analysis import EmotionAnalysis
-from config.emotion_config import EMOTION_STATES, PERSONALITY_TRAITS
+from config.emotion_config import EMOTION_STATES, EMOTION_UPDATE_PARAMS
 from src.llm.siliconflow import SiliconFlow
 from src.llm.base import BaseLLM
+from src.utils.analysis_cache import AnalysisCache, get_analysis_cache
+from src.utils.keyword_automaton import get_keyword_automaton
 
+class EmotionWindow:
+    """单个对话的情感关键词滑动窗口：保存每条消息的得分向量和窗口内的累计得分
+
+    consumed记录已读入的对话历史条数，每条新消息只计算一次得分，移出窗口时减去其得分，
+    每轮的开销只与新消息有关，与窗口大小无关。
+    """
+    def __init__(self, size: int, num_states: int):
+        self.size = size
+        self.messages = deque()
+        self.scores = deque()
+        self.totals = np.zeros(num_states)
+        self.consumed = 0
+        
+    def push(self, message: str, score_fn) -> np.ndarray:
+        """追加一条新消息，超出窗口大小时移出最早的一条"""
+        self.consumed += 1
+        if self.size <= 0:
+            return self.totals
+        scores = score_fn(message)
+        self.messages.append(message)
+        self.scores.append(scores)
+        self.totals += scores
+        if len(self.messages) > self.size:
+            self.messages.popleft()
+            self.totals -= self.scores.popleft()
+        return self.totals
+        
+    def sync(self, history: List[str], score_fn) -> np.ndarray:
+        """读入对话历史中尚未读入的消息（history为只追加的完整对话历史）
+
+        历史变短或已读入的最后一条消息对不上时（如对话被清空后重新开始），按最近size条重建窗口。
+        """
+        if (len(history) < self.consumed
+                or (self.consumed and self.messages and history[self.consumed - 1] != self.messages[-1])):
+            self.reset()
+        if len(history) - self.consumed >= self.size:
+            # 新消息已填满窗口，窗口内原有的消息和更早的新消息都会被移出，无需计算
+            self.reset()
+            self.consumed = max(0, len(history) - self.size)
+            
+        for message in history[self.consumed:]:
+            self.push(message, score_fn)
+            
+        if not self.messages:
+            # 窗口清空时重置，避免浮点误差累积
+            self.totals[:] = 0.0
+        return self.totals
+        
+    def reset(self) -> None:
+        self.messages.clear()
+        self.scores.clear()
+        self.totals[:] = 0.0
+        self.consumed = 0
+        
 class EmotionReasoner:
     """情感推理器：进行情感推理和情绪商数调整"""
-    def __init__(self, llm: Optional[BaseLLM] = None):
+    # 提示词版本：修改提示词时需要更新，使旧的缓存结果失效
+    PROMPT_VERSION = 'v1'
+    
+    def __init__(self,
+                 llm: Optional[BaseLLM] = None,
+                 cache: Optional[AnalysisCache] = None):
         self.llm = llm or SiliconFlow()
         self.emotion_states = EMOTION_STATES
-        self.personality_traits = PERSONALITY_TRAITS
+        self.cache = cache or get_analysis_cache()
+        
+        # 按对话保存的关键词滑动窗口，超过上限时淘汰最久未使用的对话
+        reasoning_params = EMOTION_UPDATE_PARAMS['reasoning']
+        self.history_window = reasoning_params['history_window']
+        self.max_conversations = reasoning_params['max_conversations']
+        self.state_names = list(self.emotion_states.keys())
+        self.keyword_counts = np.array([
+            len(config['keywords']) for config in self.emotion_states.values()
+        ], dtype=float)
+        self._windows: 'OrderedDict[str, EmotionWindow]' = OrderedDict()
+        self._windows_lock = threading.Lock()
         
     def reason_emotion(self,
                       current_emotion: EmotionAnalysis,
                       conversation_history: List[str],
-                      personality: Dict[str, float]) -> Tuple[EmotionAnalysis, float]:
-        """进行情感推理"""
+                      personality: Dict[str, float],
+                      conversation_id: Optional[str] = None) -> Tuple[EmotionAnalysis, float]:
+        """进行情感推理
+
+        指定conversation_id时，规则推理会复用该对话的滑动窗口统计，只扫描新消息；
+        此时conversation_history应为该对话只追加的完整历史。
+        """
+        # 相同对话窗口和相近情感状态的推理结果直接复用
+        cache_key = self.cache.make_key(
+            'emotion_reasoner',
+            self.PROMPT_VERSION,
+            '\n'.join(self._recent_history(conversation_history)),
+            self._state_bucket(current_emotion, personality)
+        )
+        result = self.cache.get_or_compute(
+            cache_key,
+            lambda: self._llm_reasoning(current_emotion, conversation_history, personality)
+        )
+        
+        if result is None:
+            # 如果LLM推理失败，使用基于规则的简单推理
+            return self._simple_reasoning(
+                current_emotion,
+                conversation_history,
+                personality,
+                conversation_id
+            )
+        return result
+        
+    def _llm_reasoning(self,
+                       current_emotion: EmotionAnalysis,
+                       conversation_history: List[str],
+                       personality: Dict[str, float]) -> Optional[Tuple[EmotionAnalysis, float]]:
+        """使用LLM进行情感推理，失败时返回None"""
         # 创建推理提示词
         prompt = self._create_reasoning_prompt(
             current_emotion,
@@ -44,12 +152,7 @@ class EmotionReasoner:
         )
         
         if not response or 'choices' not in response or not response['choices']:
-            # 如果LLM推理失败，使用基于规则的简单推理
-            return self._simple_reasoning(
-                current_emotion,
-                conversation_history,
-                personality
-            )
+            return None
             
         try:
             # 解析LLM返回的JSON结果
@@ -70,11 +173,25 @@ class EmotionReasoner:
             return new_emotion, eq_adjustment
             
         except json.JSONDecodeError:
-            return self._simple_reasoning(
-                current_emotion,
-                conversation_history,
-                personality
-            )
+            return None
+            
+    def _recent_history(self, conversation_history: List[str]) -> List[str]:
+        """取参与推理的最近消息"""
+        if self.history_window <= 0:
+            return []
+        return conversation_history[-self.history_window:]
+        
+    def _state_bucket(self,
+                      current_emotion: EmotionAnalysis,
+                      personality: Dict[str, float]) -> str:
+        """将当前情感状态和性格特征粗分桶"""
+        traits = ','.join(f'{k}:{v:.1f}' for k, v in sorted(personality.items()))
+        return '|'.join([
+            current_emotion.emotion_state,
+            f'{current_emotion.intensity:.1f}',
+            f'{current_emotion.eq_score:.1f}',
+            traits
+        ])
             
     def _create_reasoning_prompt(self,
                                current_emotion: EmotionAnalysis,
@@ -94,7 +211,7 @@ class EmotionReasoner:
 {', '.join([f'{k}: {v:.2f}' for k, v in personality.items()])}
 
 最近对话历史：
-{chr(10).join(conversation_history[-5:])}
+{chr(10).join(self._recent_history(conversation_history))}
 
 请考虑以下因素：
 1. 对话的情感发展
@@ -115,10 +232,11 @@ class EmotionReasoner:
     def _simple_reasoning(self,
                          current_emotion: EmotionAnalysis,
                          conversation_history: List[str],
-                         personality: Dict[str, float]) -> Tuple[EmotionAnalysis, float]:
+                         personality: Dict[str, float],
+                         conversation_id: Optional[str] = None) -> Tuple[EmotionAnalysis, float]:
         """基于规则的简单推理"""
         # 分析最近对话的情感倾向
-        emotion_scores = self._analyze_conversation_emotion(conversation_history[-5:])
+        emotion_scores = self._analyze_conversation_emotion(conversation_history, conversation_id)
         
         # 根据性格特征调整情感
         adjusted_emotion = self._adjust_emotion_by_personality(
@@ -136,15 +254,20 @@ class EmotionReasoner:
         
         return adjusted_emotion, eq_adjustment
         
-    def _analyze_conversation_emotion(self, conversations: List[str]) -> Dict[str, float]:
-        """分析对话情感倾向"""
-        emotion_scores = {state: 0.0 for state in self.emotion_states.keys()}
-        
-        for conversation in conversations:
-            for state, config in self.emotion_states.items():
-                score = sum(1 for keyword in config['keywords'] if keyword in conversation)
-                emotion_scores[state] += score / len(config['keywords'])
+    def _analyze_conversation_emotion(self,
+                                      conversations: List[str],
+                                      conversation_id: Optional[str] = None) -> Dict[str, float]:
+        """分析最近对话的情感倾向，有conversation_id时增量更新该对话的滑动窗口"""
+        if conversation_id is None:
+            window = EmotionWindow(self.history_window, len(self.state_names))
+            totals = window.sync(conversations, self._message_scores)
+        else:
+            window = self._get_window(conversation_id)
+            with self._windows_lock:
+                totals = window.sync(conversations, self._message_scores).copy()
                 
+        emotion_scores = {state: float(score) for state, score in zip(self.state_names, totals)}
+        
         # 归一化分数
         total = sum(emotion_scores.values())
         if total > 0:
@@ -152,6 +275,35 @@ class EmotionReasoner:
             
         return emotion_scores
         
+    def _message_scores(self, message: str) -> np.ndarray:
+        """计算单条消息的情感得分向量，每条消息只扫描一次"""
+        keyword_counts = get_keyword_automaton().count(message)
+        counts = np.array([
+            keyword_counts.get(f'emotion.{state}', 0) for state in self.state_names
+        ], dtype=float)
+        return counts / self.keyword_counts
+        
+    def _get_window(self, conversation_id: str) -> EmotionWindow:
+        """获取对话的滑动窗口，不存在时创建"""
+        with self._windows_lock:
+            window = self._windows.get(conversation_id)
+            if window is None:
+                window = EmotionWindow(self.history_window, len(self.state_names))
+                self._windows[conversation_id] = window
+                while len(self._windows) > self.max_conversations:
+                    self._windows.popitem(last=False)
+            else:
+                self._windows.move_to_end(conversation_id)
+            return window
+            
+    def reset_window(self, conversation_id: Optional[str] = None) -> None:
+        """清除指定对话或全部对话的滑动窗口统计"""
+        with self._windows_lock:
+            if conversation_id is None:
+                self._windows.clear()
+            else:
+                self._windows.pop(conversation_id, None)
+                
     def _adjust_emotion_by_personality(self,
                                      current_emotion: EmotionAnalysis,
                                      emotion_scores: Dict[str, float],
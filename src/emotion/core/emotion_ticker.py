@@ -0,0 +1,160 @@
+from typing import Dict, Any, List, Optional
+import os
+import time
+import threading
+from datetime import datetime, timedelta
+import numpy as np
+from pymongo import UpdateOne
+from .emotion_manager import EmotionManager, decay_intensity, to_bson_datetime
+
+class EmotionTicker:
+    """情感定时更新引擎：对所有活跃用户批量应用情感衰减和马尔可夫转移"""
+    def __init__(self,
+                 emotion_manager: EmotionManager,
+                 interval: Optional[float] = None,
+                 active_window: float = 86400,
+                 seed: Optional[int] = None):
+        self.manager = emotion_manager
+        self.collection = emotion_manager.emotion_collection
+        self.config = emotion_manager.config
+        self.update_params = emotion_manager.update_params
+
+        # 定时间隔（秒）和活跃用户窗口（秒）
+        self.interval = interval or float(os.getenv('EMOTION_UPDATE_INTERVAL', '300'))
+        self.active_window = active_window
+
+        # 编译情感状态索引、转移矩阵和强度区间
+        self.states: List[str] = list(self.config.emotion_states.keys())
+        self.state_index = {state: index for index, state in enumerate(self.states)}
+        self.transition_matrix = self._compile_transition_matrix(self.config.transition_rules)
+        self.cumulative_matrix = np.cumsum(self.transition_matrix, axis=1)
+        self.intensity_low = np.array([
+            self.config.emotion_states[state]['intensity_range'][0] for state in self.states
+        ])
+        self.intensity_high = np.array([
+            self.config.emotion_states[state]['intensity_range'][1] for state in self.states
+        ])
+
+        self.rng = np.random.default_rng(seed)
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _compile_transition_matrix(self, rules: Dict[str, Dict[str, float]]) -> np.ndarray:
+        """将转换规则编译为行随机矩阵，未分配的概率留给保持当前情感"""
+        size = len(self.states)
+        matrix = np.zeros((size, size))
+
+        for source, targets in rules.items():
+            if source not in self.state_index:
+                continue
+            row = self.state_index[source]
+            for target, probability in targets.items():
+                if target in self.state_index:
+                    matrix[row, self.state_index[target]] = probability
+
+        row_sums = matrix.sum(axis=1)
+        for row in range(size):
+            if row_sums[row] > 1.0:
+                matrix[row] /= row_sums[row]
+            else:
+                matrix[row, row] += 1.0 - row_sums[row]
+        return matrix
+
+    def tick(self, now: Optional[datetime] = None) -> Dict[str, Any]:
+        """执行一次批量更新，返回本次更新的统计信息"""
+        now = to_bson_datetime(now or datetime.now())
+        start = time.perf_counter()
+
+        # 1. 读取活跃用户的情感状态
+        docs = list(self.collection.find(
+            {'timestamp': {'$gte': now - timedelta(seconds=self.active_window)}},
+            {'_id': 0, 'user_id': 1, 'emotion_state': 1, 'intensity': 1, 'timestamp': 1, 'decayed_at': 1}
+        ))
+        if not docs:
+            return {'users': 0, 'updated': 0, 'transitions': 0, 'elapsed': time.perf_counter() - start}
+
+        neutral = self.state_index.get('neutral', 0)
+        now_ts = now.timestamp()
+        state = np.array([self.state_index.get(d['emotion_state'], neutral) for d in docs])
+        intensity = np.array([float(d['intensity']) for d in docs])
+        updated_at = np.array([d['timestamp'].timestamp() for d in docs])
+        decayed_at = np.array([(d.get('decayed_at') or d['timestamp']).timestamp() for d in docs])
+
+        # 2. 向量化衰减：从上次衰减时间起计算
+        elapsed = np.maximum(0.0, now_ts - decayed_at)
+        new_intensity = decay_intensity(
+            intensity,
+            elapsed,
+            self.update_params['decay'],
+            self.config.emotion_duration
+        )
+
+        # 3. 马尔可夫转移：情感持续超过最小时长的用户按概率抽样下一个情感
+        transition_params = self.update_params['transition']
+        eligible = (now_ts - updated_at) >= transition_params['min_duration']
+        move_probability = transition_params['transition_probability'] * np.minimum(1.0, elapsed / self.interval)
+        moving = eligible & (self.rng.random(len(docs)) < move_probability)
+
+        draws = self.rng.random(len(docs))[:, None]
+        next_state = (draws > self.cumulative_matrix[state]).sum(axis=1)
+        next_state = np.minimum(next_state, len(self.states) - 1)
+        new_state = np.where(moving, next_state, state)
+
+        # 转移后的强度限制在新情感的强度区间内
+        transitioned = new_state != state
+        new_intensity = np.where(
+            transitioned,
+            np.clip(new_intensity, self.intensity_low[new_state], self.intensity_high[new_state]),
+            new_intensity
+        )
+
+        # 4. 只写回有变化的用户，一次bulk_write
+        changed = transitioned | (np.abs(new_intensity - intensity) > 1e-4)
+        operations = []
+        cache_updates = {}
+        for index in np.flatnonzero(changed):
+            doc = docs[index]
+            fields = {
+                'emotion_state': self.states[new_state[index]],
+                'intensity': float(new_intensity[index]),
+                'decayed_at': now
+            }
+            # 以原始timestamp作为条件，避免覆盖期间发生的用户更新
+            operations.append(UpdateOne(
+                {'user_id': doc['user_id'], 'timestamp': doc['timestamp']},
+                {'$set': fields}
+            ))
+            cache_updates[doc['user_id']] = (doc['timestamp'], fields)
+
+        if operations:
+            self.collection.bulk_write(operations, ordered=False)
+            self.manager.apply_cached_updates(cache_updates)
+
+        return {
+            'users': len(docs),
+            'updated': len(operations),
+            'transitions': int(transitioned.sum()),
+            'elapsed': time.perf_counter() - start
+        }
+
+    def start(self) -> None:
+        """启动后台定时更新线程"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='emotion-ticker', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """停止后台定时更新线程"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.tick()
+            except Exception as e:
+                print(f"\n情感定时更新失败：{str(e)}")
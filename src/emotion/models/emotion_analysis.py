@@ -8,4 +8,6 @@ class EmotionAnalysis:
     intensity: float        # 情感强度（0-1）
     reason: str            # 分析原因
     keywords: List[str]    # 情感关键词
-    eq_score: float        # 情绪商数（0-1） 
\ No newline at end of file
+    eq_score: float        # 情绪商数（0-1）
+    confidence: float = 1.0  # 分析置信度（0-1）
+    method: str = 'llm'      # 分析方式（llm/keyword）
\ No newline at end of file
@@ -1,4 +1,21 @@
 from .base import BaseLLM
 from .siliconflow import SiliconFlow
+from .rate_limiter import (
+    RateLimiter, get_rate_limiter, llm_priority,
+    PRIORITY_INTERACTIVE, PRIORITY_ANALYSIS, PRIORITY_BATCH
+)
+from .resilience import ResilientCaller, CircuitBreaker, CircuitOpenError
 
-__all__ = ['BaseLLM', 'SiliconFlow'] 
\ No newline at end of file
+__all__ = [
+    'BaseLLM',
+    'SiliconFlow',
+    'RateLimiter',
+    'get_rate_limiter',
+    'llm_priority',
+    'PRIORITY_INTERACTIVE',
+    'PRIORITY_ANALYSIS',
+    'PRIORITY_BATCH',
+    'ResilientCaller',
+    'CircuitBreaker',
+    'CircuitOpenError'
+]
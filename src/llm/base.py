@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator
 
 class BaseLLM(ABC):
     """LLM基类，定义所有LLM实现必须实现的接口"""
@@ -24,6 +24,30 @@ class BaseLLM(ABC):
         """
         pass
     
+    def chat_stream(self,
+                    messages: List[Dict[str, str]],
+                    temperature: float = 0.7,
+                    max_tokens: int = 2000) -> Iterator[str]:
+        """
+        流式生成回复，逐段返回新生成的文本
+        
+        默认实现等待完整回复后一次返回，支持流式接口的模型应覆盖此方法。
+        
+        Args:
+            messages: 消息历史列表
+            temperature: 温度参数
+            max_tokens: 最大生成token数
+            
+        Returns:
+            回复文本片段的迭代器
+        """
+        response = self.chat(messages, temperature=temperature, max_tokens=max_tokens)
+        choices = (response or {}).get('choices') or []
+        if choices:
+            content = choices[0].get('message', {}).get('content', '')
+            if content:
+                yield content
+    
     @abstractmethod
     def get_embeddings(self, text: str) -> List[float]:
         """
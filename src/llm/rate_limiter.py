@@ -0,0 +1,212 @@
+from typing import Dict, Any, Optional, Tuple
+import os
+import time
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from src.utils.tracing import get_tracer
+
+# 优先级：数值越小越先获得配额
+PRIORITY_INTERACTIVE = 0   # 面向用户的回复
+PRIORITY_ANALYSIS = 1      # 每轮对话中的情感、记忆分析
+PRIORITY_BATCH = 2         # 后台批量任务（如知识库导入）
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: 'interactive',
+    PRIORITY_ANALYSIS: 'analysis',
+    PRIORITY_BATCH: 'batch'
+}
+
+# 当前LLM调用的(优先级, 用户ID)，未设置时按分析类、不区分用户处理
+_request_context: ContextVar[Tuple[int, Optional[str]]] = ContextVar(
+    'llm_request_context', default=(PRIORITY_ANALYSIS, None)
+)
+
+@contextmanager
+def llm_priority(priority: int, user_id: Optional[str] = None):
+    """设置上下文中LLM调用的优先级和所属用户
+
+    上下文变量不会传入线程池，需在实际发起调用的线程中设置。
+    """
+    token = _request_context.set((priority, user_id))
+    try:
+        yield
+    finally:
+        _request_context.reset(token)
+
+class TokenBucket:
+    """令牌桶：容量为每分钟配额，按配额/60每秒匀速补充，余额可以为负（实际用量超出预留时）"""
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """余额达到amount还需等待的秒数（调用前先refill）"""
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+class _Waiter:
+    __slots__ = ('tokens', 'priority', 'user_key', 'enqueued')
+
+    def __init__(self, tokens: float, priority: int, user_key: str):
+        self.tokens = tokens
+        self.priority = priority
+        self.user_key = user_key
+        self.enqueued = time.monotonic()
+
+class RateGrant:
+    """一次已获得配额的调用；拿到实际token用量后调用settle修正预留量"""
+    __slots__ = ('limiter', 'reserved', 'wait')
+
+    def __init__(self, limiter: Optional['RateLimiter'], reserved: float, wait: float):
+        self.limiter = limiter
+        self.reserved = reserved
+        self.wait = wait
+
+    def settle(self, actual_tokens: Optional[float]) -> None:
+        if self.limiter is None or actual_tokens is None:
+            return
+        self.limiter._adjust_tokens(self.reserved - actual_tokens)
+        self.reserved = actual_tokens
+
+_NOOP_GRANT = RateGrant(None, 0.0, 0.0)
+
+class RateLimiter:
+    """LLM调用的请求数和token数限流
+
+    请求数和token数各用一个令牌桶（每分钟配额）。等待的调用先按优先级排队，
+    同一优先级内按用户轮转，每个用户的调用按先后顺序，避免单个用户的大量请求占满配额。
+    调用前按提示词估算值加max_tokens预留token，返回后用实际用量修正。
+    关闭时acquire直接返回。
+    """
+    def __init__(self,
+                 enabled: bool = False,
+                 requests_per_minute: float = 60,
+                 tokens_per_minute: float = 0):
+        self.enabled = enabled
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        # 每个优先级：用户 -> 该用户等待中的调用（OrderedDict的顺序即轮转顺序）
+        self._queues: Dict[int, 'OrderedDict[str, deque]'] = {
+            priority: OrderedDict() for priority in PRIORITY_NAMES
+        }
+        self._cond = threading.Condition()
+        self._stats: Dict[int, Dict[str, float]] = {
+            priority: {'granted': 0, 'waited': 0, 'wait_seconds': 0.0, 'max_wait_seconds': 0.0}
+            for priority in PRIORITY_NAMES
+        }
+        self.tracer = get_tracer()
+
+    def acquire(self, tokens: float = 0) -> RateGrant:
+        """按上下文的优先级和用户排队，获得配额后返回（阻塞）"""
+        if not self.enabled:
+            return _NOOP_GRANT
+        priority, user_id = _request_context.get()
+        priority = priority if priority in self._queues else PRIORITY_ANALYSIS
+        if self.token_bucket is not None:
+            # 超过桶容量的调用按容量计，否则永远等不到
+            tokens = min(tokens, self.token_bucket.capacity)
+        waiter = _Waiter(tokens, priority, user_id or '')
+
+        with self._cond:
+            queue = self._queues[priority].setdefault(waiter.user_key, deque())
+            queue.append(waiter)
+            while True:
+                now = time.monotonic()
+                delay = self._ready_in(waiter, now)
+                if delay == 0.0:
+                    break
+                self._cond.wait(delay)
+            self._take(waiter)
+            self._cond.notify_all()
+
+        wait = time.monotonic() - waiter.enqueued
+        self._record(priority, wait)
+        return RateGrant(self, tokens, wait)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """各优先级的放行数、排队数和等待时间，以及当前排队深度"""
+        with self._cond:
+            return {
+                PRIORITY_NAMES[priority]: {
+                    **stats,
+                    'mean_wait_seconds': stats['wait_seconds'] / stats['granted'] if stats['granted'] else 0.0,
+                    'queued': sum(len(queue) for queue in self._queues[priority].values())
+                }
+                for priority, stats in self._stats.items()
+            }
+
+    def _next_waiter(self) -> Optional[_Waiter]:
+        """下一个应放行的调用：最高优先级中轮转到的用户的最早调用"""
+        for priority in sorted(self._queues):
+            users = self._queues[priority]
+            if users:
+                return next(iter(users.values()))[0]
+        return None
+
+    def _ready_in(self, waiter: _Waiter, now: float) -> Optional[float]:
+        """waiter可以放行时返回0；否则返回需等待的秒数（None为等待其他调用唤醒）"""
+        if self._next_waiter() is not waiter:
+            return None
+        wait = 0.0
+        for bucket, amount in ((self.request_bucket, 1.0), (self.token_bucket, waiter.tokens)):
+            if bucket is not None:
+                bucket.refill(now)
+                wait = max(wait, bucket.wait_time(amount))
+        return wait
+
+    def _take(self, waiter: _Waiter) -> None:
+        if self.request_bucket is not None:
+            self.request_bucket.level -= 1.0
+        if self.token_bucket is not None:
+            self.token_bucket.level -= waiter.tokens
+        users = self._queues[waiter.priority]
+        queue = users[waiter.user_key]
+        queue.popleft()
+        # 放行后该用户移到轮转末尾
+        del users[waiter.user_key]
+        if queue:
+            users[waiter.user_key] = queue
+
+    def _adjust_tokens(self, refund: float) -> None:
+        if self.token_bucket is None or refund == 0:
+            return
+        with self._cond:
+            self.token_bucket.refill(time.monotonic())
+            self.token_bucket.level = min(self.token_bucket.capacity, self.token_bucket.level + refund)
+            self._cond.notify_all()
+
+    def _record(self, priority: int, wait: float) -> None:
+        name = PRIORITY_NAMES[priority]
+        with self._cond:
+            stats = self._stats[priority]
+            stats['granted'] += 1
+            stats['wait_seconds'] += wait
+            stats['max_wait_seconds'] = max(stats['max_wait_seconds'], wait)
+            if wait > 0.001:
+                stats['waited'] += 1
+        self.tracer.observe('llm_queue_wait_seconds', wait, priority=name)
+        self.tracer.current_span().set(priority=name, queue_wait_ms=round(wait * 1000, 3))
+
+_limiter: Optional[RateLimiter] = None
+_limiter_lock = threading.Lock()
+
+def get_rate_limiter() -> RateLimiter:
+    """获取进程内共享的LLM限流器（按环境变量配置）"""
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = RateLimiter(
+                    enabled=os.getenv('ENABLE_RATE_LIMIT', 'false').lower() == 'true',
+                    requests_per_minute=float(os.getenv('MAX_REQUESTS_PER_MINUTE', '60')),
+                    tokens_per_minute=float(os.getenv('MAX_TOKENS_PER_MINUTE', '0'))
+                )
+    return _limiter
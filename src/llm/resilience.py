@@ -0,0 +1,348 @@
+from typing import Any, Callable, Dict, List, Optional, TypeVar
+import os
+import time
+import random
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, Future, wait
+import requests
+from src.utils.tracing import get_tracer
+
+T = TypeVar('T')
+
+# 可重试的HTTP状态码：请求超时、限流、服务端错误
+RETRYABLE_STATUS = frozenset({408, 425, 429, 500, 502, 503, 504})
+# 计算对冲延迟的耗时样本窗口
+LATENCY_WINDOW = 200
+
+class CircuitOpenError(Exception):
+    """熔断器打开时快速失败"""
+    pass
+
+def is_retryable(error: BaseException) -> bool:
+    """连接错误、超时和可重试状态码的响应可以重试，其他错误（如400、401）直接失败"""
+    if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return True
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        return error.response.status_code in RETRYABLE_STATUS
+    return False
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """响应头Retry-After给出的等待秒数（只支持秒数格式）"""
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    value = response.headers.get('Retry-After')
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None
+
+class CircuitBreaker:
+    """熔断器：连续失败failure_threshold次后打开，reset_timeout秒内的调用直接失败；
+    之后进入半开状态，只放行一次试探调用，成功则关闭，失败则重新打开。failure_threshold为0时不熔断。
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """当前是否允许发出请求"""
+        if self.failure_threshold <= 0:
+            return True
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._trial_running = False
+            if self.state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_running = False
+
+    def record_response(self) -> None:
+        """调用得到了服务的响应但不算成功（如参数错误、响应解析失败）：
+        半开状态下试探调用说明服务已恢复，关闭熔断器；关闭状态下不影响连续失败计数"""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.CLOSED
+                self.failures = 0
+                self._trial_running = False
+
+    def release_trial(self) -> None:
+        """调用未得出结果就结束（如被中断）：释放试探名额，状态不变"""
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self) -> bool:
+        """记录一次失败，返回熔断器是否因此打开"""
+        if self.failure_threshold <= 0:
+            return False
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self._trial_running = False
+                return True
+            return False
+
+class LatencyTracker:
+    """最近若干次成功请求的耗时，用于估算对冲延迟"""
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self._samples: deque = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def quantile(self, q: float) -> float:
+        with self._lock:
+            ordered = sorted(self._samples)
+        if not ordered:
+            return 0.0
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+class ResilientCaller:
+    """LLM请求的容错执行：重试、对冲请求和熔断
+
+    - 重试：连接错误、超时和可重试状态码最多尝试max_attempts次，
+      间隔为指数退避加全抖动（0到min(max_delay, base_delay*2^n)之间随机），响应给出Retry-After时取较大值
+    - 对冲：开启后，一次尝试超过近期成功耗时的hedge_quantile分位数仍未返回时，再发出一个相同请求，
+      取先成功的结果。无法中断的同步请求不等待落后者，其结果在返回后交给discard结算并丢弃。
+      限流等许可在计时前获取，排队时间不计入耗时样本
+    - 熔断：连续失败达到阈值后在reset_timeout内直接抛出CircuitOpenError
+    """
+    def __init__(self,
+                 max_attempts: int = 3,
+                 base_delay: float = 0.5,
+                 max_delay: float = 8.0,
+                 hedge: bool = False,
+                 hedge_quantile: float = 0.95,
+                 hedge_min_delay: float = 0.2,
+                 hedge_min_samples: int = 20,
+                 breaker: Optional[CircuitBreaker] = None,
+                 name: str = 'llm'):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_min_samples = hedge_min_samples
+        self.breaker = breaker or CircuitBreaker(0)
+        self.name = name
+        self.latency = LatencyTracker()
+        self.tracer = get_tracer()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+        self._stats = {'calls': 0, 'attempts': 0, 'retries': 0, 'hedges': 0, 'hedge_wins': 0,
+                       'failures': 0, 'rejected': 0}
+        self._stats_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, name: str = 'llm') -> 'ResilientCaller':
+        """按环境变量创建（LLM_MAX_ATTEMPTS、LLM_HEDGE、LLM_CIRCUIT_FAILURES等）"""
+        return cls(
+            max_attempts=int(os.getenv('LLM_MAX_ATTEMPTS', '3')),
+            base_delay=float(os.getenv('LLM_RETRY_BASE_DELAY_MS', '500')) / 1000,
+            max_delay=float(os.getenv('LLM_RETRY_MAX_DELAY_MS', '8000')) / 1000,
+            hedge=os.getenv('LLM_HEDGE', 'false').lower() == 'true',
+            hedge_quantile=float(os.getenv('LLM_HEDGE_QUANTILE', '0.95')),
+            hedge_min_delay=float(os.getenv('LLM_HEDGE_MIN_DELAY_MS', '200')) / 1000,
+            breaker=CircuitBreaker(
+                failure_threshold=int(os.getenv('LLM_CIRCUIT_FAILURES', '5')),
+                reset_timeout=float(os.getenv('LLM_CIRCUIT_RESET_SECONDS', '30'))
+            ),
+            name=name
+        )
+
+    def call(self,
+             attempt: Callable[[Any], T],
+             hedge: Optional[bool] = None,
+             acquire: Optional[Callable[[], Any]] = None,
+             discard: Optional[Callable[[T], None]] = None) -> T:
+        """执行attempt（一次完整请求），失败时按策略重试；hedge为None时使用实例设置
+
+        acquire在每次请求前获取许可（如限流配额），其结果传给attempt；排队时间不计入请求耗时，
+        对冲计时也从获得许可后开始。discard接收被丢弃的对冲结果，用于结算其占用的资源。
+        """
+        hedge = self.hedge if hedge is None else hedge
+        span = self.tracer.current_span()
+        self._count('calls')
+        last_error: Optional[BaseException] = None
+        for index in range(self.max_attempts):
+            if index:
+                delay = self._backoff(index, last_error)
+                self._count('retries')
+                self.tracer.count('llm_retries_total', provider=self.name, reason=_error_reason(last_error))
+                time.sleep(delay)
+            try:
+                if hedge:
+                    result = self._attempt_hedged(attempt, acquire, discard)
+                else:
+                    result = self._attempt(attempt, self._begin(acquire))
+                span.set(attempts=index + 1)
+                return result
+            except CircuitOpenError:
+                self._count('rejected')
+                span.set(attempts=index, circuit='open')
+                raise
+            except Exception as e:
+                last_error = e
+                if not is_retryable(e):
+                    break
+        self._count('failures')
+        span.set(attempts=self.max_attempts)
+        raise last_error
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['circuit'] = self.breaker.state
+        stats['hedge_delay_ms'] = round(self._hedge_delay() * 1000, 3) if self._hedge_ready() else None
+        return stats
+
+    def _begin(self, acquire: Optional[Callable[[], Any]]) -> Any:
+        """请求前检查熔断器并获取许可"""
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"{self.name}服务熔断中，暂停请求")
+        try:
+            return acquire() if acquire is not None else None
+        except BaseException:
+            self.breaker.release_trial()
+            raise
+
+    def _attempt(self, attempt: Callable[[Any], T], permit: Any) -> T:
+        """单次请求（已通过_begin）：记录结果和耗时"""
+        self._count('attempts')
+        start = time.perf_counter()
+        try:
+            result = attempt(permit)
+        except Exception as e:
+            if is_retryable(e):
+                if self.breaker.record_failure():
+                    self.tracer.count('llm_circuit_open_total', provider=self.name)
+            else:
+                # 不可重试的错误（如参数错误、响应解析失败）说明服务有响应，不算故障，
+                # 但也不清零连续失败计数；半开状态下试探调用随之结束
+                self.breaker.record_response()
+            raise
+        except BaseException:
+            self.breaker.release_trial()
+            raise
+        self.breaker.record_success()
+        self.latency.record(time.perf_counter() - start)
+        return result
+
+    def _attempt_hedged(self,
+                        attempt: Callable[[Any], T],
+                        acquire: Optional[Callable[[], Any]],
+                        discard: Optional[Callable[[T], None]]) -> T:
+        """对冲请求：主请求超过对冲延迟未返回时再发出一个，取先成功的结果"""
+        permit = self._begin(acquire)
+        if not self._hedge_ready():
+            return self._attempt(attempt, permit)
+
+        executor = self._get_executor()
+        # 主请求已获得许可，对冲计时只包含请求本身的耗时；
+        # 在线程池中执行时带上当前上下文（追踪span、限流优先级）
+        primary = executor.submit(contextvars.copy_context().run, self._attempt, attempt, permit)
+        done, _ = wait([primary], timeout=self._hedge_delay())
+        if done:
+            return primary.result()
+
+        # 熔断时对冲请求以CircuitOpenError结束，不影响主请求
+        hedge_future = executor.submit(
+            contextvars.copy_context().run,
+            lambda: self._attempt(attempt, self._begin(acquire))
+        )
+        pending: List[Future] = [primary, hedge_future]
+        self._count('hedges')
+        self.tracer.count('llm_hedges_total', provider=self.name)
+        self.tracer.current_span().set(hedged=True)
+
+        error: Optional[BaseException] = None
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.remove(future)
+                if future.exception() is None:
+                    # 取消仍在排队的落后请求；已发出的请求返回后结果交给discard结算
+                    for loser in pending:
+                        if not loser.cancel() and discard is not None:
+                            loser.add_done_callback(lambda f: _discard_result(f, discard))
+                    if future is hedge_future:
+                        self._count('hedge_wins')
+                        self.tracer.count('llm_hedge_wins_total', provider=self.name)
+                    return future.result()
+                # 都失败时优先抛出实际的请求错误
+                if error is None or isinstance(error, CircuitOpenError):
+                    error = future.exception()
+        raise error
+
+    def _hedge_ready(self) -> bool:
+        return len(self.latency) >= self.hedge_min_samples
+
+    def _hedge_delay(self) -> float:
+        return max(self.hedge_min_delay, self.latency.quantile(self.hedge_quantile))
+
+    def _backoff(self, retry: int, error: Optional[BaseException]) -> float:
+        """第retry次重试前的等待：指数退避加全抖动，不少于Retry-After"""
+        ceiling = min(self.max_delay, self.base_delay * (2 ** (retry - 1)))
+        delay = random.uniform(0, ceiling)
+        hint = retry_after(error) if error is not None else None
+        if hint is not None:
+            delay = max(delay, min(hint, self.max_delay))
+        return delay
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix=f"{self.name}-hedge")
+        return self._executor
+
+    def _count(self, key: str) -> None:
+        with self._stats_lock:
+            self._stats[key] += 1
+
+def _discard_result(future: Future, discard: Callable[[Any], None]) -> None:
+    """落后的对冲请求完成后结算其结果（失败的请求已自行释放资源）"""
+    if future.cancelled() or future.exception() is not None:
+        return
+    try:
+        discard(future.result())
+    except Exception:
+        pass
+
+def _error_reason(error: Optional[BaseException]) -> str:
+    """重试原因：状态码、timeout或connection"""
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        return str(error.response.status_code)
+    if isinstance(error, requests.exceptions.Timeout):
+        return 'timeout'
+    if isinstance(error, requests.exceptions.ConnectionError):
+        return 'connection'
+    return type(error).__name__ if error is not None else 'unknown'
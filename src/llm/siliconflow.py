@@ -1,9 +1,14 @@
 import os
 import json
+import time
 import requests
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterator
 from .base import BaseLLM
 from config.dialogue_config import LLM_MODELS
+from src.utils.tokens import estimate_tokens
+from src.utils.tracing import get_tracer
+from .rate_limiter import RateGrant, get_rate_limiter
+from .resilience import CircuitOpenError, ResilientCaller
 
 class SiliconFlow(BaseLLM):
     """SiliconFlow API实现类"""
@@ -14,6 +19,9 @@ class SiliconFlow(BaseLLM):
         self.api_base = os.getenv('SILICONFLOW_API_BASE', 'https://api.siliconflow.cn/v1')
         self.model_name = os.getenv('SILICONFLOW_MODEL_NAME', 'Pro/deepseek-ai/DeepSeek-V3')
         self.timeout = int(os.getenv('SILICONFLOW_TIMEOUT', '30'))
+        self.tracer = get_tracer()
+        self.rate_limiter = get_rate_limiter()
+        self.resilience = ResilientCaller.from_env(name='siliconflow')
         
         # 设置机器人性格特征
         self.personality_traits = {
@@ -75,18 +83,123 @@ class SiliconFlow(BaseLLM):
             API响应结果
         """
         try:
-            # 构建请求数据
-            data = {
-                'model': self.model_name,
-                'messages': messages,
-                'temperature': temperature,
-                'max_tokens': max_tokens,
-                'stream': stream
-            }
+            with self.tracer.span('llm.chat', model=self.model_name, stream=stream) as span:
+                # 构建请求数据
+                data = {
+                    'model': self.model_name,
+                    'messages': messages,
+                    'temperature': temperature,
+                    'max_tokens': max_tokens,
+                    'stream': stream
+                }
+                
+                # 失败时按可重试状态码重试，开启对冲时慢请求会补发一次
+                # 配额在每次请求前获取，排队时间不计入对冲计时；被丢弃的对冲结果按实际用量结算配额
+                response, result, grant = self.resilience.call(
+                    lambda grant: self._request_chat(span, data, grant),
+                    acquire=lambda: self._acquire_quota(messages, max_tokens),
+                    discard=lambda outcome: self._settle_discarded(outcome, messages)
+                )
+                self._record_usage(span, grant, messages, result, response.elapsed.total_seconds())
+                
+                # 处理流式响应
+                if stream:
+                    return self._handle_stream_response(result)
+                
+                return result
             
-            print(f"\n发送API请求：")
-            print(f"URL: {self.api_base}/chat/completions")
+        except CircuitOpenError as e:
+            raise Exception(f"SiliconFlow API暂不可用: {str(e)}")
+        except requests.exceptions.RequestException as e:
+            print(f"\nAPI请求失败：")
+            print(f"Error: {str(e)}")
+            if hasattr(e.response, 'text'):
+                print(f"Response: {e.response.text}")
+            raise Exception(f"SiliconFlow API请求失败: {str(e)}")
+        except json.JSONDecodeError as e:
+            raise Exception(f"SiliconFlow API响应解析失败: {str(e)}")
+        except Exception as e:
+            raise Exception(f"SiliconFlow API调用出错: {str(e)}")
+    
+    def chat_stream(self,
+                    messages: List[Dict[str, str]],
+                    temperature: float = 0.7,
+                    max_tokens: int = 2000) -> Iterator[str]:
+        """
+        流式聊天请求：解析SSE事件，逐段返回新生成的文本
+        
+        首token时间记录为发出请求到收到第一段文本的时间。
+        
+        Args:
+            messages: 消息历史列表
+            temperature: 温度参数
+            max_tokens: 最大生成token数
+            
+        Returns:
+            回复文本片段的迭代器
+        """
+        try:
+            with self.tracer.span('llm.chat', model=self.model_name, stream=True) as span:
+                data = {
+                    'model': self.model_name,
+                    'messages': messages,
+                    'temperature': temperature,
+                    'max_tokens': max_tokens,
+                    'stream': True
+                }
+                start = time.perf_counter()
+                ttft = None
+                parts: List[str] = []
+                usage = None
+                
+                # 只在建立连接、收到响应头之前重试；开始输出后失败不再重发，也不做对冲
+                response, grant = self.resilience.call(
+                    lambda grant: self._open_stream(span, data, grant),
+                    hedge=False,
+                    acquire=lambda: self._acquire_quota(messages, max_tokens)
+                )
+                with response:
+                    for line in response.iter_lines():
+                        # SSE事件格式：data: {...}，以data: [DONE]结束
+                        if not line or not line.startswith(b'data:'):
+                            continue
+                        payload = line[5:].strip()
+                        if payload == b'[DONE]':
+                            break
+                        chunk = json.loads(payload)
+                        usage = chunk.get('usage') or usage
+                        for choice in chunk.get('choices') or []:
+                            content = (choice.get('delta') or {}).get('content')
+                            if content:
+                                if ttft is None:
+                                    ttft = time.perf_counter() - start
+                                parts.append(content)
+                                yield content
+                
+                result = {
+                    'usage': usage,
+                    'choices': [{'message': {'content': ''.join(parts)}}]
+                }
+                self._record_usage(span, grant, messages, result, ttft if ttft is not None else time.perf_counter() - start)
             
+        except requests.exceptions.RequestException as e:
+            print(f"\nAPI流式请求失败：")
+            print(f"Error: {str(e)}")
+            raise Exception(f"SiliconFlow API请求失败: {str(e)}")
+        except json.JSONDecodeError as e:
+            raise Exception(f"SiliconFlow API响应解析失败: {str(e)}")
+        except CircuitOpenError as e:
+            raise Exception(f"SiliconFlow API暂不可用: {str(e)}")
+    
+    def _request_chat(self,
+                      span,
+                      data: Dict[str, Any],
+                      grant: RateGrant):
+        """一次非流式请求（已获得配额）：发送并解析响应，返回(响应, 结果, 配额)"""
+        print(f"\n发送API请求：")
+        print(f"URL: {self.api_base}/chat/completions")
+        
+        try:
             # 发送请求
             response = requests.post(
                 f"{self.api_base}/chat/completions",
@@ -98,29 +211,94 @@ class SiliconFlow(BaseLLM):
             # 打印响应状态和内容
             print(f"\nAPI响应：")
             print(f"Status Code: {response.status_code}")
+            span.set(status_code=response.status_code)
             
             # 检查响应状态
             response.raise_for_status()
+        except requests.exceptions.RequestException:
+            # 失败的请求不消耗token，退回预留量
+            grant.settle(0)
+            raise
+        
+        # 解析响应
+        return response, response.json(), grant
+    
+    def _open_stream(self,
+                     span,
+                     data: Dict[str, Any],
+                     grant: RateGrant):
+        """建立一次流式请求（已获得配额），返回(响应, 配额)；状态码异常时关闭连接并抛出"""
+        try:
+            response = requests.post(
+                f"{self.api_base}/chat/completions",
+                headers=self.headers,
+                json=data,
+                timeout=self.timeout,
+                stream=True
+            )
+        except requests.exceptions.RequestException:
+            grant.settle(0)
+            raise
+        span.set(status_code=response.status_code)
+        try:
+            response.raise_for_status()
+        except requests.exceptions.HTTPError:
+            response.close()
+            grant.settle(0)
+            raise
+        return response, grant
+    
+    def _acquire_quota(self, messages: List[Dict[str, str]], max_tokens: int) -> RateGrant:
+        """限流：预留估算的输入token数加max_tokens，返回后按实际用量修正"""
+        if not self.rate_limiter.enabled:
+            return self.rate_limiter.acquire()
+        return self.rate_limiter.acquire(self._estimate_prompt_tokens(messages) + max_tokens)
+    
+    @staticmethod
+    def _estimate_prompt_tokens(messages: List[Dict[str, str]]) -> int:
+        return sum(estimate_tokens(str(message.get('content', ''))) for message in messages)
+    
+    def _record_usage(self,
+                      span,
+                      grant: RateGrant,
+                      messages: List[Dict[str, str]],
+                      result: Dict[str, Any],
+                      ttft: float) -> None:
+        """记录LLM调用的输入输出token数和首token时间，并修正限流的token预留量
+
+        非流式请求在生成结束后才返回响应头，首token时间即响应头到达的时间；
+        流式请求为收到第一段文本的时间。
+        接口未返回usage时按字符估算token数。
+        """
+        if not self.tracer.enabled and not self.rate_limiter.enabled:
+            return
+        tokens_in, tokens_out = self._usage(messages, result)
+        grant.settle(tokens_in + tokens_out)
+        if not self.tracer.enabled:
+            return
             
-            # 解析响应
-            result = response.json()
-            
-            # 处理流式响应
-            if stream:
-                return self._handle_stream_response(result)
-            
-            return result
-            
-        except requests.exceptions.RequestException as e:
-            print(f"\nAPI请求失败：")
-            print(f"Error: {str(e)}")
-            if hasattr(e.response, 'text'):
-                print(f"Response: {e.response.text}")
-            raise Exception(f"SiliconFlow API请求失败: {str(e)}")
-        except json.JSONDecodeError as e:
-            raise Exception(f"SiliconFlow API响应解析失败: {str(e)}")
-        except Exception as e:
-            raise Exception(f"SiliconFlow API调用出错: {str(e)}")
+        span.set(tokens_in=tokens_in, tokens_out=tokens_out, ttft_ms=round(ttft * 1000, 3))
+        self.tracer.observe('llm_ttft_seconds', ttft, model=self.model_name)
+        self.tracer.count('llm_tokens_total', tokens_in, model=self.model_name, direction='in')
+        self.tracer.count('llm_tokens_total', tokens_out, model=self.model_name, direction='out')
+    
+    def _usage(self, messages: List[Dict[str, str]], result: Dict[str, Any]):
+        """响应的(输入token数, 输出token数)，接口未返回usage时按字符估算"""
+        usage = result.get('usage') or {}
+        tokens_in = usage.get('prompt_tokens')
+        if tokens_in is None:
+            tokens_in = self._estimate_prompt_tokens(messages)
+        tokens_out = usage.get('completion_tokens')
+        if tokens_out is None:
+            choices = result.get('choices') or [{}]
+            tokens_out = estimate_tokens(choices[0].get('message', {}).get('content', '') or '')
+        return tokens_in, tokens_out
+    
+    def _settle_discarded(self, outcome, messages: List[Dict[str, str]]) -> None:
+        """落后的对冲请求返回后按实际用量结算其配额（结果本身丢弃）"""
+        _, result, grant = outcome
+        if self.rate_limiter.enabled:
+            grant.settle(sum(self._usage(messages, result)))
     
     def _handle_stream_response(self, response: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -8,11 +8,14 @@ from datetime import datetime
 
 from src.llm.base import BaseLLM
 from src.dialogue import DialogueSystem
+from src.dialogue.core.session_history import SessionHistory
 from src.memory.core.memory_manager import MemoryManager
-from src.emotion import EmotionManager, EmotionAnalyzer
+from src.emotion import EmotionManager, EmotionAnalyzer, EmotionTicker
 from src.config.dialogue_config import DialogueConfig
 from src.config.memory_config import MemoryConfig
 from src.config.emotion_config import EmotionConfig
+from src.utils.tracing import get_tracer
+from src.utils.profiler import get_turn_profiler
 
 def main(llm: Optional[BaseLLM] = None):
     """
@@ -24,6 +27,13 @@ def main(llm: Optional[BaseLLM] = None):
     if llm is None:
         raise ValueError("LLM模型实例不能为空")
     
+    # 追踪需要在创建数据库连接之前初始化，才能监听数据库命令
+    tracer = get_tracer()
+    
+    # 轮次性能剖析：启动参数或信号开启（SIGUSR1剖析接下来几轮，SIGUSR2开关慢轮次剖析）
+    profiler = get_turn_profiler()
+    profiler.install_signal_handlers()
+    
     # 加载配置
     dialogue_config = DialogueConfig()
     memory_config = MemoryConfig()
@@ -34,6 +44,10 @@ def main(llm: Optional[BaseLLM] = None):
     emotion_manager = EmotionManager(emotion_config)
     emotion_analyzer = EmotionAnalyzer()
     
+    # 启动情感定时更新（批量衰减和情感转移）
+    emotion_ticker = EmotionTicker(emotion_manager)
+    emotion_ticker.start()
+    
     # 初始化对话系统
     dialogue_system = DialogueSystem(
         llm=llm,
@@ -46,11 +60,8 @@ def main(llm: Optional[BaseLLM] = None):
     bot_name = os.getenv('BOT_NAME', '女仆天城')
     print(f"\n{bot_name}已启动，输入'quit'退出对话")
     
-    # 初始化对话历史
-    messages: List[Dict[str, str]] = []
-    
-    # 获取最大历史记录数
-    max_history = dialogue_config.max_history
+    # 初始化对话历史（按DialogueConfig的轮数和token预算保留，超出部分并入摘要）
+    history = SessionHistory.from_config(dialogue_config)
     
     while True:
         try:
@@ -64,64 +75,21 @@ def main(llm: Optional[BaseLLM] = None):
             
             # 检查是否清空历史
             if user_input.lower() in ['clear', 'clear history', '清空历史']:
-                messages.clear()
+                history.clear()
                 memory_manager.clear_memory()
                 print("\n对话历史已清空")
                 continue
-            print("更新记忆")
-            # 1. 更新记忆
-            memory_manager.add_memory(
-                content=user_input,
-                user_id="user_input",
-                metadata={
-                    "type": "user_input",
-                    "timestamp": datetime.now().isoformat(),
-                    "context": "user_message"
-                }
-            )
-            memory_context = memory_manager.get_memory_context(
-                query=user_input,
-                user_id="user_input"
-            )
-            # 2. 更新情感状态
-            emotion_state = emotion_manager.get_emotion_state()
-            emotion_intensity = emotion_manager.get_emotion_intensity()
-            # 3. 生成回复
-            response = dialogue_system.generate_response(
-                user_input=user_input,
-                model_name=dialogue_config.model_name,
-                personality_traits=llm.personality_traits,
-                emotion_state=emotion_state,
-                emotion_intensity=emotion_intensity,
-                memory_context=memory_context
-            )
-            # 4. 更新记忆
-            memory_manager.add_memory(
-                content=response,
-                user_id="assistant_response",
-                metadata={
-                    "type": "assistant_response",
-                    "timestamp": datetime.now().isoformat(),
-                    "context": "assistant_message"
-                }
-            )
+            with profiler.turn(), tracer.span('turn'):
+                response = _process_turn(
+                    user_input, tracer, dialogue_config, llm,
+                    memory_manager, emotion_manager, dialogue_system, history
+                )
             
             # 5. 打印天城回复
             print(f"\n天城: {response}")
             
             # 6. 更新对话历史
-            messages.append({
-                "role": "user",
-                "content": user_input
-            })
-            messages.append({
-                "role": "assistant",
-                "content": response
-            })
-            
-            # 保持历史记录在限制范围内
-            if len(messages) > max_history * 2:
-                messages = messages[-max_history * 2:]
+            history.add_turn(user_input, response)
             
         except KeyboardInterrupt:
             print("\n再见！")
@@ -129,6 +97,66 @@ def main(llm: Optional[BaseLLM] = None):
         except Exception as e:
             print(f"\n错误：{str(e)}")
             continue
+            
+    emotion_ticker.stop()
+    
+    # 导出本次运行的指标
+    if tracer.enabled:
+        tracer.write_metrics(os.getenv('METRICS_DIR', 'logs'))
+
+def _process_turn(user_input: str,
+                  tracer,
+                  dialogue_config: DialogueConfig,
+                  llm: BaseLLM,
+                  memory_manager: MemoryManager,
+                  emotion_manager: EmotionManager,
+                  dialogue_system: DialogueSystem,
+                  history: SessionHistory) -> str:
+    """处理一轮对话，返回回复"""
+    print("更新记忆")
+    # 1. 更新记忆
+    with tracer.span('memory.store'):
+        memory_manager.add_memory(
+            content=user_input,
+            user_id="user_input",
+            metadata={
+                "type": "user_input",
+                "timestamp": datetime.now().isoformat(),
+                "context": "user_message"
+            }
+        )
+    with tracer.span('memory.retrieve'):
+        memory_context = memory_manager.get_memory_context(
+            query=user_input,
+            user_id="user_input"
+        )
+    # 2. 更新情感状态（一次读取完整状态，命中缓存时不访问数据库）
+    with tracer.span('emotion.get'):
+        current_emotion = emotion_manager.get_emotion()
+    emotion_state = current_emotion.emotion_state
+    emotion_intensity = current_emotion.intensity
+    # 3. 生成回复
+    response = dialogue_system.generate_response(
+        user_input=user_input,
+        model_name=dialogue_config.model_name,
+        personality_traits=llm.personality_traits,
+        emotion_state=emotion_state,
+        emotion_intensity=emotion_intensity,
+        memory_context=memory_context,
+        history=history.messages()
+    )
+    # 4. 更新记忆
+    with tracer.span('memory.store'):
+        memory_manager.add_memory(
+            content=response,
+            user_id="assistant_response",
+            metadata={
+                "type": "assistant_response",
+                "timestamp": datetime.now().isoformat(),
+                "context": "assistant_message"
+            }
+        )
+    return response
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,348 @@
+from typing import List, Dict, Any, Optional, Tuple, Callable, Iterable
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime
+import numpy as np
+from bson import ObjectId
+from pymongo import InsertOne, UpdateOne
+from pymongo.collection import Collection
+from config.memory_config import MEMORY_PARAMS
+
+# 归一化时去掉的字符：空白和标点
+_NON_WORD = re.compile(r'[\W_]+')
+
+def simhash(text: str, shingle_size: int = 3) -> int:
+    """计算文本的64位SimHash指纹（基于字符shingle，忽略空白、标点和大小写）"""
+    # 只有标点的文本（如"？？"）保留原样，避免都归一化为空而互相合并
+    normalized = _NON_WORD.sub('', text).lower() or text.strip()
+    if not normalized:
+        return 0
+    if len(normalized) <= shingle_size:
+        shingles = [normalized]
+    else:
+        shingles = [normalized[i:i + shingle_size] for i in range(len(normalized) - shingle_size + 1)]
+
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s.encode('utf-8'), digest_size=8).digest(), 'little') for s in shingles),
+        dtype=np.uint64,
+        count=len(shingles)
+    )
+    # 每个shingle哈希的64位逐位投票
+    bits = np.unpackbits(hashes.astype('<u8').view(np.uint8).reshape(-1, 8), axis=1, bitorder='little')
+    votes = bits.sum(axis=0) * 2 > len(shingles)
+    return int(np.packbits(votes, bitorder='little').view('<u8')[0])
+
+def to_signed64(value: int) -> int:
+    """转换为有符号64位整数，便于存入MongoDB"""
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+def from_signed64(value: int) -> int:
+    """从MongoDB中的有符号64位整数还原指纹"""
+    return value + (1 << 64) if value < 0 else value
+
+class _PendingScope:
+    """正在从数据库加载的scope：加载期间登记的指纹暂存在entries中，加载完成后一并加入"""
+    def __init__(self):
+        self.done = threading.Event()
+        self.entries: List[Tuple[int, Any]] = []
+        self.invalidated = False
+
+class NearDuplicateDetector:
+    """近重复检测器：SimHash指纹 + 分段LSH索引
+
+    汉明距离不超过max_distance的两个指纹，按鸽巢原理必有一段完全相同，
+    因此只需检查同段桶内的候选，每次写入的检测代价与记忆总数无关。
+    """
+    def __init__(self,
+                 max_distance: int = 3,
+                 shingle_size: int = 3,
+                 max_scopes: int = 1024):
+        self.max_distance = max_distance
+        self.shingle_size = shingle_size
+        self.max_scopes = max_scopes
+
+        # 64位指纹切成max_distance + 1段
+        bands = max_distance + 1
+        width = 64 // bands
+        self.bands = [
+            (i * width, 64 - i * width if i == bands - 1 else width)
+            for i in range(bands)
+        ]
+
+        # scope -> 各段的桶：段值 -> [(指纹, 记忆id)]
+        self._scopes: 'OrderedDict[str, List[Dict[int, List[Tuple[int, Any]]]]]' = OrderedDict()
+        self._loading: Dict[str, _PendingScope] = {}
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def fingerprint(self, text: str) -> int:
+        return simhash(text, self.shingle_size)
+
+    def find(self,
+             scope: str,
+             fingerprint: int,
+             loader: Callable[[], Iterable[Tuple[int, Any]]]) -> Optional[Any]:
+        """查找近重复记忆的id，scope首次使用时通过loader加载已有指纹"""
+        buckets = self._get_scope(scope, loader)
+        with self._lock:
+            match = None
+            for band, (shift, width) in enumerate(self.bands):
+                key = (fingerprint >> shift) & ((1 << width) - 1)
+                for candidate, memory_id in buckets[band].get(key, ()):
+                    if bin(candidate ^ fingerprint).count('1') <= self.max_distance:
+                        match = memory_id
+                        break
+                if match is not None:
+                    break
+
+            namespace = scope.split(':', 1)[0]
+            stats = self._stats.setdefault(namespace, {'checks': 0, 'duplicates': 0})
+            stats['checks'] += 1
+            if match is not None:
+                stats['duplicates'] += 1
+            return match
+
+    def add(self, scope: str, fingerprint: int, memory_id: Any) -> None:
+        """记录新写入记忆的指纹（scope未加载时跳过，加载时会从数据库读取）"""
+        with self._lock:
+            buckets = self._scopes.get(scope)
+            if buckets is not None:
+                self._insert(buckets, fingerprint, memory_id)
+            elif scope in self._loading:
+                self._loading[scope].entries.append((fingerprint, memory_id))
+
+    def invalidate(self, scope: Optional[str] = None) -> None:
+        """清除指定scope或全部scope的索引，下次检测时重新加载"""
+        with self._lock:
+            if scope is None:
+                self._scopes.clear()
+                loads = list(self._loading.values())
+            else:
+                self._scopes.pop(scope, None)
+                loads = [self._loading[scope]] if scope in self._loading else []
+            for pending in loads:
+                pending.invalidated = True
+
+    def invalidate_namespace(self, namespace: str) -> None:
+        """清除命名空间下所有scope的索引"""
+        prefix = f"{namespace}:"
+        with self._lock:
+            for scope in [scope for scope in self._scopes if scope.startswith(prefix)]:
+                del self._scopes[scope]
+            for scope, pending in self._loading.items():
+                if scope.startswith(prefix):
+                    pending.invalidated = True
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """各命名空间的检测次数、重复次数和去重率"""
+        with self._lock:
+            return {
+                namespace: {
+                    **stats,
+                    'dedupe_rate': stats['duplicates'] / stats['checks'] if stats['checks'] else 0.0
+                }
+                for namespace, stats in self._stats.items()
+            }
+
+    def _get_scope(self,
+                   scope: str,
+                   loader: Callable[[], Iterable[Tuple[int, Any]]]) -> List[Dict[int, List[Tuple[int, Any]]]]:
+        """获取scope的分段桶，未命中时通过loader加载一次
+
+        加载在全局锁外进行，同一scope的并发检测等待同一次加载，不阻塞其他scope的检测和登记。
+        """
+        while True:
+            with self._lock:
+                buckets = self._scopes.get(scope)
+                if buckets is not None:
+                    self._scopes.move_to_end(scope)
+                    return buckets
+                pending = self._loading.get(scope)
+                if pending is None:
+                    pending = self._loading[scope] = _PendingScope()
+                    break
+            # 其他线程正在加载该scope，完成后重新查找（加载失败时由本线程重试）
+            pending.done.wait()
+
+        try:
+            buckets = [{} for _ in self.bands]
+            for fingerprint, memory_id in loader():
+                self._insert(buckets, fingerprint, memory_id)
+        except Exception:
+            with self._lock:
+                self._loading.pop(scope, None)
+            pending.done.set()
+            raise
+
+        with self._lock:
+            # 补上加载期间登记的指纹（与查询结果重复的条目指向同一记忆，不影响匹配）
+            for fingerprint, memory_id in pending.entries:
+                self._insert(buckets, fingerprint, memory_id)
+            self._loading.pop(scope, None)
+            # 加载期间被清除的结果只用于本次检测，不进入缓存
+            if not pending.invalidated:
+                self._scopes[scope] = buckets
+                while len(self._scopes) > self.max_scopes:
+                    self._scopes.popitem(last=False)
+        pending.done.set()
+        return buckets
+
+    def _insert(self,
+                buckets: List[Dict[int, List[Tuple[int, Any]]]],
+                fingerprint: int,
+                memory_id: Any) -> None:
+        for band, (shift, width) in enumerate(self.bands):
+            key = (fingerprint >> shift) & ((1 << width) - 1)
+            buckets[band].setdefault(key, []).append((fingerprint, memory_id))
+
+class CollectionDeduplicator:
+    """单个记忆集合的写入去重：检测近重复并合并到已有记忆
+
+    merge_ref用于从被合并的文档中提取引用（如知识块来源），追加到已有记忆的merged_from中。
+    """
+    def __init__(self,
+                 collection: Collection,
+                 detector: Optional[NearDuplicateDetector] = None,
+                 strength_bump: Optional[float] = None,
+                 merge_ref: Optional[Callable[[Dict[str, Any]], Optional[Dict[str, Any]]]] = None):
+        self.collection = collection
+        self.detector = detector or get_duplicate_detector()
+        dedup_params = MEMORY_PARAMS['dedup']
+        self.strength_bump = dedup_params['strength_bump'] if strength_bump is None else strength_bump
+        self.merge_ref = merge_ref
+
+    def _scope(self, user_id: str) -> str:
+        return f"{self.collection.name}:{user_id}"
+
+    def find_duplicate(self, user_id: str, content: str) -> Tuple[int, Optional[Any]]:
+        """返回(指纹, 近重复记忆id)"""
+        fingerprint = self.detector.fingerprint(content)
+
+        def load():
+            for doc in self.collection.find(
+                {'user_id': user_id, 'simhash': {'$exists': True}},
+                {'simhash': 1}
+            ):
+                yield from_signed64(doc['simhash']), doc['_id']
+            yield from self._backfill(user_id)
+
+        return fingerprint, self.detector.find(self._scope(user_id), fingerprint, load)
+
+    def _backfill(self, user_id: str) -> Iterable[Tuple[int, Any]]:
+        """为启用去重之前写入、没有指纹的记忆补算指纹并写回，使其也能参与检测"""
+        operations = []
+        for doc in self.collection.find(
+            {'user_id': user_id, 'simhash': {'$exists': False}},
+            {'content': 1}
+        ):
+            if not isinstance(doc.get('content'), str):
+                continue
+            fingerprint = self.detector.fingerprint(doc['content'])
+            operations.append(UpdateOne(
+                {'_id': doc['_id'], 'simhash': {'$exists': False}},
+                {'$set': {'simhash': to_signed64(fingerprint)}}
+            ))
+            yield fingerprint, doc['_id']
+        if operations:
+            self.collection.bulk_write(operations, ordered=False)
+
+    def register(self, user_id: str, fingerprint: int, memory_id: Any) -> None:
+        """登记新写入记忆的指纹"""
+        self.detector.add(self._scope(user_id), fingerprint, memory_id)
+
+    def merge_operation(self,
+                        memory_id: Any,
+                        memory_doc: Optional[Dict[str, Any]] = None) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        """合并到已有记忆的更新：出现次数加一，强度小幅提升（不超过1），记录被合并文档的引用"""
+        update = {
+            'occurrence_count': {'$add': [{'$ifNull': ['$occurrence_count', 1]}, 1]},
+            'strength': {'$min': [1.0, {'$add': ['$strength', self.strength_bump]}]},
+            'last_seen': datetime.now()
+        }
+        ref = self.merge_ref(memory_doc) if self.merge_ref and memory_doc else None
+        if ref:
+            update['merged_from'] = {'$setUnion': [{'$ifNull': ['$merged_from', []]}, [{'$literal': ref}]]}
+        return {'_id': memory_id}, [{'$set': update}]
+
+    def merge(self, memory_id: Any, memory_doc: Optional[Dict[str, Any]] = None) -> None:
+        """合并到已有记忆"""
+        self.collection.update_one(*self.merge_operation(memory_id, memory_doc))
+
+    def insert_or_merge(self, user_id: str, memory_doc: Dict[str, Any]) -> bool:
+        """写入记忆，与已有记忆近重复时合并；返回是否新写入"""
+        fingerprint, duplicate_id = self.find_duplicate(user_id, memory_doc['content'])
+        if duplicate_id is not None:
+            self.merge(duplicate_id, memory_doc)
+            return False
+
+        self._prepare(memory_doc, fingerprint)
+        try:
+            self.collection.insert_one(memory_doc)
+        except Exception:
+            self.invalidate(user_id)
+            raise
+        self.register(user_id, fingerprint, memory_doc['_id'])
+        return True
+
+    def insert_many_or_merge(self,
+                             user_id: str,
+                             memory_docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """批量写入：近重复（包括同一批内的重复）合并到已有记忆，其余新写入，整批一次bulk_write；返回新写入的文档"""
+        new_docs = []
+        operations = []
+        for memory_doc in memory_docs:
+            fingerprint, duplicate_id = self.find_duplicate(user_id, memory_doc['content'])
+            if duplicate_id is not None:
+                operations.append(UpdateOne(*self.merge_operation(duplicate_id, memory_doc)))
+                continue
+            self._prepare(memory_doc, fingerprint)
+            # 先登记，同一批后面的重复项也能检测到
+            self.register(user_id, fingerprint, memory_doc['_id'])
+            new_docs.append(memory_doc)
+            operations.append(InsertOne(memory_doc))
+
+        try:
+            # 有序执行：同一批内合并到新文档的更新排在其插入之后
+            if operations:
+                self.collection.bulk_write(operations)
+        except Exception:
+            self.invalidate(user_id)
+            raise
+        return new_docs
+
+    def _prepare(self, memory_doc: Dict[str, Any], fingerprint: int) -> None:
+        memory_doc['simhash'] = to_signed64(fingerprint)
+        memory_doc.setdefault('_id', ObjectId())
+        memory_doc.setdefault('occurrence_count', 1)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """该集合的去重统计"""
+        return self.detector.get_stats().get(
+            self.collection.name,
+            {'checks': 0, 'duplicates': 0, 'dedupe_rate': 0.0}
+        )
+
+    def invalidate(self, user_id: Optional[str] = None) -> None:
+        """记忆被更新或删除后清除索引"""
+        if user_id is None:
+            self.detector.invalidate_namespace(self.collection.name)
+        else:
+            self.detector.invalidate(self._scope(user_id))
+
+_detector: Optional[NearDuplicateDetector] = None
+_detector_lock = threading.Lock()
+
+def get_duplicate_detector() -> NearDuplicateDetector:
+    """获取全局共享的近重复检测器"""
+    global _detector
+    if _detector is None:
+        with _detector_lock:
+            if _detector is None:
+                dedup_params = MEMORY_PARAMS['dedup']
+                _detector = NearDuplicateDetector(
+                    max_distance=dedup_params['max_distance'],
+                    shingle_size=dedup_params['shingle_size']
+                )
+    return _detector
@@ -0,0 +1,175 @@
+from typing import List, Dict, Any, Optional, Tuple, Callable
+import os
+import numpy as np
+from config.emotion_config import EMOTION_STATES
+from config.memory_config import IMPORTANCE_KEYWORDS, LOW_IMPORTANCE_PROTOTYPES, MEMORY_PARAMS
+from src.emotion.models.emotion_analysis import EmotionAnalysis
+from ..models.memory_analysis import MemoryAnalysis
+
+class PrototypeClassifier:
+    """原型分类器：基于类别质心的最近质心分类，只依赖NumPy"""
+    def __init__(self,
+                 labels: List[str],
+                 centroids: np.ndarray,
+                 temperature: float = 0.05):
+        self.labels = list(labels)
+        self.centroids = self._normalize(np.asarray(centroids, dtype=np.float32))
+        # 原型质心保留下来，微调时作为先验
+        self.prototype_centroids = self.centroids.copy()
+        self.temperature = temperature
+
+    @classmethod
+    def from_prototypes(cls,
+                        encode_fn: Callable[[List[str]], np.ndarray],
+                        prototypes: Dict[str, List[str]],
+                        temperature: float = 0.05) -> 'PrototypeClassifier':
+        """用原型文本的嵌入均值构建各类别质心"""
+        labels = list(prototypes.keys())
+        texts = [text for label in labels for text in prototypes[label]]
+        embeddings = cls._normalize(np.asarray(encode_fn(texts), dtype=np.float32))
+
+        centroids = []
+        offset = 0
+        for label in labels:
+            count = len(prototypes[label])
+            centroids.append(embeddings[offset:offset + count].mean(axis=0))
+            offset += count
+
+        return cls(labels, np.vstack(centroids), temperature)
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def predict_proba(self, embeddings: np.ndarray) -> np.ndarray:
+        """计算各类别概率（对余弦相似度做softmax）"""
+        embeddings = self._normalize(np.atleast_2d(np.asarray(embeddings, dtype=np.float32)))
+        logits = embeddings @ self.centroids.T / self.temperature
+        logits -= logits.max(axis=1, keepdims=True)
+        probs = np.exp(logits)
+        return probs / probs.sum(axis=1, keepdims=True)
+
+    def predict(self, embedding: np.ndarray) -> Tuple[str, float, np.ndarray]:
+        """预测单条嵌入的类别，返回(类别, 置信度, 概率分布)"""
+        probs = self.predict_proba(embedding)[0]
+        index = int(np.argmax(probs))
+        return self.labels[index], float(probs[index]), probs
+
+    def fit(self,
+            embeddings: np.ndarray,
+            labels: List[str],
+            prior_weight: float = 4.0) -> None:
+        """用带标签的样本（例如LLM标注日志）微调质心
+
+        prior_weight表示原型质心相当于多少条样本，样本越多越接近数据质心。
+        """
+        embeddings = self._normalize(np.atleast_2d(np.asarray(embeddings, dtype=np.float32)))
+        labels = np.asarray(labels)
+
+        centroids = []
+        for index, label in enumerate(self.labels):
+            mask = labels == label
+            prior = self.prototype_centroids[index] * prior_weight
+            centroids.append(prior + embeddings[mask].sum(axis=0))
+        self.centroids = self._normalize(np.vstack(centroids))
+
+    def save(self, path: str) -> None:
+        """保存质心"""
+        np.savez(
+            path,
+            labels=np.asarray(self.labels),
+            centroids=self.centroids,
+            prototype_centroids=self.prototype_centroids,
+            temperature=self.temperature
+        )
+
+    @classmethod
+    def load(cls, path: str) -> 'PrototypeClassifier':
+        """加载质心"""
+        data = np.load(path)
+        classifier = cls(
+            [str(label) for label in data['labels']],
+            data['centroids'],
+            float(data['temperature'])
+        )
+        classifier.prototype_centroids = data['prototype_centroids']
+        return classifier
+
+class EmotionEmbeddingClassifier:
+    """情感向量分类器：基于情感关键词和触发词原型判断情感状态和强度"""
+    def __init__(self,
+                 encode_fn: Callable[[List[str]], np.ndarray],
+                 centroids_path: Optional[str] = None,
+                 temperature: float = 0.05):
+        self.encode_fn = encode_fn
+        self.emotion_states = EMOTION_STATES
+
+        if centroids_path and os.path.exists(centroids_path):
+            self.classifier = PrototypeClassifier.load(centroids_path)
+        else:
+            prototypes = {
+                state: config['keywords'] + config['triggers']
+                for state, config in self.emotion_states.items()
+            }
+            self.classifier = PrototypeClassifier.from_prototypes(encode_fn, prototypes, temperature)
+
+    def classify(self,
+                 text: str,
+                 embedding: Optional[np.ndarray] = None) -> EmotionAnalysis:
+        """对单条消息进行情感分类"""
+        if embedding is None:
+            embedding = self.encode_fn([text])[0]
+
+        state, confidence, _ = self.classifier.predict(embedding)
+
+        # 在该情感的强度区间内按置信度取值
+        low, high = self.emotion_states[state]['intensity_range']
+        intensity = low + (high - low) * confidence
+
+        return EmotionAnalysis(
+            emotion_state=state,
+            intensity=intensity,
+            reason="基于向量原型分类",
+            keywords=[state],
+            eq_score=0.5,
+            confidence=confidence,
+            method='embedding'
+        )
+
+class ImportanceEmbeddingClassifier:
+    """重要性向量分类器：基于重要关键词和寒暄原型判断记忆重要性"""
+    def __init__(self,
+                 encode_fn: Callable[[List[str]], np.ndarray],
+                 centroids_path: Optional[str] = None,
+                 temperature: float = 0.05):
+        self.encode_fn = encode_fn
+        self.importance_threshold = MEMORY_PARAMS['analysis']['importance_threshold']
+
+        if centroids_path and os.path.exists(centroids_path):
+            self.classifier = PrototypeClassifier.load(centroids_path)
+        else:
+            prototypes = {
+                'important': IMPORTANCE_KEYWORDS,
+                'trivial': LOW_IMPORTANCE_PROTOTYPES
+            }
+            self.classifier = PrototypeClassifier.from_prototypes(encode_fn, prototypes, temperature)
+
+    def classify(self,
+                 text: str,
+                 embedding: Optional[np.ndarray] = None) -> MemoryAnalysis:
+        """判断单条消息的记忆重要性"""
+        if embedding is None:
+            embedding = self.encode_fn([text])[0]
+
+        _, confidence, probs = self.classifier.predict(embedding)
+        importance_score = float(probs[self.classifier.labels.index('important')])
+        should_store = importance_score >= self.importance_threshold
+
+        return MemoryAnalysis(
+            should_store_in_ltm=should_store,
+            reason="基于向量原型分类",
+            importance_score=importance_score,
+            key_points=[text] if should_store else [],
+            confidence=confidence
+        )
@@ -0,0 +1,201 @@
+from typing import List, Dict, Any, Optional, Tuple
+import os
+import json
+import struct
+import threading
+import numpy as np
+from bson import ObjectId
+from pymongo.collection import Collection
+
+# 文件格式：魔数 + 头部长度 + JSON头部（填充到HEADER_SIZE），之后依次为向量、int8缩放系数、ObjectId
+MAGIC = b'KSHD'
+HEADER_SIZE = 4096
+# 检索时按块反量化，限制临时内存
+SEARCH_BLOCK_ROWS = 65536
+
+def build_knowledge_shard(collection: Collection,
+                          path: str,
+                          user_id: str = 'system',
+                          dtype: str = 'float16',
+                          batch_size: int = 4096) -> int:
+    """从知识库集合构建只读向量分片，写入临时文件后原子替换，返回向量数量
+
+    向量按行归一化后以float16或int8（每行一个缩放系数）存储。
+    """
+    if dtype not in ('float16', 'int8'):
+        raise ValueError(f"不支持的分片数据类型: {dtype}")
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+
+    ids: List[bytes] = []
+    scales: List[np.ndarray] = []
+    dim = 0
+
+    def write_batch(f, embeddings: List[List[float]]) -> None:
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        if dtype == 'int8':
+            scale = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127
+            scales.append(scale.astype(np.float32))
+            vectors = np.round(vectors / scale[:, None]).astype(np.int8)
+        else:
+            vectors = vectors.astype(np.float16)
+        f.write(vectors.tobytes())
+
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.seek(HEADER_SIZE)
+
+            # 流式读取，内存占用只与批大小有关（ObjectId每条12字节）
+            batch: List[List[float]] = []
+            cursor = collection.find(
+                {'user_id': user_id, 'embedding': {'$exists': True}},
+                {'_id': 1, 'embedding': 1},
+                batch_size=batch_size
+            )
+            for doc in cursor:
+                embedding = doc['embedding']
+                if not dim:
+                    dim = len(embedding)
+                if len(embedding) != dim:
+                    continue
+                ids.append(doc['_id'].binary)
+                batch.append(embedding)
+                if len(batch) >= batch_size:
+                    write_batch(f, batch)
+                    batch = []
+            if batch:
+                write_batch(f, batch)
+
+            count = len(ids)
+            itemsize = np.dtype(dtype).itemsize
+            vectors_offset = HEADER_SIZE
+            scales_offset = vectors_offset + count * dim * itemsize
+            if dtype == 'int8':
+                f.write(np.concatenate(scales).tobytes() if scales else b'')
+                ids_offset = scales_offset + count * 4
+            else:
+                ids_offset = scales_offset
+            f.write(b''.join(ids))
+
+            header = json.dumps({
+                'count': count,
+                'dim': dim,
+                'dtype': dtype,
+                'user_id': user_id,
+                'vectors_offset': vectors_offset,
+                'scales_offset': scales_offset,
+                'ids_offset': ids_offset
+            }).encode('utf-8')
+            if len(header) + 8 > HEADER_SIZE:
+                raise ValueError("分片头部过大")
+            f.seek(0)
+            f.write(MAGIC + struct.pack('<I', len(header)) + header)
+            f.flush()
+            os.fsync(f.fileno())
+
+        # 原子替换：正在读取旧分片的进程仍持有旧文件的映射，不受影响
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return count
+
+class KnowledgeShard:
+    """内存映射的只读知识向量分片
+
+    多个工作进程映射同一文件，向量页通过操作系统页缓存共享；
+    分片文件被重建替换后，下一次检索时自动重新映射。
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._stat_key: Optional[Tuple[int, int]] = None
+        self._state: Optional[Dict[str, Any]] = None
+
+    def available(self) -> bool:
+        """分片文件存在且可读"""
+        return self._current() is not None
+
+    def search(self,
+               query_embedding: np.ndarray,
+               limit: int) -> List[Tuple[ObjectId, float, np.ndarray]]:
+        """返回与查询最相似的向量：(ObjectId, 余弦相似度, 反量化后的嵌入)"""
+        state = self._current()
+        if state is None or state['count'] == 0 or limit <= 0:
+            return []
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+
+        count = state['count']
+        scores = np.empty(count, dtype=np.float32)
+        for start in range(0, count, SEARCH_BLOCK_ROWS):
+            end = min(start + SEARCH_BLOCK_ROWS, count)
+            scores[start:end] = self._rows(state, start, end) @ query
+
+        if limit < count:
+            candidates = np.argpartition(-scores, limit - 1)[:limit]
+        else:
+            candidates = np.arange(count)
+        candidates = candidates[np.argsort(-scores[candidates])]
+
+        return [
+            (
+                ObjectId(state['ids'][index].tobytes()),
+                float(scores[index]),
+                self._rows(state, index, index + 1)[0]
+            )
+            for index in candidates
+        ]
+
+    def _rows(self, state: Dict[str, Any], start: int, end: int) -> np.ndarray:
+        """反量化指定行"""
+        rows = state['vectors'][start:end].astype(np.float32)
+        if state['scales'] is not None:
+            rows *= state['scales'][start:end, None]
+        return rows
+
+    def _current(self) -> Optional[Dict[str, Any]]:
+        """检查分片文件是否被替换，必要时重新映射"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+
+        stat_key = (stat.st_ino, stat.st_mtime_ns)
+        with self._lock:
+            if stat_key != self._stat_key:
+                self._state = self._open()
+                self._stat_key = stat_key
+            return self._state
+
+    def _open(self) -> Optional[Dict[str, Any]]:
+        with open(self.path, 'rb') as f:
+            prefix = f.read(8)
+            if len(prefix) < 8 or prefix[:4] != MAGIC:
+                return None
+            header_length = struct.unpack('<I', prefix[4:])[0]
+            header = json.loads(f.read(header_length).decode('utf-8'))
+
+        count, dim, dtype = header['count'], header['dim'], header['dtype']
+        if count == 0:
+            return {'count': 0}
+
+        vectors = np.memmap(self.path, dtype=dtype, mode='r', offset=header['vectors_offset'], shape=(count, dim))
+        scales = None
+        if dtype == 'int8':
+            scales = np.memmap(self.path, dtype=np.float32, mode='r', offset=header['scales_offset'], shape=(count,))
+        ids = np.memmap(self.path, dtype=np.uint8, mode='r', offset=header['ids_offset'], shape=(count, 12))
+
+        return {
+            'count': count,
+            'dim': dim,
+            'user_id': header['user_id'],
+            'vectors': vectors,
+            'scales': scales,
+            'ids': ids
+        }
@@ -1,19 +1,54 @@
 from typing import Dict, Any, List, Optional
 import json
+import numpy as np
 from ..models.memory_analysis import MemoryAnalysis
-from config.memory_config import MEMORY_ANALYSIS_PROMPT, IMPORTANCE_KEYWORDS
+from config.memory_config import MEMORY_ANALYSIS_PROMPT, IMPORTANCE_KEYWORDS, MEMORY_PARAMS
 from src.llm.siliconflow import SiliconFlow
 from src.llm.base import BaseLLM
+from src.utils.analysis_cache import AnalysisCache, get_analysis_cache
+from src.utils.keyword_automaton import get_keyword_automaton
+from src.utils.label_log import log_analysis_label
+from .embedding_classifier import ImportanceEmbeddingClassifier
 
 class MemoryAnalyzer:
     """记忆分析器：分析对话内容的重要性"""
-    def __init__(self, llm: Optional[BaseLLM] = None):
+    # 提示词版本：修改提示词时需要更新，使旧的缓存结果失效
+    PROMPT_VERSION = 'v1'
+    
+    def __init__(self,
+                 llm: Optional[BaseLLM] = None,
+                 cache: Optional[AnalysisCache] = None,
+                 local_classifier: Optional[ImportanceEmbeddingClassifier] = None):
         self.llm = llm or SiliconFlow()
         self.importance_keywords = IMPORTANCE_KEYWORDS
+        self.cache = cache or get_analysis_cache()
+        # 可选：基于嵌入向量的本地分类器，置信度足够时不再调用LLM
+        self.local_classifier = local_classifier
+        self.confidence_threshold = MEMORY_PARAMS['analysis']['confidence_threshold']
         
-    def analyze_conversation(self, conversation: str) -> MemoryAnalysis:
+    def analyze_conversation(self,
+                             conversation: str,
+                             embedding: Optional[np.ndarray] = None) -> MemoryAnalysis:
         """分析对话内容"""
-        # 使用LLM分析对话内容
+        if self.local_classifier is not None:
+            local_analysis = self.local_classifier.classify(conversation, embedding)
+            if local_analysis.confidence >= self.confidence_threshold:
+                return local_analysis
+                
+        # 相同输入的分析结果直接复用
+        cache_key = self.cache.make_key('memory_analyzer', self.PROMPT_VERSION, conversation)
+        analysis = self.cache.get_or_compute(
+            cache_key,
+            lambda: self._llm_analysis(conversation)
+        )
+        
+        if analysis is None:
+            # 如果LLM分析失败，使用基于关键词的简单分析
+            return self._simple_analysis(conversation)
+        return analysis
+        
+    def _llm_analysis(self, conversation: str) -> Optional[MemoryAnalysis]:
+        """使用LLM分析对话内容，失败时返回None"""
         prompt = MEMORY_ANALYSIS_PROMPT.format(conversation=conversation)
         
         # 构建消息列表
@@ -36,12 +71,17 @@ class MemoryAnalyzer:
         )
         
         if not response or 'choices' not in response or not response['choices']:
-            # 如果LLM分析失败，使用基于关键词的简单分析
-            return self._simple_analysis(conversation)
+            return None
             
         try:
             # 解析LLM返回的JSON结果
             result = json.loads(response['choices'][0]['message']['content'])
+            log_analysis_label(
+                'importance',
+                conversation,
+                'important' if result.get('should_store_in_ltm', False) else 'trivial',
+                importance_score=result.get('importance_score', 0.0)
+            )
             return MemoryAnalysis(
                 should_store_in_ltm=result.get('should_store_in_ltm', False),
                 reason=result.get('reason', ''),
@@ -49,16 +89,15 @@ class MemoryAnalyzer:
                 key_points=result.get('key_points', [])
             )
         except json.JSONDecodeError:
-            # 如果JSON解析失败，使用基于关键词的简单分析
-            return self._simple_analysis(conversation)
+            return None
             
     def _simple_analysis(self, conversation: str) -> MemoryAnalysis:
         """基于关键词的简单分析"""
-        # 检查是否包含重要关键词
-        has_importance_keywords = any(keyword in conversation for keyword in self.importance_keywords)
+        # 一次扫描计算重要关键词出现次数
+        keyword_count = get_keyword_automaton().count(conversation)['importance']
         
-        # 计算关键词出现次数
-        keyword_count = sum(1 for keyword in self.importance_keywords if keyword in conversation)
+        # 检查是否包含重要关键词
+        has_importance_keywords = keyword_count > 0
         
         # 根据关键词出现次数计算重要性分数
         importance_score = min(1.0, keyword_count * 0.2)
@@ -1,21 +1,36 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Union
+from concurrent.futures import Executor
 import numpy as np
 from sentence_transformers import SentenceTransformer
 from ..models.memory_encoding import MemoryEncoding
+from src.utils.keyword_automaton import get_keyword_automaton
+from src.utils.tracing import get_tracer
 
 class MemoryEncoder:
     """记忆编码器：将对话内容编码为向量表示"""
+    # 模型调用的执行器：为空时在调用线程中执行；
+    # 服务端设置为固定大小的线程池，限制同时进行的模型推理数
+    executor: Optional[Executor] = None
+    
     def __init__(self, model_name: str = 'all-MiniLM-L6-v2'):
         self.model = SentenceTransformer(model_name)
         self.encoding_dim = self.model.get_sentence_embedding_dimension()
+        self.tracer = get_tracer()
         
     def encode_memory(self, 
                      content: str,
                      metadata: Dict[str, Any]) -> MemoryEncoding:
         """编码记忆内容"""
         # 生成文本嵌入
-        embedding = self.model.encode(content)
+        with self.tracer.span('encode', texts=1):
+            embedding = self._encode(content)
+        return self._build_encoding(content, embedding, metadata)
         
+    def _build_encoding(self,
+                        content: str,
+                        embedding: np.ndarray,
+                        metadata: Dict[str, Any]) -> MemoryEncoding:
+        """根据已生成的嵌入构建记忆编码"""
         # 计算记忆强度
         strength = self._calculate_memory_strength(content, metadata)
         
@@ -87,20 +102,36 @@ class MemoryEncoder:
         # 简单实现：按句子分割并选择重要句子
         sentences = content.split('。')
         key_points = []
+        automaton = get_keyword_automaton()
         
         for sentence in sentences:
             if len(sentence.strip()) > 0:
                 # 检查是否包含重要关键词
-                if any(keyword in sentence for keyword in ['重要', '关键', '必须', '一定']):
+                if automaton.has_any(sentence, 'key_point'):
                     key_points.append(sentence.strip())
                     
         return key_points
         
+    def encode_texts(self, texts: List[str]) -> np.ndarray:
+        """批量生成文本嵌入"""
+        with self.tracer.span('encode', texts=len(texts)):
+            return self._encode(texts)
+        
+    def _encode(self, texts: Union[str, List[str]]) -> np.ndarray:
+        """调用嵌入模型，设置了执行器时在执行器中运行并等待结果"""
+        if self.executor is None:
+            return self.model.encode(texts)
+        return self.executor.submit(self.model.encode, texts).result()
+        
     def encode_batch(self, 
                     contents: List[str],
                     metadata_list: List[Dict[str, Any]]) -> List[MemoryEncoding]:
-        """批量编码记忆内容"""
+        """批量编码记忆内容：一次模型调用生成全部嵌入"""
+        if not contents:
+            return []
+            
+        embeddings = self.encode_texts(contents)
         return [
-            self.encode_memory(content, metadata)
-            for content, metadata in zip(contents, metadata_list)
+            self._build_encoding(content, embedding, metadata)
+            for content, embedding, metadata in zip(contents, embeddings, metadata_list)
         ] 
\ No newline at end of file
@@ -3,19 +3,26 @@ from datetime import datetime, timedelta
 from pymongo import MongoClient
 from .memory_encoder import MemoryEncoder
 from .memory_retriever import MemoryRetriever
+from .dedup import CollectionDeduplicator, to_signed64
 from ..models.memory_encoding import MemoryEncoding
 from config.memory_config import MemoryConfig
 import numpy as np
 
 class MemoryManager:
     """记忆管理器：管理记忆的存储和更新"""
-    def __init__(self, config: MemoryConfig):
+    def __init__(self,
+                 config: MemoryConfig,
+                 mongo_client: Optional[MongoClient] = None,
+                 encoder: Optional[MemoryEncoder] = None):
         self.config = config
-        self.mongo_client = MongoClient()
+        # 未指定时连接默认的本地MongoDB
+        self.mongo_client = mongo_client or MongoClient()
         self.db = self.mongo_client['chatbot_db']
         self.memory_collection = self.db['memories']
-        self.encoder = MemoryEncoder()
+        self.encoder = encoder or MemoryEncoder()
         self.retriever = MemoryRetriever(self.mongo_client)
+        # 写入时的近重复检测
+        self.dedup = CollectionDeduplicator(self.memory_collection)
         
     def add_memory(self,
                   content: str,
@@ -37,8 +44,8 @@ class MemoryManager:
             'timestamp': datetime.now()
         }
         
-        # 存储到数据库
-        self.memory_collection.insert_one(memory_doc)
+        # 存储到数据库，与已有记忆近重复时合并
+        self.dedup.insert_or_merge(user_id, memory_doc)
         
     def update_memory(self,
                      memory_id: str,
@@ -48,8 +55,8 @@ class MemoryManager:
         # 编码新的记忆内容
         memory_encoding = self.encoder.encode_memory(new_content, new_metadata)
         
-        # 更新数据库记录
-        self.memory_collection.update_one(
+        # 更新数据库记录，同时取回所属用户以便只重建该用户的近重复索引
+        updated = self.memory_collection.find_one_and_update(
             {'_id': memory_id},
             {
                 '$set': {
@@ -59,10 +66,14 @@ class MemoryManager:
                     'memory_type': memory_encoding.memory_type,
                     'key_points': memory_encoding.key_points,
                     'metadata': new_metadata,
+                    'simhash': to_signed64(self.dedup.detector.fingerprint(new_content)),
                     'updated_at': datetime.now()
                 }
-            }
+            },
+            projection={'user_id': 1}
         )
+        if updated is not None:
+            self.dedup.invalidate(updated.get('user_id'))
         
     def get_memory_context(self,
                           query: str,
@@ -100,6 +111,9 @@ class MemoryManager:
         for memory_type, memories in memory_groups.items():
             self._consolidate_memory_group(memories)
             
+        # 整合会删除记忆，重建近重复索引
+        self.dedup.invalidate(user_id)
+            
     def _consolidate_memory_group(self, memories: List[Dict[str, Any]]) -> None:
         """整合同一类型的记忆组"""
         if len(memories) < 2:
@@ -144,6 +158,7 @@ class MemoryManager:
     def clear_memories(self, user_id: str) -> None:
         """清除用户的所有记忆"""
         self.memory_collection.delete_many({'user_id': user_id})
+        self.dedup.invalidate(user_id)
         
     def get_memory_stats(self, user_id: str) -> Dict[str, Any]:
         """获取记忆统计信息"""
@@ -169,5 +184,6 @@ class MemoryManager:
         return {
             'total_memories': total_memories,
             'type_counts': type_counts,
-            'latest_memory_time': latest_memory['timestamp'] if latest_memory else None
+            'latest_memory_time': latest_memory['timestamp'] if latest_memory else None,
+            'dedup': self.dedup.get_stats()
         } 
\ No newline at end of file
@@ -1,12 +1,16 @@
 from typing import List, Dict, Any, Optional
 from datetime import datetime
+import numpy as np
 from ..sources.base import MemorySource
 from ..models.memory_encoding import MemoryEncoding
+from .memory_encoder import MemoryEncoder
 
 class MultiSourceMemoryManager:
     """多源记忆管理器：整合和管理不同来源的记忆"""
-    def __init__(self):
+    def __init__(self, encoder: Optional[MemoryEncoder] = None):
         self.sources: Dict[str, MemorySource] = {}
+        # 查询编码器：未指定时使用已注册记忆源的编码器
+        self.encoder = encoder
         
     def register_source(self, source: MemorySource) -> None:
         """注册记忆源"""
@@ -29,22 +33,44 @@ class MultiSourceMemoryManager:
             else list(self.sources.values())
         )
         
+        # 查询只编码一次，各记忆源共用
+        query_embedding = self._encode_query(query, sources_to_query)
+        
         # 从每个源获取记忆
         for source in sources_to_query:
             memories = source.get_memories(
                 query=query,
                 user_id=user_id,
                 limit=limit,
-                time_range=time_range
+                time_range=time_range,
+                query_embedding=query_embedding
             )
             all_memories.extend(memories)
             
-        # 按记忆强度排序
-        all_memories.sort(key=lambda x: x.strength, reverse=True)
+        # 按检索分数跨源排序，没有检索分数的按记忆强度
+        all_memories.sort(
+            key=lambda x: x.metadata.get('retrieval_score', x.strength),
+            reverse=True
+        )
         
         # 返回前limit个记忆
         return all_memories[:limit]
         
+    def _encode_query(self,
+                      query: str,
+                      sources: List[MemorySource]) -> Optional[np.ndarray]:
+        """编码查询文本，空查询返回None"""
+        if not query:
+            return None
+            
+        encoder = self.encoder or next(
+            (source.encoder for source in sources if getattr(source, 'encoder', None) is not None),
+            None
+        )
+        if encoder is None:
+            return None
+        return encoder.encode_texts([query])[0]
+        
     def add_memory(self,
                   content: str,
                   user_id: str,
@@ -193,11 +219,11 @@ class MultiSourceMemoryManager:
                             memory2: MemoryEncoding) -> float:
         """计算两个记忆之间的相似度"""
         # 使用余弦相似度
-        dot_product = sum(a * b for a, b in zip(memory1.embedding, memory2.embedding))
-        norm1 = sum(a * a for a in memory1.embedding) ** 0.5
-        norm2 = sum(b * b for b in memory2.embedding) ** 0.5
+        embedding1 = np.asarray(memory1.embedding, dtype=np.float32)
+        embedding2 = np.asarray(memory2.embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(embedding1) * np.linalg.norm(embedding2))
         
-        if norm1 == 0 or norm2 == 0:
+        if norm == 0:
             return 0.0
             
-        return dot_product / (norm1 * norm2) 
\ No newline at end of file
+        return float(embedding1 @ embedding2) / norm 
\ No newline at end of file
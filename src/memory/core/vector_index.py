@@ -0,0 +1,198 @@
+from typing import List, Dict, Any, Optional, Tuple
+import threading
+from collections import OrderedDict
+from datetime import datetime
+import numpy as np
+from pymongo.collection import Collection
+
+class UserVectors:
+    """单个用户的记忆向量：归一化嵌入矩阵和对应的记忆文档（不含嵌入）"""
+    def __init__(self, dim: int):
+        self.docs: List[Dict[str, Any]] = []
+        self.ids = set()
+        self.size = 0
+        self.vectors = np.empty((0, dim), dtype=np.float32)
+        self.timestamps = np.empty(0, dtype=np.float64)
+        self.relevance = np.empty(0, dtype=np.float32)
+
+    def append(self, docs: List[Dict[str, Any]], timestamp_field: str = 'timestamp') -> None:
+        """追加记忆（跳过已有的_id），容量不足时按倍数扩容，避免每次写入都复制整个矩阵"""
+        docs = [doc for doc in docs if doc.get('_id') is None or doc['_id'] not in self.ids]
+        if not docs:
+            return
+        embeddings = np.asarray([doc['embedding'] for doc in docs], dtype=np.float32)
+        if self.size == 0 and self.vectors.shape[1] != embeddings.shape[1]:
+            self.vectors = np.empty((0, embeddings.shape[1]), dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        embeddings /= np.maximum(norms, 1e-12)
+
+        required = self.size + len(docs)
+        if required > len(self.vectors):
+            capacity = max(required, 2 * len(self.vectors), 16)
+            self.vectors = self._grow(self.vectors, capacity)
+            self.timestamps = self._grow(self.timestamps, capacity)
+            self.relevance = self._grow(self.relevance, capacity)
+
+        self.vectors[self.size:required] = embeddings
+        self.timestamps[self.size:required] = [doc[timestamp_field].timestamp() for doc in docs]
+        self.relevance[self.size:required] = [doc.get('relevance_score', 0.5) for doc in docs]
+        self.docs.extend({k: v for k, v in doc.items() if k != 'embedding'} for doc in docs)
+        self.ids.update(doc['_id'] for doc in docs if doc.get('_id') is not None)
+        self.size = required
+
+    @staticmethod
+    def _grow(array: np.ndarray, capacity: int) -> np.ndarray:
+        grown = np.empty((capacity,) + array.shape[1:], dtype=array.dtype)
+        grown[:len(array)] = array
+        return grown
+
+class _PendingLoad:
+    """正在从数据库加载的用户：加载期间写入的记忆暂存在docs中，加载完成后一并追加"""
+    def __init__(self):
+        self.done = threading.Event()
+        self.docs: List[Dict[str, Any]] = []
+        self.invalidated = False
+
+class VectorIndex:
+    """按用户缓存的向量索引：首次检索时加载用户全部记忆，之后每次检索只做一次矩阵乘法
+
+    prior为'relevance'时按relevance_score加权，为'recency'时按记忆时间指数衰减加权；
+    timestamp_field为记忆时间所在字段（知识库文档使用created_at）。
+    """
+    def __init__(self,
+                 collection: Collection,
+                 prior: str = 'relevance',
+                 similarity_weight: float = 0.8,
+                 recency_decay_rate: float = 0.1,
+                 max_users: int = 256,
+                 timestamp_field: str = 'timestamp'):
+        self.collection = collection
+        self.timestamp_field = timestamp_field
+        self.prior = prior
+        self.similarity_weight = similarity_weight
+        self.recency_decay_rate = recency_decay_rate
+        self.max_users = max_users
+        self._users: 'OrderedDict[str, UserVectors]' = OrderedDict()
+        self._loading: Dict[str, _PendingLoad] = {}
+        self._lock = threading.Lock()
+
+    def search(self,
+               user_id: str,
+               query_embedding: Optional[np.ndarray],
+               limit: int,
+               time_range: Optional[Tuple[datetime, datetime]] = None,
+               now: Optional[datetime] = None) -> List[Tuple[Dict[str, Any], np.ndarray, float]]:
+        """检索最相关的记忆，返回(记忆文档, 归一化嵌入, 检索分数)
+
+        没有查询向量时（如空查询）只按先验分数排序。
+        """
+        vectors = self._get_user(user_id)
+        # 追加写入只会写到size之后或换新数组，锁外读取前size行是安全的
+        with self._lock:
+            size = vectors.size
+            docs = vectors.docs
+            matrix = vectors.vectors[:size]
+            timestamps = vectors.timestamps[:size]
+            relevance = vectors.relevance[:size]
+        if size == 0 or limit <= 0:
+            return []
+
+        if self.prior == 'recency':
+            age_days = np.maximum(0.0, (now or datetime.now()).timestamp() - timestamps) / 86400
+            prior = np.exp(-self.recency_decay_rate * age_days)
+        else:
+            prior = relevance
+
+        if query_embedding is None:
+            scores = prior.astype(np.float64)
+        else:
+            query = np.asarray(query_embedding, dtype=np.float32)
+            query = query / max(float(np.linalg.norm(query)), 1e-12)
+            similarity = matrix @ query
+            scores = self.similarity_weight * similarity + (1 - self.similarity_weight) * prior
+
+        if time_range:
+            start_time, end_time = time_range
+            mask = (timestamps >= start_time.timestamp()) & (timestamps <= end_time.timestamp())
+            scores = np.where(mask, scores, -np.inf)
+
+        # 只对前limit个候选排序
+        if limit < size:
+            candidates = np.argpartition(-scores, limit - 1)[:limit]
+        else:
+            candidates = np.arange(size)
+        candidates = candidates[np.argsort(-scores[candidates])]
+
+        return [
+            (docs[index], matrix[index].copy(), float(scores[index]))
+            for index in candidates
+            if np.isfinite(scores[index])
+        ]
+
+    def _get_user(self, user_id: str) -> UserVectors:
+        """获取用户的向量缓存，未命中时从数据库加载一次
+
+        加载在全局锁外进行，同一用户的并发检索等待同一次加载，不阻塞其他用户的检索和写入。
+        """
+        while True:
+            with self._lock:
+                vectors = self._users.get(user_id)
+                if vectors is not None:
+                    self._users.move_to_end(user_id)
+                    return vectors
+                pending = self._loading.get(user_id)
+                if pending is None:
+                    pending = self._loading[user_id] = _PendingLoad()
+                    break
+            # 其他线程正在加载该用户，完成后重新查找（加载失败时由本线程重试）
+            pending.done.wait()
+
+        try:
+            docs = list(self.collection.find(
+                {'user_id': user_id, 'embedding': {'$exists': True}},
+                {
+                    'content': 1, 'embedding': 1, 'strength': 1, 'memory_type': 1,
+                    'key_points': 1, 'metadata': 1, 'relevance_score': 1, self.timestamp_field: 1
+                }
+            ))
+            dim = len(docs[0]['embedding']) if docs else 0
+            vectors = UserVectors(dim)
+            vectors.append(docs, self.timestamp_field)
+        except Exception:
+            with self._lock:
+                self._loading.pop(user_id, None)
+            pending.done.set()
+            raise
+
+        with self._lock:
+            # 补上加载期间写入的记忆，查询已读到的按_id跳过
+            vectors.append(pending.docs, self.timestamp_field)
+            self._loading.pop(user_id, None)
+            # 加载期间被清除的结果只用于本次检索，不进入缓存
+            if not pending.invalidated:
+                self._users[user_id] = vectors
+                while len(self._users) > self.max_users:
+                    self._users.popitem(last=False)
+        pending.done.set()
+        return vectors
+
+    def add(self, user_id: str, docs: List[Dict[str, Any]]) -> None:
+        """写入数据库后同步追加到已缓存的用户向量（未缓存的用户在下次检索时加载）"""
+        with self._lock:
+            vectors = self._users.get(user_id)
+            if vectors is not None:
+                vectors.append(docs, self.timestamp_field)
+            elif user_id in self._loading:
+                self._loading[user_id].docs.extend(docs)
+
+    def invalidate(self, user_id: Optional[str] = None) -> None:
+        """清除指定用户或全部用户的向量缓存"""
+        with self._lock:
+            if user_id is None:
+                self._users.clear()
+                loads = list(self._loading.values())
+            else:
+                self._users.pop(user_id, None)
+                loads = [self._loading[user_id]] if user_id in self._loading else []
+            for pending in loads:
+                pending.invalidated = True
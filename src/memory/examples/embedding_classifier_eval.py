@@ -0,0 +1,113 @@
+import argparse
+from typing import List, Dict, Any
+import numpy as np
+from src.utils.label_log import load_analysis_labels
+from ..core.memory_encoder import MemoryEncoder
+from ..core.embedding_classifier import EmotionEmbeddingClassifier, ImportanceEmbeddingClassifier
+
+def evaluate(labels: List[str], predictions: List[str]) -> Dict[str, Any]:
+    """计算与LLM标签的一致率和混淆矩阵"""
+    classes = sorted(set(labels) | set(predictions))
+    confusion = {actual: {predicted: 0 for predicted in classes} for actual in classes}
+    for actual, predicted in zip(labels, predictions):
+        confusion[actual][predicted] += 1
+
+    per_class = {}
+    for label in classes:
+        total = sum(confusion[label].values())
+        per_class[label] = confusion[label][label] / total if total else 0.0
+
+    agreement = sum(a == p for a, p in zip(labels, predictions)) / len(labels) if labels else 0.0
+    return {
+        'samples': len(labels),
+        'agreement': agreement,
+        'per_class': per_class,
+        'confusion': confusion
+    }
+
+def print_report(title: str, report: Dict[str, Any]) -> None:
+    """打印评估结果"""
+    print(f"\n{title}")
+    print(f"样本数: {report['samples']}")
+    print(f"与LLM标签一致率: {report['agreement']:.3f}")
+    print("各类别一致率:")
+    for label, rate in report['per_class'].items():
+        print(f"- {label}: {rate:.3f}")
+
+def run_task(task: str,
+             records: List[Dict[str, Any]],
+             classifier: Any,
+             encoder: MemoryEncoder,
+             test_ratio: float,
+             save_path: str = None) -> None:
+    """评估单个任务：原型分类器，以及用部分日志微调后的分类器"""
+    if not records:
+        print(f"\n{task}: 没有可用的标签记录")
+        return
+
+    texts = [record['text'] for record in records]
+    labels = [record['label'] for record in records]
+    embeddings = np.asarray(encoder.encode_texts(texts))
+
+    predictions = [classifier.classify(text, embedding) for text, embedding in zip(texts, embeddings)]
+    if task == 'emotion':
+        predicted_labels = [p.emotion_state for p in predictions]
+        intensities = np.array([p.intensity for p in predictions])
+        llm_intensities = np.array([float(r.get('intensity', 0.5)) for r in records])
+    else:
+        predicted_labels = ['important' if p.should_store_in_ltm else 'trivial' for p in predictions]
+    print_report(f"[{task}] 原型分类器", evaluate(labels, predicted_labels))
+    if task == 'emotion':
+        print(f"强度平均绝对误差: {np.abs(intensities - llm_intensities).mean():.3f}")
+
+    # 按比例划分训练集和测试集，评估微调效果
+    rng = np.random.default_rng(0)
+    order = rng.permutation(len(records))
+    split = int(len(records) * (1 - test_ratio))
+    train, test = order[:split], order[split:]
+    if len(train) == 0 or len(test) == 0:
+        return
+
+    classifier.classifier.fit(embeddings[train], [labels[i] for i in train])
+    tuned = [classifier.classify(texts[i], embeddings[i]) for i in test]
+    if task == 'emotion':
+        tuned_labels = [p.emotion_state for p in tuned]
+    else:
+        tuned_labels = ['important' if p.should_store_in_ltm else 'trivial' for p in tuned]
+    print_report(f"[{task}] 微调后（测试集）", evaluate([labels[i] for i in test], tuned_labels))
+
+    if save_path:
+        # 保存用全部样本微调的质心
+        classifier.classifier.fit(embeddings, labels)
+        classifier.classifier.save(save_path)
+        print(f"质心已保存到: {save_path}")
+
+def main():
+    parser = argparse.ArgumentParser(description="离线评估向量分类器与LLM标签的一致率")
+    parser.add_argument('label_log', help="ANALYSIS_LABEL_LOG记录的标签日志路径")
+    parser.add_argument('--test-ratio', type=float, default=0.2, help="微调评估的测试集比例")
+    parser.add_argument('--save-emotion', help="保存微调后的情感质心（.npz）")
+    parser.add_argument('--save-importance', help="保存微调后的重要性质心（.npz）")
+    args = parser.parse_args()
+
+    encoder = MemoryEncoder()
+
+    run_task(
+        'emotion',
+        load_analysis_labels(args.label_log, 'emotion'),
+        EmotionEmbeddingClassifier(encoder.encode_texts),
+        encoder,
+        args.test_ratio,
+        args.save_emotion
+    )
+    run_task(
+        'importance',
+        load_analysis_labels(args.label_log, 'importance'),
+        ImportanceEmbeddingClassifier(encoder.encode_texts),
+        encoder,
+        args.test_ratio,
+        args.save_importance
+    )
+
+if __name__ == "__main__":
+    main()
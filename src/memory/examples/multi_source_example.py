@@ -2,17 +2,19 @@ from pymongo import MongoClient
 from ..sources.conversation_source import ConversationMemorySource
 from ..sources.knowledge_source import KnowledgeMemorySource
 from ..core.multi_source_manager import MultiSourceMemoryManager
+from ..core.memory_encoder import MemoryEncoder
 
 def main():
     # 初始化MongoDB客户端
     mongo_client = MongoClient('mongodb://localhost:27017/')
     
-    # 创建记忆源
-    conversation_source = ConversationMemorySource(mongo_client)
-    knowledge_source = KnowledgeMemorySource(mongo_client)
+    # 创建记忆源（共用一个编码器）
+    encoder = MemoryEncoder()
+    conversation_source = ConversationMemorySource(mongo_client, encoder)
+    knowledge_source = KnowledgeMemorySource(mongo_client, encoder)
     
     # 创建多源记忆管理器
-    memory_manager = MultiSourceMemoryManager()
+    memory_manager = MultiSourceMemoryManager(encoder)
     
     # 注册记忆源
     memory_manager.register_source(conversation_source)
@@ -55,6 +57,7 @@ def main():
     print("查询结果:")
     for memory in memories:
         print(f"来源: {memory.metadata.get('source', 'unknown')}")
+        print(f"检索分数: {memory.metadata.get('retrieval_score', 0.0):.3f}")
         print(f"内容: {memory.content}")
         print(f"强度: {memory.strength}")
         print(f"类型: {memory.memory_type}")
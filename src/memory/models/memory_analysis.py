@@ -7,4 +7,5 @@ class MemoryAnalysis:
     should_store_in_ltm: bool  # 是否应该存储在长期记忆中
     reason: str               # 分析原因
     importance_score: float   # 重要性分数（0-1）
-    key_points: List[str]    # 关键点列表 
\ No newline at end of file
+    key_points: List[str]    # 关键点列表
+    confidence: float = 1.0   # 分析置信度（0-1）
\ No newline at end of file
@@ -1,11 +1,18 @@
 from abc import ABC, abstractmethod
 from typing import List, Dict, Any, Optional
 from datetime import datetime
+import numpy as np
 from ..models.memory_encoding import MemoryEncoding
+from ..core.vector_index import VectorIndex
+from ..core.dedup import CollectionDeduplicator
 
 class MemorySource(ABC):
     """记忆源基类：定义记忆源的基本接口"""
     
+    # 子类在初始化时创建，分别缓存各用户的记忆向量和去重指纹
+    index: VectorIndex
+    dedup: CollectionDeduplicator
+    
     @abstractmethod
     def get_source_name(self) -> str:
         """获取记忆源名称"""
@@ -16,8 +23,9 @@ class MemorySource(ABC):
                     query: str,
                     user_id: str,
                     limit: int = 10,
-                    time_range: Optional[tuple[datetime, datetime]] = None) -> List[MemoryEncoding]:
-        """获取记忆"""
+                    time_range: Optional[tuple[datetime, datetime]] = None,
+                    query_embedding: Optional[np.ndarray] = None) -> List[MemoryEncoding]:
+        """获取记忆，query_embedding为已计算好的查询向量（多个记忆源共用）"""
         pass
         
     @abstractmethod
@@ -44,4 +52,46 @@ class MemorySource(ABC):
     @abstractmethod
     def get_memory_stats(self, user_id: str) -> Dict[str, Any]:
         """获取记忆统计信息"""
-        pass 
\ No newline at end of file
+        pass
+        
+    def _search_index(self,
+                      query: str,
+                      user_id: str,
+                      limit: int,
+                      time_range: Optional[tuple[datetime, datetime]],
+                      query_embedding: Optional[np.ndarray]) -> List[MemoryEncoding]:
+        """通过向量索引检索记忆，需要子类提供index和encoder"""
+        if query_embedding is None and query:
+            query_embedding = self.encoder.encode_texts([query])[0]
+            
+        results = self.index.search(user_id, query_embedding, limit, time_range)
+        return [
+            self._to_memory_encoding(memory, embedding, score)
+            for memory, embedding, score in results
+        ]
+        
+    def _invalidate_user(self, memory_doc: Optional[Dict[str, Any]]) -> None:
+        """记忆被更新或删除后，清除其所属用户的向量索引和去重索引"""
+        if memory_doc is not None:
+            # 没有user_id的文档无法确定范围，清除全部用户
+            self.index.invalidate(memory_doc.get('user_id'))
+            self.dedup.invalidate(memory_doc.get('user_id'))
+            
+    def _to_memory_encoding(self,
+                            memory: Dict[str, Any],
+                            embedding: np.ndarray,
+                            score: float) -> MemoryEncoding:
+        """将检索到的记忆文档转换为MemoryEncoding，元数据中附带id、来源和检索分数"""
+        return MemoryEncoding(
+            content=memory['content'],
+            embedding=embedding,
+            strength=memory['strength'],
+            memory_type=memory['memory_type'],
+            key_points=memory['key_points'],
+            metadata={
+                **memory['metadata'],
+                'id': memory['_id'],
+                'source': self.get_source_name(),
+                'retrieval_score': score
+            }
+        )
@@ -1,16 +1,33 @@
 from typing import List, Dict, Any, Optional
 from datetime import datetime
+import numpy as np
 from pymongo import MongoClient
+from config.memory_config import MEMORY_PARAMS
 from .base import MemorySource
 from ..models.memory_encoding import MemoryEncoding
 from ..core.memory_encoder import MemoryEncoder
+from ..core.vector_index import VectorIndex
+from ..core.dedup import CollectionDeduplicator, to_signed64
 
 class ConversationMemorySource(MemorySource):
     """对话记忆源：管理对话相关的记忆"""
-    def __init__(self, mongo_client: MongoClient):
+    def __init__(self,
+                 mongo_client: MongoClient,
+                 encoder: Optional[MemoryEncoder] = None):
         self.db = mongo_client['chatbot_db']
         self.collection = self.db['conversation_memories']
-        self.encoder = MemoryEncoder()
+        self.collection.create_index('user_id')
+        self.encoder = encoder or MemoryEncoder()
+        # 写入时的近重复检测
+        self.dedup = CollectionDeduplicator(self.collection)
+        
+        # 按用户缓存的向量索引，检索分数混合时效性
+        self.index = VectorIndex(
+            self.collection,
+            prior='recency',
+            similarity_weight=MEMORY_PARAMS['retrieval']['similarity_weight'],
+            recency_decay_rate=MEMORY_PARAMS['retrieval']['recency_decay_rate']
+        )
         
     def get_source_name(self) -> str:
         return "conversation"
@@ -19,36 +36,10 @@ class ConversationMemorySource(MemorySource):
                     query: str,
                     user_id: str,
                     limit: int = 10,
-                    time_range: Optional[tuple[datetime, datetime]] = None) -> List[MemoryEncoding]:
-        """获取对话记忆"""
-        # 构建查询条件
-        query_conditions = {'user_id': user_id}
-        if time_range:
-            start_time, end_time = time_range
-            query_conditions['timestamp'] = {
-                '$gte': start_time,
-                '$lte': end_time
-            }
-            
-        # 获取记忆
-        memories = list(self.collection.find(
-            query_conditions,
-            sort=[('timestamp', -1)],
-            limit=limit
-        ))
-        
-        # 转换为MemoryEncoding对象
-        return [
-            MemoryEncoding(
-                content=memory['content'],
-                embedding=memory['embedding'],
-                strength=memory['strength'],
-                memory_type=memory['memory_type'],
-                key_points=memory['key_points'],
-                metadata=memory['metadata']
-            )
-            for memory in memories
-        ]
+                    time_range: Optional[tuple[datetime, datetime]] = None,
+                    query_embedding: Optional[np.ndarray] = None) -> List[MemoryEncoding]:
+        """按查询语义检索对话记忆"""
+        return self._search_index(query, user_id, limit, time_range, query_embedding)
         
     def add_memory(self,
                   content: str,
@@ -70,8 +61,9 @@ class ConversationMemorySource(MemorySource):
             'timestamp': datetime.now()
         }
         
-        # 存储到数据库
-        self.collection.insert_one(memory_doc)
+        # 存储到数据库（近重复时合并到已有记忆），新写入的追加到已缓存的向量索引
+        if self.dedup.insert_or_merge(user_id, memory_doc):
+            self.index.add(user_id, [memory_doc])
         
     def update_memory(self,
                      memory_id: str,
@@ -81,8 +73,8 @@ class ConversationMemorySource(MemorySource):
         # 编码新的记忆内容
         memory_encoding = self.encoder.encode_memory(new_content, new_metadata)
         
-        # 更新数据库记录
-        self.collection.update_one(
+        # 更新数据库记录，同时取回所属用户以便只清除该用户的缓存
+        updated = self.collection.find_one_and_update(
             {'_id': memory_id},
             {
                 '$set': {
@@ -92,14 +84,18 @@ class ConversationMemorySource(MemorySource):
                     'memory_type': memory_encoding.memory_type,
                     'key_points': memory_encoding.key_points,
                     'metadata': new_metadata,
+                    'simhash': to_signed64(self.dedup.detector.fingerprint(new_content)),
                     'updated_at': datetime.now()
                 }
-            }
+            },
+            projection={'user_id': 1}
         )
+        self._invalidate_user(updated)
         
     def delete_memory(self, memory_id: str) -> None:
         """删除对话记忆"""
-        self.collection.delete_one({'_id': memory_id})
+        deleted = self.collection.find_one_and_delete({'_id': memory_id}, projection={'user_id': 1})
+        self._invalidate_user(deleted)
         
     def get_memory_stats(self, user_id: str) -> Dict[str, Any]:
         """获取对话记忆统计信息"""
@@ -125,5 +121,6 @@ class ConversationMemorySource(MemorySource):
         return {
             'total_memories': total_memories,
             'type_counts': type_counts,
-            'latest_memory_time': latest_memory['timestamp'] if latest_memory else None
+            'latest_memory_time': latest_memory['timestamp'] if latest_memory else None,
+            'dedup': self.dedup.get_stats()
         } 
\ No newline at end of file
@@ -1,16 +1,54 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Set, Tuple
+import os
 from datetime import datetime
+import numpy as np
 from pymongo import MongoClient
+from config.memory_config import MEMORY_PARAMS
 from .base import MemorySource
 from ..models.memory_encoding import MemoryEncoding
 from ..core.memory_encoder import MemoryEncoder
+from ..core.vector_index import VectorIndex
+from ..core.dedup import CollectionDeduplicator, to_signed64
+from ..core.knowledge_shard import KnowledgeShard, build_knowledge_shard
 
 class KnowledgeMemorySource(MemorySource):
-    """知识记忆源：管理知识库相关的记忆"""
-    def __init__(self, mongo_client: MongoClient):
+    """知识记忆源：管理知识库相关的记忆
+
+    知识直接存储在knowledge_base集合中（每个知识块一个文档，同时包含知识库字段和嵌入等记忆字段），
+    记忆视图从同一文档投影得到，记忆时间取created_at。
+    """
+    def __init__(self,
+                 mongo_client: MongoClient,
+                 encoder: Optional[MemoryEncoder] = None):
         self.db = mongo_client['chatbot_db']
-        self.collection = self.db['knowledge_memories']
-        self.encoder = MemoryEncoder()
+        self.collection = self.db['knowledge_base']
+        self.collection.create_index('user_id')
+        self.collection.create_index([('user_id', 1), ('metadata.source_file', 1)])
+        self.encoder = encoder or MemoryEncoder()
+        # 写入时的近重复检测，被合并的知识块记录在已有文档的merged_from中
+        self.dedup = CollectionDeduplicator(self.collection, merge_ref=self._merge_ref)
+        
+        # 按用户缓存的向量索引，检索分数混合相关性分数
+        self.index = VectorIndex(
+            self.collection,
+            prior='relevance',
+            similarity_weight=MEMORY_PARAMS['retrieval']['similarity_weight'],
+            recency_decay_rate=MEMORY_PARAMS['retrieval']['recency_decay_rate'],
+            timestamp_field='created_at'
+        )
+        
+        # 全局知识（共享用户）使用内存映射的向量分片，多个进程共享同一份向量
+        shard_path, self.shard_user, self.shard_dtype = self.shard_config()
+        self.shard = KnowledgeShard(shard_path) if shard_path else None
+        
+    @staticmethod
+    def shard_config() -> Tuple[str, str, str]:
+        """全局知识向量分片配置：(分片路径, 共享用户, 存储类型)"""
+        return (
+            os.getenv('KNOWLEDGE_SHARD_PATH', os.path.join('data', 'knowledge_shard.bin')),
+            os.getenv('KNOWLEDGE_SHARD_USER', 'system'),
+            os.getenv('KNOWLEDGE_SHARD_DTYPE', 'float16')
+        )
         
     def get_source_name(self) -> str:
         return "knowledge"
@@ -19,37 +57,64 @@ class KnowledgeMemorySource(MemorySource):
                     query: str,
                     user_id: str,
                     limit: int = 10,
-                    time_range: Optional[tuple[datetime, datetime]] = None) -> List[MemoryEncoding]:
-        """获取知识记忆"""
-        # 构建查询条件
-        query_conditions = {'user_id': user_id}
-        if time_range:
-            start_time, end_time = time_range
-            query_conditions['timestamp'] = {
-                '$gte': start_time,
-                '$lte': end_time
-            }
+                    time_range: Optional[tuple[datetime, datetime]] = None,
+                    query_embedding: Optional[np.ndarray] = None) -> List[MemoryEncoding]:
+        """按查询语义检索知识记忆"""
+        if (self.shard is not None
+                and user_id == self.shard_user
+                and time_range is None
+                and (query or query_embedding is not None)
+                and self.shard.available()):
+            return self._search_shard(query, limit, query_embedding)
+        return self._search_index(query, user_id, limit, time_range, query_embedding)
+        
+    def _search_shard(self,
+                      query: str,
+                      limit: int,
+                      query_embedding: Optional[np.ndarray]) -> List[MemoryEncoding]:
+        """通过向量分片检索全局知识：多取候选，再混合相关性分数重排
+
+        分片在导入后重建，重建前新写入的知识暂时检索不到。
+        """
+        if query_embedding is None:
+            query_embedding = self.encoder.encode_texts([query])[0]
             
-        # 获取记忆
-        memories = list(self.collection.find(
-            query_conditions,
-            sort=[('relevance_score', -1)],
-            limit=limit
-        ))
+        candidates = self.shard.search(query_embedding, limit * 4)
+        memories = {
+            memory['_id']: memory
+            for memory in self.collection.find(
+                {'_id': {'$in': [memory_id for memory_id, _, _ in candidates]}},
+                {'embedding': 0}
+            )
+        }
         
-        # 转换为MemoryEncoding对象
+        weight = self.index.similarity_weight
+        results = []
+        for memory_id, similarity, embedding in candidates:
+            memory = memories.get(memory_id)
+            if memory is None:
+                # 分片重建前已被删除
+                continue
+            score = weight * similarity + (1 - weight) * memory.get('relevance_score', 0.5)
+            results.append((memory, embedding, score))
+            
+        results.sort(key=lambda result: result[2], reverse=True)
         return [
-            MemoryEncoding(
-                content=memory['content'],
-                embedding=memory['embedding'],
-                strength=memory['strength'],
-                memory_type=memory['memory_type'],
-                key_points=memory['key_points'],
-                metadata=memory['metadata']
-            )
-            for memory in memories
+            self._to_memory_encoding(memory, embedding, score)
+            for memory, embedding, score in results[:limit]
         ]
         
+    def rebuild_shard(self) -> int:
+        """重建全局知识向量分片，返回向量数量"""
+        if self.shard is None:
+            return 0
+        return build_knowledge_shard(
+            self.collection,
+            self.shard.path,
+            self.shard_user,
+            self.shard_dtype
+        )
+        
     def add_memory(self,
                   content: str,
                   user_id: str,
@@ -58,24 +123,70 @@ class KnowledgeMemorySource(MemorySource):
         # 编码记忆内容
         memory_encoding = self.encoder.encode_memory(content, metadata)
         
+        # 存储到数据库，并追加到已缓存的向量索引
+        memory_doc = self._memory_doc(memory_encoding, user_id)
+        if self.dedup.insert_or_merge(user_id, memory_doc):
+            self.index.add(user_id, [memory_doc])
+        
+    def add_memories(self,
+                     memory_encodings: List[MemoryEncoding],
+                     user_id: str) -> None:
+        """批量添加已编码的知识记忆，近重复的合并到已有记忆，其余一次insert_many写入"""
+        if not memory_encodings:
+            return
+            
+        memory_docs = [
+            self._memory_doc(memory_encoding, user_id)
+            for memory_encoding in memory_encodings
+        ]
+        new_docs = self.dedup.insert_many_or_merge(user_id, memory_docs)
+        self.index.add(user_id, new_docs)
+        
+    def _memory_doc(self,
+                    memory_encoding: MemoryEncoding,
+                    user_id: str) -> Dict[str, Any]:
+        """构建知识记忆文档"""
         # 计算相关性分数
-        relevance_score = self._calculate_relevance_score(content, metadata)
+        relevance_score = self._calculate_relevance_score(
+            memory_encoding.content,
+            memory_encoding.metadata
+        )
         
-        # 准备存储数据
-        memory_doc = {
+        return {
             'user_id': user_id,
-            'content': content,
+            'content': memory_encoding.content,
             'embedding': memory_encoding.embedding.tolist(),
             'strength': memory_encoding.strength,
             'memory_type': memory_encoding.memory_type,
             'key_points': memory_encoding.key_points,
-            'metadata': metadata,
+            'metadata': memory_encoding.metadata,
             'relevance_score': relevance_score,
-            'timestamp': datetime.now()
+            'created_at': datetime.now()
         }
         
-        # 存储到数据库
-        self.collection.insert_one(memory_doc)
+    @staticmethod
+    def _merge_ref(memory_doc: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """被合并知识块的来源引用，用于增量导入判断知识块是否已写入"""
+        metadata = memory_doc.get('metadata') or {}
+        if 'chunk_hash' not in metadata:
+            return None
+        return {'source_file': metadata.get('source_file'), 'chunk_hash': metadata['chunk_hash']}
+        
+    def committed_chunks(self, user_id: str, source_file: str) -> Set[str]:
+        """来自指定文件的已写入知识块哈希，包括合并到其他知识的块"""
+        committed = set(self.collection.distinct(
+            'metadata.chunk_hash',
+            {'user_id': user_id, 'metadata.source_file': source_file}
+        ))
+        for doc in self.collection.find(
+            {'user_id': user_id, 'merged_from.source_file': source_file},
+            {'merged_from': 1}
+        ):
+            committed.update(
+                ref['chunk_hash'] for ref in doc['merged_from']
+                if ref.get('source_file') == source_file
+            )
+        return committed
         
     def update_memory(self,
                      memory_id: str,
@@ -88,8 +199,8 @@ class KnowledgeMemorySource(MemorySource):
         # 计算新的相关性分数
         relevance_score = self._calculate_relevance_score(new_content, new_metadata)
         
-        # 更新数据库记录
-        self.collection.update_one(
+        # 更新数据库记录，同时取回所属用户以便只清除该用户的缓存
+        updated = self.collection.find_one_and_update(
             {'_id': memory_id},
             {
                 '$set': {
@@ -99,15 +210,82 @@ class KnowledgeMemorySource(MemorySource):
                     'memory_type': memory_encoding.memory_type,
                     'key_points': memory_encoding.key_points,
                     'metadata': new_metadata,
+                    'simhash': to_signed64(self.dedup.detector.fingerprint(new_content)),
                     'relevance_score': relevance_score,
                     'updated_at': datetime.now()
                 }
-            }
+            },
+            projection={'user_id': 1}
         )
+        self._invalidate_user(updated)
         
     def delete_memory(self, memory_id: str) -> None:
         """删除知识记忆"""
-        self.collection.delete_one({'_id': memory_id})
+        deleted = self.collection.find_one_and_delete({'_id': memory_id}, projection={'user_id': 1})
+        self._invalidate_user(deleted)
+        
+    def delete_source_memories(self,
+                               user_id: str,
+                               source_file: str,
+                               chunk_hashes: Optional[List[str]] = None) -> int:
+        """删除来自指定文件（可限定知识块哈希）的知识，返回撤回的知识块数量
+
+        被删除的文档若合并了其他文件（或本文件未撤回）的知识块，改由其中一个知识块接替该文档
+        （内容为近重复的原文，来源改为该知识块），其余引用保留，避免这些块的知识随之丢失；
+        合并到其他知识的块从其merged_from中移除，并相应减少出现次数。
+        """
+        query_conditions = {'user_id': user_id, 'metadata.source_file': source_file}
+        if chunk_hashes is not None:
+            query_conditions['metadata.chunk_hash'] = {'$in': chunk_hashes}
+        retracted_hashes = set(chunk_hashes) if chunk_hashes is not None else None
+        
+        def retracted(ref: Dict[str, Any]) -> bool:
+            return ref.get('source_file') == source_file and (
+                retracted_hashes is None or ref.get('chunk_hash') in retracted_hashes
+            )
+            
+        delete_ids = []
+        promoted = 0
+        for doc in self.collection.find(query_conditions, {'merged_from': 1, 'occurrence_count': 1}):
+            merged_from = doc.get('merged_from') or []
+            kept = [ref for ref in merged_from if not retracted(ref)]
+            if not kept:
+                delete_ids.append(doc['_id'])
+                continue
+            # 第一个保留的引用接替该文档，出现次数减去撤回的本块和被撤回的引用
+            successor = kept[0]
+            occurrence_count = doc.get('occurrence_count', 1) - 1 - (len(merged_from) - len(kept))
+            self.collection.update_one({'_id': doc['_id']}, {'$set': {
+                'metadata.source_file': successor['source_file'],
+                'metadata.chunk_hash': successor['chunk_hash'],
+                'merged_from': kept[1:],
+                'occurrence_count': max(1, occurrence_count)
+            }})
+            promoted += 1
+        if delete_ids:
+            self.collection.delete_many({'_id': {'$in': delete_ids}})
+        
+        is_retracted = {'$eq': ['$$ref.source_file', source_file]}
+        if chunk_hashes is not None:
+            is_retracted = {'$and': [is_retracted, {'$in': ['$$ref.chunk_hash', chunk_hashes]}]}
+        kept = {'$filter': {'input': '$merged_from', 'as': 'ref', 'cond': {'$not': [is_retracted]}}}
+        merged_conditions = {'user_id': user_id, 'merged_from.source_file': source_file}
+        if chunk_hashes is not None:
+            merged_conditions['merged_from.chunk_hash'] = {'$in': chunk_hashes}
+        self.collection.update_many(merged_conditions, [
+            {'$set': {'_kept': kept}},
+            {'$set': {
+                'occurrence_count': {'$subtract': [
+                    {'$ifNull': ['$occurrence_count', 1]},
+                    {'$subtract': [{'$size': '$merged_from'}, {'$size': '$_kept'}]}
+                ]},
+                'merged_from': '$_kept'
+            }},
+            {'$unset': '_kept'}
+        ])
+        self.index.invalidate(user_id)
+        self.dedup.invalidate(user_id)
+        return len(delete_ids) + promoted
         
     def get_memory_stats(self, user_id: str) -> Dict[str, Any]:
         """获取知识记忆统计信息"""
@@ -127,13 +305,14 @@ class KnowledgeMemorySource(MemorySource):
         # 获取最近记忆时间
         latest_memory = self.collection.find_one(
             {'user_id': user_id},
-            sort=[('timestamp', -1)]
+            sort=[('created_at', -1)]
         )
         
         return {
             'total_memories': total_memories,
             'type_counts': type_counts,
-            'latest_memory_time': latest_memory['timestamp'] if latest_memory else None
+            'latest_memory_time': latest_memory['created_at'] if latest_memory else None,
+            'dedup': self.dedup.get_stats()
         }
         
     def _calculate_relevance_score(self, content: str, metadata: Dict[str, Any]) -> float:
@@ -0,0 +1,114 @@
+from typing import List, Callable, Iterable, Iterator, Tuple
+from collections import deque
+import re
+from src.utils.tokens import count_tokens
+
+# 句子结束位置：中英文句末标点（含后续引号括号）、英文句点后接空白、空行
+_SENTENCE_END = re.compile(
+    r'(?:[。！？!?；;…]+[”’"\'」』）)]*|\.[”’"\'」』）)]*(?=\s)|\n\s*\n)\s*'
+)
+
+class TextChunker:
+    """流式分块器：按句子边界切分文本，按token数组块，逐块惰性产出
+
+    文件按固定大小增量读取，内存占用只与单个知识块大小有关。
+    """
+    def __init__(self,
+                 chunk_tokens: int = 512,
+                 overlap_tokens: int = 64,
+                 token_counter: Callable[[str], int] = count_tokens,
+                 read_size: int = 1 << 16):
+        self.chunk_tokens = max(1, chunk_tokens)
+        # 重叠部分必须小于块大小，保证每个块都有新内容
+        self.overlap_tokens = max(0, min(overlap_tokens, self.chunk_tokens // 2))
+        self.token_counter = token_counter
+        self.read_size = read_size
+
+    def chunk_file(self, file_path: str, encoding: str = 'utf-8') -> Iterator[str]:
+        """增量读取文件并逐块产出"""
+        def read_blocks():
+            with open(file_path, 'r', encoding=encoding) as f:
+                while True:
+                    block = f.read(self.read_size)
+                    if not block:
+                        break
+                    yield block
+
+        return self.chunk_stream(read_blocks())
+
+    def chunk_text(self, text: str) -> List[str]:
+        """切分一段完整文本"""
+        return list(self.chunk_stream([text]))
+
+    def chunk_stream(self, blocks: Iterable[str]) -> Iterator[str]:
+        """对文本块流进行分块"""
+        return self._pack(self._split_long(self.iter_sentences(blocks)))
+
+    def iter_sentences(self, blocks: Iterable[str]) -> Iterator[str]:
+        """从文本块流中逐句产出，句子可能跨越读取边界"""
+        buffer = ''
+        for block in blocks:
+            buffer += block
+            start = 0
+            for match in _SENTENCE_END.finditer(buffer):
+                # 匹配到缓冲区末尾时，句末标点或空白可能还没读完，留到下一次处理
+                if match.end() >= len(buffer):
+                    break
+                yield buffer[start:match.end()]
+                start = match.end()
+            buffer = buffer[start:]
+
+            # 长时间没有句子边界（如无标点的文本）时强制切出，保持缓冲区有界
+            while len(buffer) > self.read_size:
+                yield buffer[:self.read_size]
+                buffer = buffer[self.read_size:]
+        if buffer:
+            yield buffer
+
+    def _split_long(self, sentences: Iterable[str]) -> Iterator[Tuple[str, int]]:
+        """计算每句的token数，超过块大小的句子按字符比例硬切分"""
+        for sentence in sentences:
+            if not sentence.strip():
+                continue
+            tokens = self.token_counter(sentence)
+            if tokens <= self.chunk_tokens:
+                yield sentence, tokens
+                continue
+
+            piece_length = max(1, len(sentence) * self.chunk_tokens // tokens)
+            for start in range(0, len(sentence), piece_length):
+                piece = sentence[start:start + piece_length]
+                yield piece, self.token_counter(piece)
+
+    def _pack(self, sentences: Iterable[Tuple[str, int]]) -> Iterator[str]:
+        """按token数把句子组装成块，相邻块之间保留末尾若干句作为重叠"""
+        window = deque()
+        window_tokens = 0
+        new_sentences = 0
+
+        for sentence, tokens in sentences:
+            if window_tokens + tokens > self.chunk_tokens and new_sentences > 0:
+                yield ''.join(s for s, _ in window).strip()
+
+                # 从末尾保留不超过overlap_tokens的句子
+                overlap = deque()
+                overlap_tokens = 0
+                for kept, kept_tokens in reversed(window):
+                    if overlap_tokens + kept_tokens > self.overlap_tokens:
+                        break
+                    overlap.appendleft((kept, kept_tokens))
+                    overlap_tokens += kept_tokens
+                window, window_tokens = overlap, overlap_tokens
+                new_sentences = 0
+
+                # 重叠部分加上新句子仍超出时，丢弃重叠
+                while window and window_tokens + tokens > self.chunk_tokens:
+                    _, dropped_tokens = window.popleft()
+                    window_tokens -= dropped_tokens
+
+            window.append((sentence, tokens))
+            window_tokens += tokens
+            new_sentences += 1
+
+        if new_sentences > 0:
+            yield ''.join(s for s, _ in window).strip()
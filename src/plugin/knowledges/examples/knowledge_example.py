@@ -1,25 +1,27 @@
 from pymongo import MongoClient
-from ...llm.core.llm_manager import LLMManager
 from ..knowledge_manager import KnowledgeManager
 
 def main():
     # 初始化MongoDB客户端
     mongo_client = MongoClient('mongodb://localhost:27017/')
     
-    # 初始化LLM管理器
-    llm_manager = LLMManager()
+    # 创建知识库管理器（默认使用SiliconFlow）
+    knowledge_manager = KnowledgeManager(mongo_client)
     
-    # 创建知识库管理器
-    knowledge_manager = KnowledgeManager(mongo_client, llm_manager)
-    
-    # 从文件学习知识
+    # 从文件学习知识，每5秒输出一次各阶段吞吐
     print("开始学习知识...")
-    results = knowledge_manager.learn_from_files()
+    results = knowledge_manager.learn_from_files(report_interval=5.0)
     print("\n学习结果：")
     print(f"总文件数: {results['total_files']}")
     print(f"处理文件数: {results['processed_files']}")
+    print(f"未变化跳过的文件数: {results['skipped_files']}")
     print(f"总块数: {results['total_chunks']}")
     print(f"成功处理块数: {results['successful_chunks']}")
+    print(f"已写入跳过的块数: {results['skipped_chunks']}")
+    print(f"撤回的块数: {results['retracted_chunks']}")
+    print("各阶段吞吐：")
+    for stage, stats in results['throughput'].items():
+        print(f"- {stage}: {stats['processed']}块，{stats['chunks_per_sec']:.1f}块/秒")
     if results['errors']:
         print("\n错误信息：")
         for error in results['errors']:
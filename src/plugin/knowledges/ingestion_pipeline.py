@@ -0,0 +1,255 @@
+from typing import List, Dict, Any, Optional, Callable, Iterable
+import time
+import queue
+import threading
+
+# 队列结束标记
+_DONE = object()
+
+class StageCounter:
+    """单个阶段的吞吐计数器"""
+    def __init__(self, name: str):
+        self.name = name
+        self.processed = 0
+        self.errors = 0
+        self.busy_time = 0.0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        with self._lock:
+            if self.started_at is None:
+                self.started_at = time.perf_counter()
+
+    def finish(self) -> None:
+        with self._lock:
+            self.finished_at = time.perf_counter()
+
+    def record(self, count: int, elapsed: float, errors: int = 0) -> None:
+        with self._lock:
+            self.processed += count
+            self.errors += errors
+            self.busy_time += elapsed
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取当前统计：chunks/sec按阶段开始以来的墙钟时间计算"""
+        with self._lock:
+            if self.started_at is None:
+                wall_time = 0.0
+            else:
+                wall_time = (self.finished_at or time.perf_counter()) - self.started_at
+            return {
+                'processed': self.processed,
+                'errors': self.errors,
+                'chunks_per_sec': self.processed / wall_time if wall_time > 0 else 0.0,
+                'busy_time': self.busy_time
+            }
+
+class RequestRateLimiter:
+    """简单的请求速率限制：多个工作线程共享，请求之间保持最小间隔"""
+    def __init__(self, requests_per_minute: Optional[float] = None):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute else 0.0
+        self._next_time = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if self.interval <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_time - now
+            self._next_time = max(now, self._next_time) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+class IngestionPipeline:
+    """知识导入流水线：读取 -> LLM处理（有限并发） -> 批量嵌入 -> 批量写入
+
+    各阶段通过有界队列连接，下游变慢时上游自动阻塞，内存占用与队列长度成正比。
+    """
+    def __init__(self,
+                 process_fn: Callable[[Dict[str, Any]], Dict[str, Any]],
+                 embed_fn: Callable[[List[Dict[str, Any]]], List[Dict[str, Any]]],
+                 sink_fn: Callable[[List[Dict[str, Any]]], None],
+                 llm_concurrency: int = 4,
+                 requests_per_minute: Optional[float] = None,
+                 embed_batch_size: int = 32,
+                 sink_batch_size: int = 64,
+                 queue_size: int = 256,
+                 flush_interval: float = 0.5):
+        self.process_fn = process_fn
+        self.embed_fn = embed_fn
+        self.sink_fn = sink_fn
+        self.llm_concurrency = max(1, llm_concurrency)
+        self.rate_limiter = RequestRateLimiter(requests_per_minute)
+        self.embed_batch_size = max(1, embed_batch_size)
+        self.sink_batch_size = max(1, sink_batch_size)
+        self.queue_size = queue_size
+        self.flush_interval = flush_interval
+
+        self.counters = {
+            name: StageCounter(name) for name in ('reader', 'llm', 'embedding', 'sink')
+        }
+        self.errors: List[str] = []
+        self._errors_lock = threading.Lock()
+
+    def run(self,
+            items: Iterable[Dict[str, Any]],
+            report_interval: Optional[float] = None) -> Dict[str, Any]:
+        """运行流水线直到所有数据写入完成，返回各阶段统计"""
+        llm_queue = queue.Queue(maxsize=self.queue_size)
+        embed_queue = queue.Queue(maxsize=self.queue_size)
+        sink_queue = queue.Queue(maxsize=self.queue_size)
+
+        threads = [threading.Thread(target=self._reader, args=(items, llm_queue), daemon=True)]
+        threads += [
+            threading.Thread(target=self._llm_worker, args=(llm_queue, embed_queue), daemon=True)
+            for _ in range(self.llm_concurrency)
+        ]
+        threads.append(threading.Thread(target=self._embedder, args=(embed_queue, sink_queue), daemon=True))
+        threads.append(threading.Thread(target=self._sink, args=(sink_queue,), daemon=True))
+
+        for thread in threads:
+            thread.start()
+
+        # 等待写入阶段结束，期间按间隔输出实时吞吐
+        sink_thread = threads[-1]
+        while sink_thread.is_alive():
+            sink_thread.join(timeout=report_interval)
+            if report_interval and sink_thread.is_alive():
+                self._print_progress()
+        for thread in threads:
+            thread.join()
+
+        return self.get_stats()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取各阶段的实时统计，可在运行中从其他线程调用"""
+        return {
+            'stages': {name: counter.get_stats() for name, counter in self.counters.items()},
+            'errors': list(self.errors)
+        }
+
+    def _print_progress(self) -> None:
+        stages = self.get_stats()['stages']
+        print("导入进度：" + "，".join(
+            f"{name} {stats['processed']}块 ({stats['chunks_per_sec']:.1f}块/秒)"
+            for name, stats in stages.items()
+        ))
+
+    def _record_error(self, stage: str, error: Exception, count: int = 1) -> None:
+        self.counters[stage].record(0, 0.0, errors=count)
+        with self._errors_lock:
+            self.errors.append(f"{stage}阶段出错: {str(error)}")
+
+    def _reader(self, items: Iterable[Dict[str, Any]], output: queue.Queue) -> None:
+        counter = self.counters['reader']
+        counter.start()
+        try:
+            iterator = iter(items)
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                counter.record(1, time.perf_counter() - start)
+                output.put(item)
+        except Exception as e:
+            self._record_error('reader', e)
+        finally:
+            counter.finish()
+            for _ in range(self.llm_concurrency):
+                output.put(_DONE)
+
+    def _llm_worker(self, input_queue: queue.Queue, output: queue.Queue) -> None:
+        counter = self.counters['llm']
+        counter.start()
+        while True:
+            item = input_queue.get()
+            if item is _DONE:
+                break
+            self.rate_limiter.acquire()
+            start = time.perf_counter()
+            try:
+                result = self.process_fn(item)
+            except Exception as e:
+                self._record_error('llm', e)
+                continue
+            counter.record(1, time.perf_counter() - start)
+            output.put(result)
+        counter.finish()
+        output.put(_DONE)
+
+    def _embedder(self, input_queue: queue.Queue, output: queue.Queue) -> None:
+        counter = self.counters['embedding']
+        counter.start()
+        remaining_workers = self.llm_concurrency
+        batch: List[Dict[str, Any]] = []
+
+        def flush():
+            start = time.perf_counter()
+            try:
+                results = self.embed_fn(batch)
+            except Exception as e:
+                self._record_error('embedding', e, len(batch))
+                return
+            counter.record(len(batch), time.perf_counter() - start)
+            for result in results:
+                output.put(result)
+
+        while remaining_workers > 0:
+            try:
+                item = input_queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                # LLM阶段较慢时，不等凑满一批就先处理已有数据
+                if batch:
+                    flush()
+                    batch = []
+                continue
+            if item is _DONE:
+                remaining_workers -= 1
+                continue
+            batch.append(item)
+            if len(batch) >= self.embed_batch_size:
+                flush()
+                batch = []
+
+        if batch:
+            flush()
+        counter.finish()
+        output.put(_DONE)
+
+    def _sink(self, input_queue: queue.Queue) -> None:
+        counter = self.counters['sink']
+        counter.start()
+        batch: List[Dict[str, Any]] = []
+
+        def flush():
+            start = time.perf_counter()
+            try:
+                self.sink_fn(batch)
+            except Exception as e:
+                self._record_error('sink', e, len(batch))
+                return
+            counter.record(len(batch), time.perf_counter() - start)
+
+        while True:
+            try:
+                item = input_queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                if batch:
+                    flush()
+                    batch = []
+                continue
+            if item is _DONE:
+                break
+            batch.append(item)
+            if len(batch) >= self.sink_batch_size:
+                flush()
+                batch = []
+
+        if batch:
+            flush()
+        counter.finish()
@@ -1,27 +1,39 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Set
 import os
 import json
-from datetime import datetime
 from pymongo import MongoClient
-from ..memory.core.multi_source_manager import MultiSourceManager
-from ..memory.sources.knowledge_source import KnowledgeMemorySource
-from ..llm.core.llm_manager import LLMManager
+from src.memory.core.multi_source_manager import MultiSourceMemoryManager
+from src.memory.sources.knowledge_source import KnowledgeMemorySource
+from src.llm.base import BaseLLM
+from src.llm.siliconflow import SiliconFlow
+from src.llm.rate_limiter import llm_priority, PRIORITY_BATCH
+from src.utils.json_utils import extract_json
+from .ingestion_pipeline import IngestionPipeline
+from .manifest import KnowledgeManifest, chunk_hash
+from .chunker import TextChunker
 
 class KnowledgeManager:
     """知识库管理器：管理知识库的学习和检索"""
-    def __init__(self, mongo_client: MongoClient, llm_manager: LLMManager):
+    def __init__(self, mongo_client: MongoClient, llm: Optional[BaseLLM] = None):
         self.mongo_client = mongo_client
-        self.llm_manager = llm_manager
+        self.llm = llm or SiliconFlow()
         self.db = mongo_client['chatbot_db']
-        self.collection = self.db['knowledge_base']
         
-        # 初始化记忆管理器
-        self.memory_manager = MultiSourceManager()
+        # 导入清单：跳过未变化的文件，支持中断后续传
+        self.manifest = KnowledgeManifest(self.db)
+        
+        # 初始化记忆管理器，知识和记忆视图共用knowledge_base集合
         self.knowledge_source = KnowledgeMemorySource(mongo_client)
+        self.collection = self.knowledge_source.collection
+        self.memory_manager = MultiSourceMemoryManager(self.knowledge_source.encoder)
         self.memory_manager.register_source(self.knowledge_source)
         
         # 加载配置
         self.config = self._load_config()
+        self.chunker = TextChunker(
+            chunk_tokens=self.config['chunk_tokens'],
+            overlap_tokens=self.config['overlap_tokens']
+        )
         
     def _load_config(self) -> Dict[str, Any]:
         """加载知识库配置"""
@@ -35,12 +47,26 @@ class KnowledgeManager:
             'max_tokens': 2000,
             'knowledge_dir': 'data',
             'file_extensions': ['.txt'],
-            'chunk_size': 1000,
-            'overlap': 200
+            'chunk_tokens': 512,
+            'overlap_tokens': 64,
+            'ingestion': {
+                'llm_concurrency': 4,
+                'requests_per_minute': 600,
+                'embed_batch_size': 32,
+                'sink_batch_size': 64,
+                'queue_size': 256
+            }
         }
         
-    def learn_from_files(self, user_id: str = "system") -> Dict[str, Any]:
-        """从文件学习知识"""
+    def learn_from_files(self,
+                         user_id: str = "system",
+                         report_interval: Optional[float] = None) -> Dict[str, Any]:
+        """从文件学习知识
+
+        文件读取、LLM处理、向量编码和写入分阶段并行执行，report_interval不为空时按间隔输出各阶段吞吐。
+        根据导入清单增量导入：未变化的文件直接跳过，已写入的知识块不再重复处理，
+        修改或删除的文件中不再存在的知识块会被撤回。
+        """
         knowledge_dir = os.path.join(os.path.dirname(__file__), self.config['knowledge_dir'])
         if not os.path.exists(knowledge_dir):
             raise FileNotFoundError(f"知识库目录不存在: {knowledge_dir}")
@@ -48,68 +74,154 @@ class KnowledgeManager:
         results = {
             'total_files': 0,
             'processed_files': 0,
+            'skipped_files': 0,
             'total_chunks': 0,
+            'skipped_chunks': 0,
             'successful_chunks': 0,
+            'retracted_chunks': 0,
             'errors': []
         }
         
-        # 遍历知识库目录
-        for root, _, files in os.walk(knowledge_dir):
-            for file in files:
-                if any(file.endswith(ext) for ext in self.config['file_extensions']):
+        # 每个文件尚未写入的知识块数量，归零时在清单中标记完成
+        pending: Dict[str, int] = {}
+        manifest_entries = self.manifest.load_entries(user_id)
+        
+        def read_chunks():
+            existing_files = set()
+            
+            # 遍历知识库目录
+            for root, _, files in os.walk(knowledge_dir):
+                for file in files:
+                    if not any(file.endswith(ext) for ext in self.config['file_extensions']):
+                        continue
                     results['total_files'] += 1
                     file_path = os.path.join(root, file)
+                    existing_files.add(file_path)
                     
                     try:
-                        # 读取文件内容
-                        with open(file_path, 'r', encoding='utf-8') as f:
-                            content = f.read()
+                        stat = os.stat(file_path)
+                        if self.manifest.is_unchanged(manifest_entries.get(file_path), stat.st_mtime, stat.st_size):
+                            results['skipped_files'] += 1
+                            continue
                             
-                        # 分块处理
-                        chunks = self._split_content(content)
-                        results['total_chunks'] += len(chunks)
+                        # 第一遍流式分块：只计算哈希，找出尚未写入的知识块
+                        new_hashes = self._prepare_file(user_id, file_path, stat, results)
+                    except Exception as e:
+                        results['errors'].append(f"处理文件 {file} 时出错: {str(e)}")
+                        continue
                         
-                        # 处理每个块
-                        for chunk in chunks:
-                            try:
-                                # 使用LLM处理知识
-                                processed_knowledge = self._process_knowledge(chunk)
-                                
-                                # 存储到知识库
-                                self._store_knowledge(
-                                    content=processed_knowledge['content'],
-                                    metadata={
-                                        'source_file': file_path,
-                                        'category': processed_knowledge['category'],
-                                        'key_points': processed_knowledge['key_points'],
-                                        'confidence': processed_knowledge['confidence']
-                                    },
-                                    user_id=user_id
-                                )
-                                
-                                results['successful_chunks'] += 1
-                            except Exception as e:
-                                results['errors'].append(f"处理块时出错: {str(e)}")
-                                
-                        results['processed_files'] += 1
+                    results['processed_files'] += 1
+                    if not new_hashes:
+                        self.manifest.complete_file(user_id, file_path)
+                        continue
+                        
+                    # 第二遍流式分块：逐块产出需要处理的知识块，同一文件中内容相同的块只处理一次
+                    pending[file_path] = len(new_hashes)
+                    try:
+                        for chunk in self.chunker.chunk_file(file_path):
+                            hash_value = chunk_hash(chunk)
+                            if hash_value in new_hashes:
+                                new_hashes.discard(hash_value)
+                                yield {'content': chunk, 'source_file': file_path, 'chunk_hash': hash_value}
                     except Exception as e:
                         results['errors'].append(f"处理文件 {file} 时出错: {str(e)}")
                         
+            # 撤回已删除文件的知识块
+            for file_path in manifest_entries:
+                if file_path not in existing_files:
+                    results['retracted_chunks'] += self._retract_chunks(user_id, file_path)
+                    self.manifest.remove_file(user_id, file_path)
+                    
+        def store_chunks(chunks: List[Dict[str, Any]]) -> None:
+            self._store_knowledge_batch(chunks, user_id)
+            for chunk in chunks:
+                source_file = chunk['metadata']['source_file']
+                pending[source_file] -= 1
+                if pending[source_file] == 0:
+                    self.manifest.complete_file(user_id, source_file)
+                    
+        ingestion = self.config['ingestion']
+        pipeline = IngestionPipeline(
+            process_fn=self._process_chunk,
+            embed_fn=self._encode_chunks,
+            sink_fn=store_chunks,
+            llm_concurrency=ingestion['llm_concurrency'],
+            requests_per_minute=ingestion['requests_per_minute'],
+            embed_batch_size=ingestion['embed_batch_size'],
+            sink_batch_size=ingestion['sink_batch_size'],
+            queue_size=ingestion['queue_size']
+        )
+        stats = pipeline.run(read_chunks(), report_interval)
+        
+        results['successful_chunks'] = stats['stages']['sink']['processed']
+        results['errors'].extend(stats['errors'])
+        results['throughput'] = stats['stages']
+        
+        # 全局知识有变化时重建向量分片，各工作进程在下次检索时自动切换
+        knowledge_changed = results['successful_chunks'] or results['retracted_chunks']
+        shard = self.knowledge_source.shard
+        if user_id == self.knowledge_source.shard_user and shard is not None:
+            if knowledge_changed or not shard.available():
+                try:
+                    results['shard_vectors'] = self.knowledge_source.rebuild_shard()
+                except Exception as e:
+                    results['errors'].append(f"重建知识向量分片时出错: {str(e)}")
         return results
         
-    def _split_content(self, content: str) -> List[str]:
-        """将内容分割成块"""
-        chunks = []
-        chunk_size = self.config['chunk_size']
-        overlap = self.config['overlap']
-        
-        start = 0
-        while start < len(content):
-            end = min(start + chunk_size, len(content))
-            chunk = content[start:end]
-            chunks.append(chunk)
-            start = end - overlap
+    def _prepare_file(self,
+                      user_id: str,
+                      file_path: str,
+                      stat: os.stat_result,
+                      results: Dict[str, Any]) -> Set[str]:
+        """对比已写入的知识块：撤回文件中已不存在的块，返回需要处理的知识块哈希"""
+        committed = self.knowledge_source.committed_chunks(user_id, file_path)
+        
+        current = set()
+        chunk_count = 0
+        for chunk in self.chunker.chunk_file(file_path):
+            current.add(chunk_hash(chunk))
+            chunk_count += 1
             
+        stale = list(committed - current)
+        if stale:
+            results['retracted_chunks'] += self._retract_chunks(user_id, file_path, stale)
+            
+        self.manifest.begin_file(user_id, file_path, stat.st_mtime, stat.st_size, chunk_count)
+        
+        new_hashes = current - committed
+        results['total_chunks'] += chunk_count
+        results['skipped_chunks'] += len(current & committed)
+        return new_hashes
+        
+    def _retract_chunks(self,
+                        user_id: str,
+                        file_path: str,
+                        chunk_hashes: Optional[List[str]] = None) -> int:
+        """撤回来自指定文件的知识块，返回撤回数量"""
+        return self.knowledge_source.delete_source_memories(user_id, file_path, chunk_hashes)
+        
+    def _process_chunk(self, chunk: Dict[str, Any]) -> Dict[str, Any]:
+        """LLM阶段：处理单个知识块"""
+        processed_knowledge = self._process_knowledge(chunk['content'])
+        return {
+            'content': processed_knowledge['content'],
+            'metadata': {
+                'source_file': chunk['source_file'],
+                'chunk_hash': chunk['chunk_hash'],
+                'category': processed_knowledge['category'],
+                'key_points': processed_knowledge['key_points'],
+                'confidence': processed_knowledge['confidence']
+            }
+        }
+        
+    def _encode_chunks(self, chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """嵌入阶段：一次批量编码一组知识块"""
+        encodings = self.knowledge_source.encoder.encode_batch(
+            [chunk['content'] for chunk in chunks],
+            [chunk['metadata'] for chunk in chunks]
+        )
+        for chunk, encoding in zip(chunks, encodings):
+            chunk['encoding'] = encoding
         return chunks
         
     def _process_knowledge(self, content: str) -> Dict[str, Any]:
@@ -132,43 +244,36 @@ class KnowledgeManager:
     "confidence": 0.9
 }}"""
 
-        response = self.llm_manager.generate_response(
-            prompt=prompt,
-            model_name=self.config['model_name'],
-            temperature=self.config['temperature'],
-            max_tokens=self.config['max_tokens']
-        )
+        # 批量导入的优先级最低，不与实时对话争抢请求配额
+        with llm_priority(PRIORITY_BATCH):
+            response = self.llm.chat(
+                messages=[{"role": "user", "content": prompt}],
+                temperature=self.config['temperature'],
+                max_tokens=self.config['max_tokens']
+            )
         
-        try:
-            return json.loads(response)
-        except json.JSONDecodeError:
-            # 如果LLM返回的不是有效的JSON，进行简单处理
-            return {
-                'content': content,
-                'category': 'general',
-                'key_points': [],
-                'confidence': 0.5
-            }
-            
-    def _store_knowledge(self,
-                        content: str,
-                        metadata: Dict[str, Any],
-                        user_id: str) -> None:
-        """存储知识到数据库"""
-        # 存储到知识库集合
-        self.collection.insert_one({
+        # 如果LLM返回的不是有效的JSON，进行简单处理
+        knowledge = {
             'content': content,
-            'metadata': metadata,
-            'user_id': user_id,
-            'created_at': datetime.now()
-        })
-        
-        # 同时存储到记忆系统
-        self.memory_manager.add_memory(
-            content=content,
-            user_id=user_id,
-            source_name='knowledge',
-            metadata=metadata
+            'category': 'general',
+            'key_points': [],
+            'confidence': 0.5
+        }
+        if response and response.get('choices'):
+            result = extract_json(response['choices'][0]['message']['content']) or {}
+            knowledge.update({key: result[key] for key in knowledge if key in result})
+        return knowledge
+            
+    def _store_knowledge_batch(self,
+                               chunks: List[Dict[str, Any]],
+                               user_id: str) -> None:
+        """写入阶段：批量存储知识到数据库
+
+        每个知识块只写一个文档，整批一次批量写入；知识库中存在的知识块即视为已完整写入。
+        """
+        self.knowledge_source.add_memories(
+            [chunk['encoding'] for chunk in chunks],
+            user_id
         )
         
     def get_knowledge(self,
@@ -0,0 +1,70 @@
+from typing import Dict, Any, Optional
+import hashlib
+from datetime import datetime
+from pymongo.database import Database
+
+def chunk_hash(content: str) -> str:
+    """计算知识块内容的哈希"""
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+class KnowledgeManifest:
+    """知识导入清单：记录每个文件的修改时间、大小和知识块数量，用于增量和断点续传导入
+
+    知识块哈希保存在知识库文档的metadata.chunk_hash中。
+    文件的知识块全部写入后才标记为完成；未完成的文件下次导入时只处理尚未写入的知识块。
+    """
+    def __init__(self, db: Database):
+        self.collection = db['knowledge_manifest']
+        self.collection.create_index([('user_id', 1), ('source_file', 1)], unique=True)
+
+    def load_entries(self, user_id: str) -> Dict[str, Dict[str, Any]]:
+        """一次读取用户的全部清单记录：source_file -> 记录"""
+        return {
+            entry['source_file']: entry
+            for entry in self.collection.find(
+                {'user_id': user_id},
+                {'_id': 0, 'source_file': 1, 'mtime': 1, 'size': 1, 'complete': 1}
+            )
+        }
+
+    def is_unchanged(self,
+                     entry: Optional[Dict[str, Any]],
+                     mtime: float,
+                     size: int) -> bool:
+        """文件已完整导入，且修改时间和大小都没有变化"""
+        return bool(
+            entry
+            and entry.get('complete')
+            and entry.get('mtime') == mtime
+            and entry.get('size') == size
+        )
+
+    def begin_file(self,
+                   user_id: str,
+                   source_file: str,
+                   mtime: float,
+                   size: int,
+                   chunk_count: int) -> None:
+        """记录文件当前版本的知识块，标记为未完成"""
+        self.collection.update_one(
+            {'user_id': user_id, 'source_file': source_file},
+            {'$set': {
+                'mtime': mtime,
+                'size': size,
+                'chunk_count': chunk_count,
+                'complete': False,
+                'updated_at': datetime.now()
+            }},
+            upsert=True
+        )
+
+    def complete_file(self, user_id: str, source_file: str) -> None:
+        """标记文件的知识块已全部写入"""
+        self.collection.update_one(
+            {'user_id': user_id, 'source_file': source_file},
+            {'$set': {'complete': True, 'updated_at': datetime.now()}}
+        )
+
+    def remove_file(self, user_id: str, source_file: str) -> None:
+        """删除文件的清单记录"""
+        self.collection.delete_one({'user_id': user_id, 'source_file': source_file})
@@ -0,0 +1,100 @@
+from typing import List, Dict, Any
+import os
+from pymongo import MongoClient, InsertOne, UpdateOne
+from pymongo.collection import Collection
+from src.memory.core.dedup import get_duplicate_detector, to_signed64
+from src.memory.core.knowledge_shard import build_knowledge_shard
+from src.memory.sources.knowledge_source import KnowledgeMemorySource
+
+# 记忆字段：迁移时从knowledge_memories合并到knowledge_base中对应的文档
+MEMORY_FIELDS = ['embedding', 'strength', 'memory_type', 'key_points', 'relevance_score']
+
+def migrate_knowledge_storage(mongo_client: MongoClient, batch_size: int = 500) -> Dict[str, Any]:
+    """把knowledge_memories合并到knowledge_base，合并完成后删除knowledge_memories
+
+    旧版本每个知识块在两个集合中各写一份。按(user_id, content)找到知识库中对应的文档，
+    把嵌入等记忆字段写入该文档；找不到对应文档的记忆（直接通过add_memory添加的知识）
+    作为新文档写入，created_at取原记忆时间。每批一次批量写入，写入成功后删除该批旧记忆，
+    中断后重新运行会从剩余的记忆继续。
+    """
+    db = mongo_client['chatbot_db']
+    legacy = db['knowledge_memories']
+    knowledge = db['knowledge_base']
+    results = {'merged': 0, 'inserted': 0, 'unembedded': 0, 'shard_vectors': None}
+
+    if 'knowledge_memories' not in db.list_collection_names():
+        return results
+
+    batch = []
+    for memory in legacy.find({}, batch_size=batch_size):
+        batch.append(memory)
+        if len(batch) >= batch_size:
+            _migrate_batch(legacy, knowledge, batch, results)
+            batch = []
+    if batch:
+        _migrate_batch(legacy, knowledge, batch, results)
+
+    if legacy.estimated_document_count() == 0:
+        legacy.drop()
+
+    # 没有对应记忆的知识不参与检索，和迁移前一致
+    results['unembedded'] = knowledge.count_documents({'embedding': {'$exists': False}})
+
+    # 旧分片引用的是knowledge_memories中的id，需要重建
+    shard_path, shard_user, shard_dtype = KnowledgeMemorySource.shard_config()
+    if shard_path:
+        results['shard_vectors'] = build_knowledge_shard(knowledge, shard_path, shard_user, shard_dtype)
+    return results
+
+def _migrate_batch(legacy: Collection,
+                   knowledge: Collection,
+                   memories: List[Dict[str, Any]],
+                   results: Dict[str, Any]) -> None:
+    """迁移一批旧记忆"""
+    detector = get_duplicate_detector()
+
+    # 一次查询找出本批记忆在知识库中对应的、尚未合并记忆字段的文档
+    targets = {}
+    for doc in knowledge.find(
+        {
+            'user_id': {'$in': list({memory['user_id'] for memory in memories})},
+            'content': {'$in': list({memory['content'] for memory in memories})},
+            'embedding': {'$exists': False}
+        },
+        {'user_id': 1, 'content': 1}
+    ):
+        targets.setdefault((doc['user_id'], doc['content']), []).append(doc['_id'])
+
+    operations = []
+    for memory in memories:
+        fields = {field: memory[field] for field in MEMORY_FIELDS if field in memory}
+        fields['simhash'] = memory.get('simhash', to_signed64(detector.fingerprint(memory['content'])))
+        fields['occurrence_count'] = memory.get('occurrence_count', 1)
+
+        candidates = targets.get((memory['user_id'], memory['content']))
+        if candidates:
+            operations.append(UpdateOne({'_id': candidates.pop()}, {'$set': fields}))
+            results['merged'] += 1
+        else:
+            doc = {key: value for key, value in memory.items() if key != 'timestamp'}
+            doc.update(fields)
+            doc['created_at'] = memory.get('timestamp')
+            operations.append(InsertOne(doc))
+            results['inserted'] += 1
+
+    knowledge.bulk_write(operations, ordered=False)
+    legacy.delete_many({'_id': {'$in': [memory['_id'] for memory in memories]}})
+
+def main():
+    mongo_client = MongoClient(os.getenv('MONGODB_URI', 'mongodb://localhost:27017/'))
+
+    print("开始迁移知识存储...")
+    results = migrate_knowledge_storage(mongo_client)
+    print(f"合并到已有知识的记忆数: {results['merged']}")
+    print(f"新写入知识库的记忆数: {results['inserted']}")
+    print(f"没有嵌入的知识数: {results['unembedded']}")
+    if results['shard_vectors'] is not None:
+        print(f"重建向量分片: {results['shard_vectors']}条")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,3 @@
+from .chat_server import ChatServer, ChatSession, build_processor, run_server
+
+__all__ = ['ChatServer', 'ChatSession', 'build_processor', 'run_server']
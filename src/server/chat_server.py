@@ -0,0 +1,342 @@
+from typing import Dict, Any, Optional, Callable, Awaitable
+import os
+import json
+import time
+import asyncio
+import functools
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from aiohttp import web, WSMsgType
+from pymongo import MongoClient
+
+from src.llm.base import BaseLLM
+from src.llm.rate_limiter import llm_priority, PRIORITY_INTERACTIVE
+from src.config.server_config import ServerConfig
+from src.config.dialogue_config import DialogueConfig
+from src.config.emotion_config import EmotionConfig
+from src.dialogue.core.dialogue_processor import DialogueProcessor
+from src.dialogue.models.dialogue_turn import PreparedTurn
+from src.emotion import EmotionManager, EmotionAnalyzer, EmotionTicker
+from src.memory.core.memory_encoder import MemoryEncoder
+from src.memory.core.multi_source_manager import MultiSourceMemoryManager
+from src.memory.sources.conversation_source import ConversationMemorySource
+from src.memory.sources.knowledge_source import KnowledgeMemorySource
+from src.utils.tracing import get_tracer
+
+# 流式生成结束标记
+_END = object()
+# 生成失败或没有内容时的回复（与DialogueProcessor一致）
+FALLBACK_REPLY = "抱歉，我暂时无法生成回复。"
+
+class ChatSession:
+    """单个用户的会话状态：同一用户的轮次按顺序处理"""
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.lock = asyncio.Lock()
+        self.turns = 0
+        self.connections = 0
+        self.last_active = time.monotonic()
+        # 上一轮尚未完成的记忆写入：回复发出后在后台进行，下一轮开始前等待
+        self.pending: Optional[asyncio.Future] = None
+
+    @property
+    def idle(self) -> bool:
+        return self.connections == 0 and not self.lock.locked() and (self.pending is None or self.pending.done())
+
+class ChatServer:
+    """聊天服务：HTTP（普通和SSE流式）和WebSocket接口
+
+    所有连接共享同一个DialogueProcessor及其记忆、情感管理器和缓存。
+    阻塞步骤（数据库、情感分析、LLM请求）在线程池中执行，
+    嵌入模型推理在单独的固定大小线程池中执行，事件循环只负责收发消息。
+    """
+    def __init__(self,
+                 processor: DialogueProcessor,
+                 config: Optional[ServerConfig] = None,
+                 model_name: Optional[str] = None,
+                 personality_traits: Optional[Dict[str, float]] = None):
+        self.processor = processor
+        self.config = config or ServerConfig.from_env()
+        self.model_name = model_name or DialogueConfig().model_name
+        self.personality_traits = personality_traits if personality_traits is not None else \
+            getattr(processor.llm, 'personality_traits', {})
+        self.tracer = get_tracer()
+        self.sessions: Dict[str, ChatSession] = {}
+        self.executor = ThreadPoolExecutor(self.config.workers, thread_name_prefix='chat-turn')
+        self.encoder_executor = ThreadPoolExecutor(self.config.encoder_workers, thread_name_prefix='encoder')
+        for encoder in self._encoders():
+            encoder.executor = self.encoder_executor
+        self._cleanup_task: Optional[asyncio.Task] = None
+
+    def _encoders(self):
+        """记忆管理器和各记忆源使用的编码器（去重）"""
+        memory_manager = self.processor.memory_manager
+        candidates = [memory_manager.encoder] + [
+            getattr(source, 'encoder', None) for source in memory_manager.sources.values()
+        ]
+        encoders = {}
+        for encoder in candidates:
+            if isinstance(encoder, MemoryEncoder):
+                encoders[id(encoder)] = encoder
+        return list(encoders.values())
+
+    def create_app(self) -> web.Application:
+        """创建aiohttp应用"""
+        app = web.Application()
+        app.add_routes([
+            web.get('/health', self.handle_health),
+            web.post('/chat', self.handle_chat),
+            web.get('/ws', self.handle_websocket),
+            web.get('/metrics', self.handle_metrics)
+        ])
+        app.on_startup.append(self._on_startup)
+        app.on_shutdown.append(self._on_shutdown)
+        return app
+
+    def get_session(self, user_id: str) -> ChatSession:
+        session = self.sessions.get(user_id)
+        if session is None:
+            session = self.sessions[user_id] = ChatSession(user_id)
+        session.last_active = time.monotonic()
+        return session
+
+    async def run_turn(self,
+                       user_id: str,
+                       user_input: str,
+                       on_delta: Callable[[str], Awaitable[None]],
+                       transport: str = 'http') -> str:
+        """处理一轮对话：分析和检索、流式生成（每段文本调用on_delta）、后台写入记忆"""
+        session = self.get_session(user_id)
+        async with session.lock:
+            # 等待上一轮的记忆写入，保证本轮能检索到
+            if session.pending is not None:
+                await asyncio.gather(session.pending, return_exceptions=True)
+                session.pending = None
+
+            with self.tracer.span('turn', user_id=user_id, transport=transport):
+                turn = await self._run_blocking(
+                    self.processor.prepare_turn,
+                    user_id, user_input, self.personality_traits, self.model_name
+                )
+                reply = await self._stream_reply(turn, on_delta)
+            session.pending = asyncio.ensure_future(
+                self._run_blocking(self.processor.complete_turn, turn, reply)
+            )
+            session.turns += 1
+            session.last_active = time.monotonic()
+        return reply
+
+    async def _stream_reply(self,
+                            turn: PreparedTurn,
+                            on_delta: Callable[[str], Awaitable[None]]) -> str:
+        """在线程池中迭代LLM的流式输出，逐段转交给事件循环"""
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        cancelled = threading.Event()
+
+        def produce():
+            chunks = self.processor.llm.chat_stream(
+                turn.messages,
+                temperature=turn.temperature,
+                max_tokens=turn.max_tokens
+            )
+            try:
+                with llm_priority(PRIORITY_INTERACTIVE, turn.user_id):
+                    for chunk in chunks:
+                        if cancelled.is_set():
+                            break
+                        loop.call_soon_threadsafe(queue.put_nowait, chunk)
+            finally:
+                chunks.close()
+                loop.call_soon_threadsafe(queue.put_nowait, _END)
+
+        producer = self._run_blocking(produce)
+        parts = []
+        try:
+            while True:
+                chunk = await queue.get()
+                if chunk is _END:
+                    break
+                parts.append(chunk)
+                await on_delta(chunk)
+        except BaseException:
+            # 客户端断开等情况：通知生成线程停止
+            cancelled.set()
+            raise
+        await producer
+
+        reply = ''.join(parts)
+        if not reply:
+            reply = FALLBACK_REPLY
+            await on_delta(reply)
+        return reply
+
+    def _run_blocking(self, func: Callable, *args) -> Awaitable:
+        """在线程池中执行阻塞函数，并带上当前上下文（追踪span等）"""
+        context = contextvars.copy_context()
+        return asyncio.get_running_loop().run_in_executor(
+            self.executor, functools.partial(context.run, func, *args)
+        )
+
+    def _parse_message(self, data: Any) -> str:
+        """校验消息内容，不合法时抛出ValueError"""
+        message = data.get('message') if isinstance(data, dict) else None
+        if not isinstance(message, str) or not message.strip():
+            raise ValueError("message不能为空")
+        if len(message) > self.config.max_message_chars:
+            raise ValueError(f"message超过{self.config.max_message_chars}个字符")
+        return message.strip()
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return web.json_response({'status': 'ok', 'sessions': len(self.sessions)})
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        """Prometheus文本格式的指标（需开启追踪）"""
+        return web.Response(text=self.tracer.export_prometheus(), content_type='text/plain')
+
+    async def handle_chat(self, request: web.Request) -> web.StreamResponse:
+        """POST /chat {"user_id", "message", "stream"}：stream为true时以SSE逐段返回"""
+        try:
+            data = await request.json()
+            user_id = data.get('user_id') if isinstance(data, dict) else None
+            if not isinstance(user_id, str) or not user_id:
+                raise ValueError("user_id不能为空")
+            message = self._parse_message(data)
+        except (json.JSONDecodeError, ValueError) as e:
+            return web.json_response({'error': str(e)}, status=400)
+
+        if not data.get('stream'):
+            async def ignore(chunk: str) -> None:
+                pass
+            try:
+                reply = await self.run_turn(user_id, message, ignore)
+            except Exception as e:
+                return web.json_response({'error': str(e)}, status=502)
+            return web.json_response({'reply': reply})
+
+        response = web.StreamResponse(headers={
+            'Content-Type': 'text/event-stream',
+            'Cache-Control': 'no-cache'
+        })
+        await response.prepare(request)
+
+        async def send_delta(chunk: str) -> None:
+            await self._send_event(response, {'delta': chunk})
+
+        try:
+            reply = await self.run_turn(user_id, message, send_delta, transport='sse')
+            await self._send_event(response, {'done': True, 'reply': reply})
+        except ConnectionResetError:
+            return response
+        except Exception as e:
+            await self._send_event(response, {'error': str(e)})
+        await response.write_eof()
+        return response
+
+    async def _send_event(self, response: web.StreamResponse, payload: Dict[str, Any]) -> None:
+        await response.write(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode('utf-8'))
+
+    async def handle_websocket(self, request: web.Request) -> web.WebSocketResponse:
+        """GET /ws?user_id=...：每条消息为{"message": ...}或纯文本，
+        回复依次为{"type": "delta", "content"}和{"type": "done", "reply"}"""
+        user_id = request.query.get('user_id')
+        if not user_id:
+            return web.json_response({'error': "user_id不能为空"}, status=400)
+
+        ws = web.WebSocketResponse(heartbeat=30)
+        await ws.prepare(request)
+        session = self.get_session(user_id)
+        session.connections += 1
+
+        async def send_delta(chunk: str) -> None:
+            await ws.send_json({'type': 'delta', 'content': chunk})
+
+        try:
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    continue
+                try:
+                    try:
+                        data = json.loads(msg.data)
+                    except json.JSONDecodeError:
+                        data = {'message': msg.data}
+                    if not isinstance(data, dict):
+                        data = {'message': msg.data}
+                    message = self._parse_message(data)
+                except ValueError as e:
+                    await ws.send_json({'type': 'error', 'message': str(e)})
+                    continue
+
+                try:
+                    reply = await self.run_turn(user_id, message, send_delta, transport='websocket')
+                    await ws.send_json({'type': 'done', 'reply': reply})
+                except ConnectionResetError:
+                    break
+                except Exception as e:
+                    await ws.send_json({'type': 'error', 'message': str(e)})
+        finally:
+            session.connections -= 1
+            session.last_active = time.monotonic()
+        return ws
+
+    async def _on_startup(self, app: web.Application) -> None:
+        self._cleanup_task = asyncio.ensure_future(self._cleanup_sessions())
+
+    async def _on_shutdown(self, app: web.Application) -> None:
+        if self._cleanup_task is not None:
+            self._cleanup_task.cancel()
+        # 等待尚未完成的记忆写入
+        pending = [session.pending for session in self.sessions.values() if session.pending is not None]
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        self.executor.shutdown(wait=False)
+        self.encoder_executor.shutdown(wait=False)
+
+    async def _cleanup_sessions(self) -> None:
+        """定期释放空闲的会话"""
+        interval = max(1.0, min(60.0, self.config.session_idle_timeout / 2))
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            expired = [
+                user_id for user_id, session in self.sessions.items()
+                if session.idle and now - session.last_active > self.config.session_idle_timeout
+            ]
+            for user_id in expired:
+                del self.sessions[user_id]
+
+def build_processor(llm: BaseLLM, mongo_client: Optional[MongoClient] = None) -> DialogueProcessor:
+    """组装服务共享的对话处理器：多源记忆（对话、知识库）和情感系统"""
+    mongo_client = mongo_client or MongoClient(os.getenv('MONGODB_URI', 'mongodb://localhost:27017/'))
+    encoder = MemoryEncoder()
+    memory_manager = MultiSourceMemoryManager(encoder)
+    memory_manager.register_source(ConversationMemorySource(mongo_client, encoder))
+    memory_manager.register_source(KnowledgeMemorySource(mongo_client, encoder))
+    return DialogueProcessor(
+        memory_manager=memory_manager,
+        emotion_manager=EmotionManager(EmotionConfig(), mongo_client),
+        emotion_analyzer=EmotionAnalyzer(llm=llm),
+        llm=llm
+    )
+
+def run_server(llm: BaseLLM, config: Optional[ServerConfig] = None) -> None:
+    """启动聊天服务（阻塞直到退出）"""
+    if llm is None:
+        raise ValueError("LLM模型实例不能为空")
+    config = config or ServerConfig.from_env()
+
+    # 追踪需要在创建数据库连接之前初始化，才能监听数据库命令
+    tracer = get_tracer()
+    processor = build_processor(llm)
+    emotion_ticker = EmotionTicker(processor.emotion_manager)
+    emotion_ticker.start()
+
+    server = ChatServer(processor, config)
+    print(f"\n聊天服务已启动：http://{config.host}:{config.port}（POST /chat，WebSocket /ws）")
+    try:
+        web.run_app(server.create_app(), host=config.host, port=config.port, print=None)
+    finally:
+        emotion_ticker.stop()
+        if tracer.enabled:
+            tracer.write_metrics(os.getenv('METRICS_DIR', 'logs'))
@@ -0,0 +1,21 @@
+from .analysis_cache import AnalysisCache, get_analysis_cache
+from .json_utils import extract_json
+from .label_log import log_analysis_label, load_analysis_labels
+from .keyword_automaton import KeywordAutomaton, get_keyword_automaton, reload_keyword_automaton
+from .tokens import count_tokens, estimate_tokens
+from .tracing import Tracer, get_tracer
+
+__all__ = [
+    'AnalysisCache',
+    'get_analysis_cache',
+    'KeywordAutomaton',
+    'get_keyword_automaton',
+    'reload_keyword_automaton',
+    'extract_json',
+    'log_analysis_label',
+    'load_analysis_labels',
+    'count_tokens',
+    'estimate_tokens',
+    'Tracer',
+    'get_tracer'
+]
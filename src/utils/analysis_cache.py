@@ -0,0 +1,199 @@
+from typing import Dict, Any, Callable, Optional
+import os
+import re
+import time
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from .tracing import get_tracer
+
+class _InFlight:
+    """正在进行中的计算：供相同请求的并发调用者共享结果"""
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+class AnalysisCache:
+    """分析结果缓存：对分析器的LLM调用做精确匹配记忆化"""
+    def __init__(self,
+                 max_entries: int = 1000,
+                 max_bytes: int = 16 * 1024 * 1024,
+                 ttl: float = 3600,
+                 enabled: bool = True):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.enabled = enabled
+        self.tracer = get_tracer()
+
+        # key -> (过期时间, 估算大小, 结果)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._inflight: Dict[str, _InFlight] = {}
+        self._lock = threading.Lock()
+        self._total_bytes = 0
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'shared': 0,
+            'evictions': 0,
+            'expirations': 0
+        }
+
+    @staticmethod
+    def normalize_text(text: str) -> str:
+        """归一化输入文本：统一全半角、大小写并压缩空白"""
+        text = unicodedata.normalize('NFKC', text or '')
+        return re.sub(r'\s+', ' ', text).strip().lower()
+
+    def make_key(self,
+                 analyzer: str,
+                 prompt_version: str,
+                 text: str,
+                 bucket: str = '') -> str:
+        """生成缓存键：(分析器, 提示词版本, 归一化输入, 行为分桶)的哈希"""
+        raw = '\x1f'.join([analyzer, prompt_version, self.normalize_text(text), bucket])
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        """读取缓存结果，未命中或已过期返回None"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            return self._get_locked(key)
+
+    def put(self, key: str, value: Any) -> None:
+        """写入缓存结果"""
+        if not self.enabled or value is None:
+            return
+        with self._lock:
+            self._put_locked(key, value)
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any]) -> Any:
+        """读取缓存，未命中时计算；相同键的并发请求只计算一次
+
+        compute返回None表示结果不可缓存（例如LLM调用失败），此时不写入缓存。
+        """
+        if not self.enabled:
+            return compute()
+
+        with self.tracer.span('cache.lookup') as span, self._lock:
+            value = self._get_locked(key)
+            if value is not None:
+                span.set(result='hit')
+                self.tracer.count('cache_lookups_total', result='hit')
+                return value
+
+            inflight = self._inflight.get(key)
+            is_leader = inflight is None
+            if is_leader:
+                inflight = _InFlight()
+                self._inflight[key] = inflight
+            else:
+                self._stats['shared'] += 1
+            result = 'miss' if is_leader else 'shared'
+            span.set(result=result)
+            self.tracer.count('cache_lookups_total', result=result)
+
+        if not is_leader:
+            # 等待正在进行的相同请求
+            inflight.event.wait()
+            if inflight.error is not None:
+                raise inflight.error
+            return inflight.result
+
+        try:
+            inflight.result = compute()
+        except BaseException as e:
+            inflight.error = e
+            raise
+        finally:
+            with self._lock:
+                if inflight.error is None and inflight.result is not None:
+                    self._put_locked(key, inflight.result)
+                self._inflight.pop(key, None)
+            inflight.event.set()
+
+        return inflight.result
+
+    def invalidate(self, key: Optional[str] = None) -> None:
+        """清除指定键或全部缓存"""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+                self._total_bytes = 0
+            elif key in self._entries:
+                self._remove_locked(key)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return {
+                **self._stats,
+                'entries': len(self._entries),
+                'bytes': self._total_bytes,
+                'hit_rate': self._stats['hits'] / lookups if lookups else 0.0
+            }
+
+    def _get_locked(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self._stats['misses'] += 1
+            return None
+
+        expires_at, _, value = entry
+        if expires_at < time.monotonic():
+            self._remove_locked(key)
+            self._stats['expirations'] += 1
+            self._stats['misses'] += 1
+            return None
+
+        # LRU：命中后移到末尾
+        self._entries.move_to_end(key)
+        self._stats['hits'] += 1
+        return value
+
+    def _put_locked(self, key: str, value: Any) -> None:
+        size = self._estimate_size(value)
+        if size > self.max_bytes:
+            return
+
+        if key in self._entries:
+            self._remove_locked(key)
+
+        self._entries[key] = (time.monotonic() + self.ttl, size, value)
+        self._total_bytes += size
+
+        # 按条目数和字节数淘汰最久未使用的结果
+        while self._entries and (len(self._entries) > self.max_entries
+                                 or self._total_bytes > self.max_bytes):
+            oldest = next(iter(self._entries))
+            self._remove_locked(oldest)
+            self._stats['evictions'] += 1
+
+    def _remove_locked(self, key: str) -> None:
+        _, size, _ = self._entries.pop(key)
+        self._total_bytes -= size
+
+    def _estimate_size(self, value: Any) -> int:
+        """估算结果占用的字节数"""
+        return len(repr(value).encode('utf-8'))
+
+_default_cache: Optional[AnalysisCache] = None
+_default_cache_lock = threading.Lock()
+
+def get_analysis_cache() -> AnalysisCache:
+    """获取进程内共享的分析结果缓存（按环境变量配置）"""
+    global _default_cache
+    if _default_cache is None:
+        with _default_cache_lock:
+            if _default_cache is None:
+                _default_cache = AnalysisCache(
+                    max_entries=int(os.getenv('MAX_CACHE_ENTRIES', '1000')),
+                    max_bytes=int(os.getenv('MAX_CACHE_BYTES', str(16 * 1024 * 1024))),
+                    ttl=float(os.getenv('CACHE_EXPIRATION', '3600')),
+                    enabled=os.getenv('ENABLE_CACHE', 'true').lower() == 'true'
+                )
+    return _default_cache
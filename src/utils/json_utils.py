@@ -0,0 +1,60 @@
+from typing import Dict, Any, Optional
+import re
+import json
+
+_CODE_FENCE = re.compile(r'```(?:json)?\s*(.*?)```', re.DOTALL | re.IGNORECASE)
+_TRAILING_COMMA = re.compile(r',\s*([}\]])')
+
+def extract_json(text: str) -> Optional[Dict[str, Any]]:
+    """从LLM回复中提取JSON对象
+
+    兼容代码块包裹、前后附带说明文字、尾随逗号等常见情况，无法解析时返回None。
+    """
+    if not text:
+        return None
+
+    candidates = [text]
+    fenced = _CODE_FENCE.search(text)
+    if fenced:
+        candidates.insert(0, fenced.group(1))
+
+    for candidate in candidates:
+        obj = _find_object(candidate)
+        if obj is None:
+            continue
+        for attempt in (obj, _TRAILING_COMMA.sub(r'\1', obj)):
+            try:
+                result = json.loads(attempt)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(result, dict):
+                return result
+    return None
+
+def _find_object(text: str) -> Optional[str]:
+    """找到第一个括号配对完整的JSON对象文本"""
+    start = text.find('{')
+    while start != -1:
+        depth = 0
+        in_string = False
+        escaped = False
+        for index in range(start, len(text)):
+            char = text[index]
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif char == '\\':
+                    escaped = True
+                elif char == '"':
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            elif char == '{':
+                depth += 1
+            elif char == '}':
+                depth -= 1
+                if depth == 0:
+                    return text[start:index + 1]
+        # 括号不完整（例如回复被max_tokens截断），尝试下一个起点
+        start = text.find('{', start + 1)
+    return None
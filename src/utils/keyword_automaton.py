@@ -0,0 +1,153 @@
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+import threading
+from collections import deque
+from config.emotion_config import EMOTION_STATES
+from config.memory_config import IMPORTANCE_KEYWORDS, KEY_POINT_KEYWORDS
+
+class KeywordAutomaton:
+    """关键词自动机：基于Aho-Corasick算法，一次扫描统计所有类别的关键词命中"""
+    def __init__(self, keyword_sets: Dict[str, Iterable[str]]):
+        self.categories: List[str] = list(keyword_sets.keys())
+        self.keywords: List[str] = []
+        self.keyword_categories: List[Tuple[str, ...]] = []
+
+        # 同一个关键词可能属于多个类别
+        keyword_index: Dict[str, int] = {}
+        categories_of: List[List[str]] = []
+        for category, keywords in keyword_sets.items():
+            for keyword in keywords:
+                if not keyword:
+                    continue
+                if keyword not in keyword_index:
+                    keyword_index[keyword] = len(self.keywords)
+                    self.keywords.append(keyword)
+                    categories_of.append([])
+                if category not in categories_of[keyword_index[keyword]]:
+                    categories_of[keyword_index[keyword]].append(category)
+        self.keyword_categories = [tuple(c) for c in categories_of]
+
+        self._build()
+
+    def _build(self) -> None:
+        """构建字典树和失败指针"""
+        self._goto: List[Dict[str, int]] = [{}]
+        self._output: List[List[int]] = [[]]
+
+        for keyword_id, keyword in enumerate(self.keywords):
+            node = 0
+            for char in keyword:
+                next_node = self._goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto[node][char] = next_node
+                    self._goto.append({})
+                    self._output.append([])
+                node = next_node
+            self._output[node].append(keyword_id)
+
+        # 广度优先计算失败指针，并合并后缀节点的输出
+        self._fail = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                if self._fail[child] == child:
+                    self._fail[child] = 0
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int]]:
+        """扫描文本，依次产出(结束位置, 关键词编号)"""
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        node = 0
+
+        for position, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for keyword_id in output[node]:
+                yield position, keyword_id
+
+    def scan(self, text: str) -> Dict[str, Set[str]]:
+        """一次扫描返回各类别命中的关键词集合"""
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        node = 0
+        seen: Set[int] = set()
+
+        # 热路径：内联状态转移，避免生成器开销
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if output[node]:
+                seen.update(output[node])
+
+        matches: Dict[str, Set[str]] = {category: set() for category in self.categories}
+        for keyword_id in seen:
+            keyword = self.keywords[keyword_id]
+            for category in self.keyword_categories[keyword_id]:
+                matches[category].add(keyword)
+
+        return matches
+
+    def count(self, text: str) -> Dict[str, int]:
+        """一次扫描返回各类别命中的不同关键词数量"""
+        return {category: len(keywords) for category, keywords in self.scan(text).items()}
+
+    def has_any(self, text: str, category: str) -> bool:
+        """判断文本是否包含指定类别的任一关键词"""
+        for _, keyword_id in self.iter_matches(text):
+            if category in self.keyword_categories[keyword_id]:
+                return True
+        return False
+
+def build_keyword_sets() -> Dict[str, List[str]]:
+    """汇总所有配置中的关键词集合"""
+    keyword_sets = {
+        f'emotion.{state}': config['keywords']
+        for state, config in EMOTION_STATES.items()
+    }
+    keyword_sets['importance'] = IMPORTANCE_KEYWORDS
+    keyword_sets['key_point'] = KEY_POINT_KEYWORDS
+    return keyword_sets
+
+def _config_signature(keyword_sets: Dict[str, List[str]]) -> Tuple:
+    """配置签名：只比较列表身份和长度，开销与关键词数量无关"""
+    return tuple(
+        (category, id(keywords), len(keywords))
+        for category, keywords in keyword_sets.items()
+    )
+
+_automaton: Optional[KeywordAutomaton] = None
+_signature: Optional[Tuple] = None
+_automaton_lock = threading.Lock()
+
+def get_keyword_automaton() -> KeywordAutomaton:
+    """获取共享的关键词自动机，配置变化时自动重建"""
+    global _automaton, _signature
+    keyword_sets = build_keyword_sets()
+    signature = _config_signature(keyword_sets)
+
+    if _automaton is None or signature != _signature:
+        with _automaton_lock:
+            if _automaton is None or signature != _signature:
+                _automaton = KeywordAutomaton(keyword_sets)
+                _signature = signature
+    return _automaton
+
+def reload_keyword_automaton() -> KeywordAutomaton:
+    """强制重建关键词自动机（例如原地修改了关键词列表之后）"""
+    global _automaton, _signature
+    keyword_sets = build_keyword_sets()
+    with _automaton_lock:
+        _automaton = KeywordAutomaton(keyword_sets)
+        _signature = _config_signature(keyword_sets)
+    return _automaton
@@ -0,0 +1,40 @@
+from typing import List, Dict, Any
+import os
+import json
+import threading
+from datetime import datetime
+
+_label_log_lock = threading.Lock()
+
+def log_analysis_label(task: str, text: str, label: str, **extra: Any) -> None:
+    """记录LLM给出的分析标签，供分类器微调和离线评估使用
+
+    日志路径由环境变量ANALYSIS_LABEL_LOG指定，未配置时不记录。
+    """
+    path = os.getenv('ANALYSIS_LABEL_LOG')
+    if not path:
+        return
+
+    record = {
+        'task': task,
+        'text': text,
+        'label': label,
+        'timestamp': datetime.now().isoformat(),
+        **extra
+    }
+    with _label_log_lock:
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+def load_analysis_labels(path: str, task: str) -> List[Dict[str, Any]]:
+    """读取指定任务的LLM标签日志"""
+    records = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if record.get('task') == task:
+                records.append(record)
+    return records
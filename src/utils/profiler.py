@@ -0,0 +1,257 @@
+from typing import List, Dict, Any, Optional
+import os
+import sys
+import time
+import signal
+import threading
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+# tracemalloc记录的调用栈深度
+TRACEMALLOC_FRAMES = 25
+# 分配统计摘要中列出的条目数
+TOP_ALLOCATIONS = 30
+
+class StackSampler:
+    """采样线程：按固定间隔读取目标线程的调用栈，按折叠栈格式计数
+
+    折叠栈每行为“根;...;叶 次数”，可直接用flamegraph.pl或speedscope生成火焰图。
+    采样在独立线程中进行，被测线程执行C扩展（如torch）时看到的是调用它的Python栈。
+    """
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts: Counter = Counter()
+        self.samples = 0
+        self._names: Dict[Any, str] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> 'StackSampler':
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self.counts
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            self.counts[self._collapse(frame)] += 1
+            self.samples += 1
+
+    def _collapse(self, frame) -> str:
+        names: List[str] = []
+        while frame is not None:
+            code = frame.f_code
+            name = self._names.get(code)
+            if name is None:
+                name = self._names[code] = _frame_name(code.co_name, code.co_filename, code.co_firstlineno)
+            names.append(name)
+            frame = frame.f_back
+        names.reverse()
+        return ';'.join(names)
+
+def _frame_name(function: str, filename: str, lineno: int) -> str:
+    """折叠栈中的帧名：函数名(文件名:行号)，去掉折叠格式的分隔符"""
+    name = f"{function} ({os.path.basename(filename)}:{lineno})"
+    return name.replace(';', ':')
+
+class TurnProfiler:
+    """按轮次的性能剖析：CPU采样和tracemalloc分配快照
+
+    两种触发方式：arm(n)剖析接下来的n轮；slow_turn_ms大于0时每轮都采样，
+    只保留耗时超过阈值的轮次。结果写入output_dir：
+    *.cpu.folded（CPU折叠栈）、*.alloc.folded（按分配栈汇总的新增字节数）、*.alloc.txt（分配最多的位置）。
+    未开启时turn()只做一次判断；可通过信号在运行中开关（见install_signal_handlers）。
+    """
+    def __init__(self,
+                 output_dir: str = 'logs',
+                 interval: float = 0.005,
+                 slow_turn_ms: float = 0.0,
+                 memory: bool = False,
+                 signal_turns: int = 5,
+                 default_slow_turn_ms: float = 2000.0):
+        self.output_dir = output_dir
+        self.interval = interval
+        self.slow_turn_ms = slow_turn_ms
+        self.memory = memory
+        self.signal_turns = signal_turns
+        self.default_slow_turn_ms = default_slow_turn_ms
+        self._armed_turns = 0
+        self._sequence = 0
+        # 同时进行分配剖析的轮次数：tracemalloc是进程级的，最后一个结束时才停止
+        self._memory_turns = 0
+        self._owns_tracemalloc = False
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def active(self) -> bool:
+        return self._armed_turns > 0 or self.slow_turn_ms > 0
+
+    def arm(self, turns: int) -> None:
+        """剖析接下来的turns轮"""
+        with self._lock:
+            self._armed_turns = max(0, turns)
+
+    def set_slow_threshold(self, slow_turn_ms: float) -> None:
+        """设置慢轮次阈值（毫秒），0为关闭"""
+        self.slow_turn_ms = max(0.0, slow_turn_ms)
+
+    def toggle_slow_mode(self) -> bool:
+        """开关慢轮次剖析，返回切换后是否开启"""
+        if self.slow_turn_ms > 0:
+            self.slow_turn_ms = 0.0
+        else:
+            self.slow_turn_ms = self.default_slow_turn_ms
+        return self.slow_turn_ms > 0
+
+    @contextmanager
+    def turn(self, label: str = 'turn'):
+        """剖析一轮对话；嵌套调用（同一线程内）只在最外层剖析"""
+        if not self.active or getattr(self._local, 'profiling', False):
+            yield
+            return
+
+        with self._lock:
+            armed = self._armed_turns > 0
+            if armed:
+                self._armed_turns -= 1
+        slow_turn_ms = self.slow_turn_ms
+
+        self._local.profiling = True
+        sampler = StackSampler(threading.get_ident(), self.interval).start()
+        memory = self.memory
+        snapshot_before = None
+        if memory:
+            self._acquire_tracemalloc()
+            snapshot_before = tracemalloc.take_snapshot()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            counts = sampler.stop()
+            snapshot_after = None
+            if memory:
+                snapshot_after = tracemalloc.take_snapshot()
+                self._release_tracemalloc()
+            self._local.profiling = False
+
+            if armed or (slow_turn_ms > 0 and elapsed_ms >= slow_turn_ms):
+                try:
+                    self._write(label, elapsed_ms, sampler.samples, counts, snapshot_before, snapshot_after)
+                except OSError as e:
+                    print(f"写入性能剖析结果失败: {str(e)}")
+
+    def _acquire_tracemalloc(self) -> None:
+        with self._lock:
+            if self._memory_turns == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+                self._owns_tracemalloc = True
+            self._memory_turns += 1
+
+    def _release_tracemalloc(self) -> None:
+        with self._lock:
+            self._memory_turns -= 1
+            if self._memory_turns == 0 and self._owns_tracemalloc:
+                tracemalloc.stop()
+                self._owns_tracemalloc = False
+
+    def install_signal_handlers(self) -> bool:
+        """注册信号：SIGUSR1剖析接下来的signal_turns轮，SIGUSR2开关慢轮次剖析
+
+        只能在主线程调用；不支持这些信号的平台（Windows）返回False。
+        """
+        if not hasattr(signal, 'SIGUSR1') or threading.current_thread() is not threading.main_thread():
+            return False
+
+        def arm_handler(signum, frame):
+            self.arm(self.signal_turns)
+            print(f"\n已开启性能剖析：接下来{self.signal_turns}轮")
+
+        def slow_handler(signum, frame):
+            enabled = self.toggle_slow_mode()
+            state = f"已开启（阈值{self.slow_turn_ms:.0f}ms）" if enabled else "已关闭"
+            print(f"\n慢轮次性能剖析{state}")
+
+        signal.signal(signal.SIGUSR1, arm_handler)
+        signal.signal(signal.SIGUSR2, slow_handler)
+        return True
+
+    def _write(self,
+               label: str,
+               elapsed_ms: float,
+               samples: int,
+               counts: Counter,
+               snapshot_before: Optional[tracemalloc.Snapshot],
+               snapshot_after: Optional[tracemalloc.Snapshot]) -> None:
+        with self._lock:
+            self._sequence += 1
+            sequence = self._sequence
+        os.makedirs(self.output_dir, exist_ok=True)
+        prefix = os.path.join(
+            self.output_dir,
+            f"profile-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{sequence}-{label}-{elapsed_ms:.0f}ms"
+        )
+
+        with open(f"{prefix}.cpu.folded", 'w', encoding='utf-8') as f:
+            for stack, count in counts.most_common():
+                f.write(f"{stack} {count}\n")
+
+        if snapshot_before is not None and snapshot_after is not None:
+            # 只统计剖析期间新增的分配，排除tracemalloc和采样线程自身
+            filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+            diff = snapshot_after.filter_traces(filters).compare_to(
+                snapshot_before.filter_traces(filters), 'traceback'
+            )
+            with open(f"{prefix}.alloc.folded", 'w', encoding='utf-8') as f:
+                for stat in diff:
+                    if stat.size_diff <= 0:
+                        continue
+                    stack = ';'.join(
+                        f"{os.path.basename(frame.filename)}:{frame.lineno}".replace(';', ':')
+                        for frame in reversed(stat.traceback)
+                    )
+                    f.write(f"{stack} {stat.size_diff}\n")
+
+            with open(f"{prefix}.alloc.txt", 'w', encoding='utf-8') as f:
+                total = sum(stat.size_diff for stat in diff)
+                f.write(f"轮次耗时: {elapsed_ms:.1f}ms，新增分配: {total / 1024:.1f}KiB\n\n")
+                by_line = snapshot_after.filter_traces(filters).compare_to(
+                    snapshot_before.filter_traces(filters), 'lineno'
+                )
+                for stat in by_line[:TOP_ALLOCATIONS]:
+                    f.write(f"{stat}\n")
+
+        print(f"\n性能剖析已写入 {prefix}.*（{elapsed_ms:.0f}ms，{samples}个采样）")
+
+_profiler: Optional[TurnProfiler] = None
+_profiler_lock = threading.Lock()
+
+def get_turn_profiler() -> TurnProfiler:
+    """获取进程内共享的轮次剖析器（按环境变量配置）"""
+    global _profiler
+    if _profiler is None:
+        with _profiler_lock:
+            if _profiler is None:
+                profiler = TurnProfiler(
+                    output_dir=os.getenv('PROFILE_DIR', 'logs'),
+                    interval=float(os.getenv('PROFILE_INTERVAL_MS', '5')) / 1000,
+                    slow_turn_ms=float(os.getenv('PROFILE_SLOW_TURN_MS', '0')),
+                    memory=os.getenv('PROFILE_MEMORY', 'false').lower() == 'true',
+                    signal_turns=int(os.getenv('PROFILE_SIGNAL_TURNS', '5')),
+                    default_slow_turn_ms=float(os.getenv('PROFILE_DEFAULT_SLOW_TURN_MS', '2000'))
+                )
+                profiler.arm(int(os.getenv('PROFILE_TURNS', '0')))
+                _profiler = profiler
+    return _profiler
@@ -0,0 +1,26 @@
+from functools import lru_cache
+import re
+
+# 中日韩字符大致每个字一个token
+_CJK = re.compile(r'[　-〿㐀-䶿一-鿿豈-﫿＀-￯]')
+
+@lru_cache(maxsize=1)
+def _get_encoding():
+    """加载tiktoken编码器，不可用时（未安装或无法下载词表）返回None"""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding('cl100k_base')
+    except Exception:
+        return None
+
+def estimate_tokens(text: str) -> int:
+    """估算token数：中日韩字符每字约1个token，其他字符约4个字符1个token"""
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+def count_tokens(text: str) -> int:
+    """计算文本的token数，tiktoken不可用时使用估算值"""
+    encoding = _get_encoding()
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
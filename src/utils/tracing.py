@@ -0,0 +1,333 @@
+from typing import List, Dict, Any, Optional, Tuple
+import os
+import json
+import time
+import bisect
+import threading
+from collections import deque
+from contextvars import ContextVar
+from pymongo import monitoring
+
+# 耗时直方图的桶上界（秒），覆盖缓存查询到LLM生成的范围
+DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# 单个span最多保留的子span数，超出的只计数（如整合记忆时的大量数据库调用）
+MAX_CHILDREN = 256
+# 导出指标的名称前缀
+METRIC_PREFIX = 'chatbot_'
+
+_current_span: ContextVar[Optional['Span']] = ContextVar('current_span', default=None)
+
+class Span:
+    """一次计时区间：嵌套的span组成每轮对话的调用树"""
+    __slots__ = ('tracer', 'name', 'attributes', 'children', 'dropped_children',
+                 'parent', 'start', 'duration', '_token')
+
+    def __init__(self, tracer: 'Tracer', name: str, attributes: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.children: List['Span'] = []
+        self.dropped_children = 0
+        self.parent: Optional['Span'] = None
+        self.start = 0.0
+        self.duration: Optional[float] = None
+        self._token = None
+
+    def set(self, **attributes: Any) -> 'Span':
+        """附加属性（如token数、缓存是否命中）"""
+        self.attributes.update(attributes)
+        return self
+
+    def __enter__(self) -> 'Span':
+        self.parent = _current_span.get()
+        if self.parent is not None:
+            self.parent._add_child(self)
+        self._token = _current_span.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.duration = time.perf_counter() - self.start
+        _current_span.reset(self._token)
+        if exc_type is not None:
+            self.attributes['error'] = exc_type.__name__
+        self.tracer._finish(self)
+
+    def _add_child(self, child: 'Span') -> None:
+        if len(self.children) < MAX_CHILDREN:
+            self.children.append(child)
+        else:
+            self.dropped_children += 1
+
+    def to_dict(self, origin: Optional[float] = None) -> Dict[str, Any]:
+        """转换为字典，start_ms为相对根span开始的偏移"""
+        origin = self.start if origin is None else origin
+        result = {
+            'name': self.name,
+            'start_ms': round((self.start - origin) * 1000, 3),
+            'duration_ms': round((self.duration or 0.0) * 1000, 3),
+            'attributes': self.attributes,
+            'children': [child.to_dict(origin) for child in self.children]
+        }
+        if self.dropped_children:
+            result['dropped_children'] = self.dropped_children
+        return result
+
+class _NoopSpan:
+    """关闭追踪时使用的空span，所有调用都直接返回"""
+    __slots__ = ()
+
+    def set(self, **attributes: Any) -> '_NoopSpan':
+        return self
+
+    def __enter__(self) -> '_NoopSpan':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        pass
+
+_NOOP_SPAN = _NoopSpan()
+
+class Histogram:
+    """累积桶直方图（与Prometheus的histogram语义一致）"""
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: Tuple[float, ...] = DURATION_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """各桶上界及小于等于该上界的观测数，最后一项为+Inf"""
+        result = []
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            result.append(('+Inf' if bound == float('inf') else repr(bound), total))
+        return result
+
+    def quantile(self, q: float) -> float:
+        """按桶线性插值估算分位数（q取0-1）"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for bound, count in zip(self.buckets, self.counts):
+            if seen + count >= rank and count:
+                return lower + (bound - lower) * (rank - seen) / count
+            seen += count
+            lower = bound
+        return self.buckets[-1]
+
+class Tracer:
+    """轻量追踪器：span调用树、耗时直方图和计数器
+
+    span结束时按名称记录耗时直方图；根span（通常是一轮对话）结束时保存整棵调用树，
+    trace_log不为空时逐行追加JSON。关闭时span()返回共享的空span，几乎没有开销。
+    """
+    def __init__(self,
+                 enabled: bool = False,
+                 trace_log: Optional[str] = None,
+                 max_traces: int = 100):
+        self.enabled = enabled
+        self.trace_log = trace_log
+        self._traces: deque = deque(maxlen=max_traces)
+        self._histograms: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], Histogram] = {}
+        self._counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+        self._lock = threading.Lock()
+        self._log_lock = threading.Lock()
+
+    def span(self, name: str, **attributes: Any):
+        """创建span，用作上下文管理器：with tracer.span('encode', texts=2) as span: ..."""
+        if not self.enabled:
+            return _NOOP_SPAN
+        return Span(self, name, attributes)
+
+    def current_span(self):
+        """当前上下文中的span，没有时返回空span"""
+        if not self.enabled:
+            return _NOOP_SPAN
+        return _current_span.get() or _NOOP_SPAN
+
+    def record(self, name: str, duration: float, **attributes: Any) -> None:
+        """记录已结束的区间（如数据库命令监听器给出的耗时），挂到当前span下"""
+        if not self.enabled:
+            return
+        span = Span(self, name, attributes)
+        span.parent = _current_span.get()
+        span.start = time.perf_counter() - duration
+        span.duration = duration
+        if span.parent is not None:
+            span.parent._add_child(span)
+        self._finish(span)
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        """记录一次直方图观测"""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def count(self, name: str, value: float = 1, **labels: Any) -> None:
+        """累加计数器"""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def recent_traces(self) -> List[Dict[str, Any]]:
+        """最近完成的调用树"""
+        with self._lock:
+            return list(self._traces)
+
+    def reset(self) -> None:
+        """清空已收集的调用树和指标"""
+        with self._lock:
+            self._traces.clear()
+            self._histograms.clear()
+            self._counters.clear()
+
+    def export_json(self) -> Dict[str, Any]:
+        """以JSON结构导出指标：直方图附带估算的p50/p95/p99"""
+        with self._lock:
+            return {
+                'histograms': [
+                    {
+                        'name': name,
+                        'labels': dict(labels),
+                        'count': histogram.count,
+                        'sum': histogram.sum,
+                        'p50': histogram.quantile(0.5),
+                        'p95': histogram.quantile(0.95),
+                        'p99': histogram.quantile(0.99),
+                        'buckets': dict(histogram.cumulative())
+                    }
+                    for (name, labels), histogram in sorted(self._histograms.items(), key=lambda item: item[0])
+                ],
+                'counters': [
+                    {'name': name, 'labels': dict(labels), 'value': value}
+                    for (name, labels), value in sorted(self._counters.items())
+                ]
+            }
+
+    def export_prometheus(self) -> str:
+        """以Prometheus文本格式导出指标"""
+        with self._lock:
+            histograms = [(key, histogram.cumulative(), histogram.sum, histogram.count)
+                          for key, histogram in sorted(self._histograms.items(), key=lambda item: item[0])]
+            counters = sorted(self._counters.items())
+
+        lines: List[str] = []
+        declared = set()
+        for (name, labels), cumulative, total_sum, total_count in histograms:
+            metric = METRIC_PREFIX + name
+            if metric not in declared:
+                declared.add(metric)
+                lines.append(f"# TYPE {metric} histogram")
+            for bound, total in cumulative:
+                lines.append(f"{metric}_bucket{_format_labels(labels + (('le', bound),))} {total}")
+            lines.append(f"{metric}_sum{_format_labels(labels)} {total_sum}")
+            lines.append(f"{metric}_count{_format_labels(labels)} {total_count}")
+        for (name, labels), value in counters:
+            metric = METRIC_PREFIX + name
+            if metric not in declared:
+                declared.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{_format_labels(labels)} {value}")
+        return '\n'.join(lines) + '\n'
+
+    def write_metrics(self, directory: str) -> None:
+        """将指标写入目录下的metrics.prom和metrics.json"""
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, 'metrics.prom'), 'w', encoding='utf-8') as f:
+            f.write(self.export_prometheus())
+        with open(os.path.join(directory, 'metrics.json'), 'w', encoding='utf-8') as f:
+            json.dump(self.export_json(), f, ensure_ascii=False, indent=2)
+
+    def _finish(self, span: Span) -> None:
+        self.observe('span_duration_seconds', span.duration, span=span.name)
+        if span.parent is not None:
+            return
+
+        trace = span.to_dict()
+        with self._lock:
+            self._traces.append(trace)
+        if self.trace_log:
+            line = json.dumps(trace, ensure_ascii=False, default=str)
+            with self._log_lock:
+                with open(self.trace_log, 'a', encoding='utf-8') as f:
+                    f.write(line + '\n')
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ''
+    parts = []
+    for key, value in labels:
+        # 标签值按Prometheus文本格式转义反斜杠、双引号和换行
+        value = value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{key}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+class MongoCommandTracer(monitoring.CommandListener):
+    """pymongo命令监听器：每个数据库命令记录为当前span下的mongo.<命令名>子span
+
+    监听器在发出命令的线程中同步调用，因此能取到该线程当前的span。
+    """
+    def __init__(self, tracer: Tracer):
+        self.tracer = tracer
+        self._collections: Dict[Tuple[Any, int], str] = {}
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        collection = event.command.get(event.command_name)
+        if isinstance(collection, str):
+            self._collections[(event.connection_id, event.request_id)] = collection
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        self._record(event, 'ok')
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        self._record(event, 'error')
+
+    def _record(self, event, status: str) -> None:
+        collection = self._collections.pop((event.connection_id, event.request_id), '')
+        self.tracer.record(
+            f"mongo.{event.command_name}",
+            event.duration_micros / 1e6,
+            collection=collection,
+            status=status
+        )
+
+_tracer: Optional[Tracer] = None
+_tracer_lock = threading.Lock()
+
+def get_tracer() -> Tracer:
+    """获取进程内共享的追踪器（按环境变量配置）
+
+    开启时注册pymongo全局命令监听器，只对之后创建的MongoClient生效，
+    因此应在创建数据库连接之前调用。
+    """
+    global _tracer
+    if _tracer is None:
+        with _tracer_lock:
+            if _tracer is None:
+                tracer = Tracer(
+                    enabled=os.getenv('ENABLE_TRACING', 'false').lower() == 'true',
+                    trace_log=os.getenv('TRACE_LOG') or None,
+                    max_traces=int(os.getenv('TRACE_HISTORY', '100'))
+                )
+                if tracer.enabled:
+                    monitoring.register(MongoCommandTracer(tracer))
+                _tracer = tracer
+    return _tracer